@@ -0,0 +1,36 @@
+"""use bigint message ids
+
+Revision ID: 3f1c2a9d7e41
+Revises: 6851b9dfb87b
+Create Date: 2026-10-18 09:12:40.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7e41'
+down_revision = '6851b9dfb87b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Message IDs are now snowflakes assigned by the application and
+    # no longer fit in a 32-bit INT
+    op.alter_column('messages', 'id',
+        existing_type=sa.Integer(),
+        type_=sa.BigInteger(),
+        existing_nullable=False,
+        autoincrement=True
+    )
+
+
+def downgrade():
+    op.alter_column('messages', 'id',
+        existing_type=sa.BigInteger(),
+        type_=sa.Integer(),
+        existing_nullable=False,
+        autoincrement=True
+    )
@@ -0,0 +1,26 @@
+"""add messages history index
+
+Revision ID: 9b2e5d4c1a07
+Revises: 3f1c2a9d7e41
+Create Date: 2026-10-18 10:03:17.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e5d4c1a07'
+down_revision = '3f1c2a9d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keyset pagination of room history walks this index instead of sorting
+    op.create_index('ix_messages_room_created_id', 'messages',
+        ['room_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_messages_room_created_id', table_name='messages')
@@ -0,0 +1,26 @@
+"""add chat rooms name index
+
+Revision ID: c4d81f2a6b93
+Revises: 9b2e5d4c1a07
+Create Date: 2026-10-18 15:42:08.361204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d81f2a6b93'
+down_revision = '9b2e5d4c1a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The room listing filters by name prefix and pages in (name, id) order
+    op.create_index('ix_chat_rooms_name_id', 'chat_rooms',
+        ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_chat_rooms_name_id', table_name='chat_rooms')
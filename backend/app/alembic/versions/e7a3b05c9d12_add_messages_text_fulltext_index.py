@@ -0,0 +1,31 @@
+"""add messages text fulltext index
+
+Revision ID: e7a3b05c9d12
+Revises: c4d81f2a6b93
+Create Date: 2026-10-18 19:26:51.730468
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3b05c9d12'
+down_revision = 'c4d81f2a6b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Message search matches against this index. Other databases use the
+    # in-process search backend instead.
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.create_index('ix_messages_text_fulltext', 'messages',
+        ['text'], unique=False, mysql_prefix='FULLTEXT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'mysql':
+        return
+    op.drop_index('ix_messages_text_fulltext', table_name='messages')
@@ -1,15 +1,16 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app.core.db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.db import get_async_db
 from app.core.config import settings
 from app.core.security import (
     create_access_token,
-    get_password_hash,
-    verify_password,
-    blacklist_token,
+    password_hasher,
+    revoke_token,
     get_current_user,
+    invalidate_user,
     oauth2_scheme
 )
 from app.schemas.auth import Token, UserCreate, UserResponse
@@ -18,9 +19,9 @@ from app.models import Users
 router = APIRouter(tags=["Auth"])
 
 @router.post("/register", response_model=UserResponse)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if user already exists
-    db_user = db.query(Users).filter(Users.email == user.email).first()
+    db_user = await db.scalar(select(Users).where(Users.email == user.email))
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -28,32 +29,43 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     db_user = Users(
         email=user.email,
         name=user.name,
         password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Authenticate user
-    user = db.query(Users).filter(Users.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password):
+    user = await db.scalar(select(Users).where(Users.email == form_data.username))
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await password_hasher.verify(
+            form_data.password, user.password
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Upgrade hashes made with an older cost factor
+    if new_hash and settings.PASSWORD_REHASH_ON_LOGIN:
+        user.password = new_hash
+        await db.commit()
+        invalidate_user(user.email)
+    
     # Create access token
     expires_minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES
     access_token_expires = timedelta(minutes=expires_minutes)
@@ -68,5 +80,6 @@ async def logout(
     current_user: Users = Depends(get_current_user),
     token: str = Depends(oauth2_scheme)
 ):
-    blacklist_token(token)
+    await revoke_token(token)
+    invalidate_user(current_user.email)
     return {"detail": "Successfully logged out"}
\ No newline at end of file
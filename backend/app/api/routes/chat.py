@@ -1,66 +1,168 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+import json
+import math
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.db import get_db
-from app.core.security import get_current_user
+from app.api.routes.websocket import manager, message_batch_event, message_event
+from app.core.archive import message_archive
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.core.export import CONTENT_TYPES, export_messages, gzip_stream
+from app.core.history import (
+    history_query,
+    message_key,
+    message_to_dict,
+    oldest_message_key,
+    recent_messages,
+    warm_room
+)
+from app.core.ingest import message_writer
+from app.core.ratelimit import batch_rate_wait, message_rate_wait
+from app.core.rooms import etag_matches, invalidate_room_listing, load_room_listing
+from app.core.search import SCORE_SCALE, query_terms, search_backend
+from app.core.security import (
+    get_current_user,
+    invalidate_membership,
+    invalidate_room,
+    is_room_member,
+    room_exists
+)
 from app.models import ChatRooms, Messages, Users, RoomUsers
 from app.schemas.chat import (
     ChatRoom, 
     ChatRoomCreate, 
     ChatRoomDetail,
     Message, 
-    MessageCreate
+    MessageBatchResult,
+    MessageCreate,
+    SearchResult,
+    UserInfo
 )
+from app.utils import decode_cursor, encode_cursor, naive_utc
 
 router = APIRouter(tags=["Chat"])
 
 
 @router.get("/rooms", response_model=List[ChatRoom])
 async def get_chat_rooms(
-    db: Session = Depends(get_db),
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = None,
+    prefix: Optional[str] = Query(None, max_length=100),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    """List all available chat rooms"""
-    return db.query(ChatRooms).all()
+    """List chat rooms by name, optionally only those starting with `prefix`.
+
+    Names compare by the column's collation, so on MySQL the order and the
+    prefix match ignore case.
+
+    Pass the X-Next-Cursor header of a response as `after` for the next
+    page. Responses carry an ETag; send it back in If-None-Match to get a
+    304 when the page hasn't changed.
+    """
+    after_key = parse_room_cursor(after) if after else None
+    listing = await load_room_listing(db, limit, after=after_key, prefix=prefix)
+
+    headers = {"ETag": listing.etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, listing.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if listing.next_cursor:
+        headers["X-Next-Cursor"] = listing.next_cursor
+    return Response(listing.body, media_type="application/json", headers=headers)
+
+
+def parse_room_cursor(token: str) -> Tuple[str, int]:
+    try:
+        name, room_id = decode_cursor(token)
+        if not isinstance(name, str):
+            raise ValueError("Invalid cursor")
+        return name, int(room_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
 
 
 @router.get("/rooms/{room_id}", response_model=ChatRoomDetail)
 async def get_chat_room(
     room_id: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    messages_limit: int = Query(50, ge=0, le=500),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    """Get specific chat room details"""
-    # Get the room with its users relationship explicitly loaded
-    room = db.query(ChatRooms).filter(ChatRooms.id == room_id).first()
+    """Get specific chat room details with its newest messages.
+
+    Only the newest `messages_limit` messages are included; page further
+    back through /rooms/{room_id}/messages with the X-Next-Cursor header.
+    """
+    room = (await db.execute(
+        select(ChatRooms.id, ChatRooms.name, ChatRooms.created_at)
+        .where(ChatRooms.id == room_id)
+    )).first()
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat room not found"
         )
     
-    # Return the room directly - schema will handle the conversion
-    return room
+    # Members in one query over the room_users primary key
+    members = await db.execute(
+        select(Users.id, Users.name, Users.email)
+        .join(RoomUsers, RoomUsers.user_id == Users.id)
+        .where(RoomUsers.room_id == room_id)
+    )
+
+    messages = []
+    if messages_limit:
+        messages = await load_history_page(db, room_id, messages_limit)
+        if len(messages) == messages_limit:
+            response.headers["X-Next-Cursor"] = message_cursor(messages[-1])
+
+    return ChatRoomDetail(
+        id=room.id,
+        name=room.name,
+        created_at=room.created_at,
+        users=[
+            UserInfo(id=member.id, name=member.name, email=member.email)
+            for member in members
+        ],
+        messages=[Message(**message) for message in messages]
+    )
 
 
 @router.post("/rooms", response_model=ChatRoom)
 async def create_chat_room(
     room: ChatRoomCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
     """Create a new chat room"""
     db_room = ChatRooms(name=room.name)
     db.add(db_room)
-    db.commit()
-    db.refresh(db_room)
+    await db.commit()
+    await db.refresh(db_room)
     
     # Add the creator to the room
     room_user = RoomUsers(room_id=db_room.id, user_id=current_user.id)
     db.add(room_user)
-    db.commit()
+    await db.commit()
+    invalidate_room(db_room.id)
+    invalidate_membership(db_room.id, current_user.id)
+    invalidate_room_listing()
+
+    # A new room's history is known to be empty
+    if manager.can_buffer_history(db_room.id):
+        recent_messages.begin_warm(db_room.id)
+        recent_messages.finish_warm(db_room.id, [], complete=True)
     
     return db_room
 
@@ -69,100 +171,409 @@ async def create_chat_room(
 async def create_message(
     room_id: int,
     message: MessageCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
     """Send message to a chat room"""
     # Check if room exists
-    room = db.query(ChatRooms).filter(ChatRooms.id == room_id).first()
-    if not room:
+    if not await room_exists(db, room_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat room not found"
         )
     
     # Check if user is in the room
-    room_user = db.query(RoomUsers).filter(
-        RoomUsers.room_id == room_id,
-        RoomUsers.user_id == current_user.id
-    ).first()
-    
-    if not room_user:
+    if not await is_room_member(db, room_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this chat room"
         )
     
-    # Create message
-    db_message = Messages(
+    wait = await message_rate_wait(current_user.id, room_id)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    
+    # End the read transaction first: holding its pooled connection while
+    # waiting would starve the writer's flush once enough requests pile up
+    await db.commit()
+    
+    # Create message through the write-behind pipeline and wait until it
+    # is committed so the response is durable
+    row = message_writer.build(
         text=message.text,
         sender_id=current_user.id,
         room_id=room_id
     )
+    future = await message_writer.submit(row)
+    await future
+    recent_messages.append(row)
+
+    # Deliver to members connected over WebSocket as well
+    await manager.broadcast_to_room(
+        room_id, message_event(row, current_user.name)
+    )
     
-    db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    return row
+
+
+message_batch_adapter = TypeAdapter(List[MessageCreate])
+
+
+async def parse_message_batch(request: Request) -> List[MessageCreate]:
+    """Messages from a JSON array or an NDJSON body (one object per line)"""
+    body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must be a JSON array or NDJSON"
+        )
+    if not isinstance(items, list) or not items:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Body must contain at least one message"
+        )
+    if len(items) > settings.MESSAGE_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.MESSAGE_BATCH_MAX_SIZE} messages per batch"
+        )
+    try:
+        return message_batch_adapter.validate_python(items)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+@router.post("/rooms/{room_id}/messages/batch", response_model=MessageBatchResult)
+async def create_message_batch(
+    room_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user)
+):
+    """Send many messages to a chat room at once, for bots and bridges.
+
+    Takes a JSON array of messages, or NDJSON with Content-Type
+    application/x-ndjson. Membership is checked once, the messages are
+    committed in one multi-row INSERT and WebSocket members get a single
+    message_batch frame. Every message in the batch takes a token from
+    the sender's batch rate limit.
+    """
+    messages = await parse_message_batch(request)
+
+    # Check if room exists
+    if not await room_exists(db, room_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat room not found"
+        )
+    
+    # Check if user is in the room
+    if not await is_room_member(db, room_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this chat room"
+        )
+    
+    wait = await batch_rate_wait(current_user.id, len(messages))
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(wait))}
+        )
+    
+    rows = [
+        message_writer.build(
+            text=message.text,
+            sender_id=current_user.id,
+            room_id=room_id
+        )
+        for message in messages
+    ]
+    # Written directly rather than through the write-behind queue, which
+    # would split the batch; executemany with explicit IDs is sent as
+    # multi-row INSERTs
+    await db.execute(insert(Messages), rows)
+    await db.commit()
+    for row in rows:
+        recent_messages.append(row)
+    search_backend.index_messages(rows)
+
+    await manager.broadcast_to_room(
+        room_id, message_batch_event(room_id, rows, current_user.name)
+    )
     
-    return db_message
+    return MessageBatchResult(ids=[row["id"] for row in rows])
+
+
+def message_cursor(message: dict) -> str:
+    return encode_cursor(message["created_at"].isoformat(), message["id"])
+
+
+def parse_message_cursor(token: str) -> Tuple[datetime, int]:
+    try:
+        created_at, message_id = decode_cursor(token)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+async def load_history_page(
+    db: AsyncSession,
+    room_id: int,
+    limit: int,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None
+) -> List[dict]:
+    """A page of history, newest first (oldest first when paging `after`).
+
+    Served from the recent-messages buffer when it covers the page. Deep
+    scrolls aren't worth warming a cold room for. Pages that run past the
+    oldest message in the database continue into the archive.
+    """
+    archived = []
+    if after is not None:
+        # Archiving moves the oldest messages first, so only a cursor older
+        # than everything left in the database can be followed by archived
+        # messages. Paging forward from one starts in the archive.
+        oldest = await oldest_message_key(db, room_id)
+        if oldest is None or after < oldest:
+            archived = await message_archive.get_after(room_id, limit, after)
+            if len(archived) == limit:
+                return archived
+
+    messages = None
+    if manager.can_buffer_history(room_id):
+        if before is None:
+            await warm_room(db, room_id)
+        if after is not None:
+            messages = recent_messages.get_after(room_id, limit, after)
+        else:
+            messages = recent_messages.get_before(room_id, limit, before)
+
+    if messages is None:
+        result = await db.scalars(
+            history_query(room_id, limit, before=before, after=after)
+        )
+        messages = [message_to_dict(message) for message in result]
+
+    if archived:
+        # A month being archived can briefly be in both tiers
+        merged = {message["id"]: message for message in archived + messages}
+        messages = sorted(merged.values(), key=message_key)[:limit]
+    elif after is None and len(messages) < limit:
+        older = message_key(messages[-1]) if messages else before
+        messages = messages + await message_archive.get_before(
+            room_id, limit - len(messages), older
+        )
+    return messages
 
 
 @router.get("/rooms/{room_id}/messages", response_model=List[Message])
 async def get_chat_history(
     room_id: int,
-    limit: int = 50,
-    db: Session = Depends(get_db),
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
-    """Get chat room message history"""
+    """Get chat room message history, newest first.
+
+    Pass the X-Next-Cursor header of a response as `before` to page back
+    through older messages, or as `after` to fetch newer ones.
+    """
+    if before and after:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+    before_key = parse_message_cursor(before) if before else None
+    after_key = parse_message_cursor(after) if after else None
+
     # Check if room exists
-    room = db.query(ChatRooms).filter(ChatRooms.id == room_id).first()
-    if not room:
+    if not await room_exists(db, room_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat room not found"
         )
     
     # Check if user is in the room
-    room_user = db.query(RoomUsers).filter(
-        RoomUsers.room_id == room_id,
-        RoomUsers.user_id == current_user.id
-    ).first()
-    
-    if not room_user:
+    if not await is_room_member(db, room_id, current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are not a member of this chat room"
         )
     
     # Get messages
-    messages = db.query(Messages).filter(
-        Messages.room_id == room_id
-    ).order_by(desc(Messages.created_at)).limit(limit).all()
+    messages = await load_history_page(
+        db, room_id, limit, before=before_key, after=after_key
+    )
+
+    # A full page means there may be more in the same direction
+    if len(messages) == limit:
+        response.headers["X-Next-Cursor"] = message_cursor(messages[-1])
+    if after_key is not None:
+        messages.reverse()
     
     return messages
 
 
+@router.get("/rooms/{room_id}/export")
+async def export_chat_history(
+    room_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    accept_encoding: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user)
+):
+    """Stream a room's complete history, oldest first, as NDJSON or CSV.
+
+    `since` (inclusive) and `until` (exclusive) limit the time range;
+    values without a timezone are taken as UTC. The body is gzipped on
+    the fly when the client accepts gzip. Memory use doesn't grow with the
+    size of the room.
+    """
+    # Check if room exists
+    if not await room_exists(db, room_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat room not found"
+        )
+    
+    # Check if user is in the room
+    if not await is_room_member(db, room_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this chat room"
+        )
+    await db.commit()
+    # Include messages still in the write-behind buffer
+    await message_writer.wait_flushed(room_id)
+
+    # Stored timestamps are naive UTC, comparing them with an aware bound
+    # would fail halfway through the stream
+    chunks = export_messages(room_id, format, naive_utc(since), naive_utc(until))
+    headers = {
+        "Content-Disposition": f'attachment; filename="room-{room_id}.{format}"'
+    }
+    if accept_encoding and "gzip" in accept_encoding.lower():
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(chunks, media_type=CONTENT_TYPES[format], headers=headers)
+
+
+def parse_search_cursor(token: str) -> Tuple[int, int]:
+    try:
+        score, message_id = decode_cursor(token)
+        return int(score), int(message_id)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+@router.get("/search", response_model=List[SearchResult])
+async def search_messages(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    room_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Users = Depends(get_current_user)
+):
+    """Search messages in the rooms you belong to, best match first.
+
+    Every word of `q` must appear. Words shorter than three letters and
+    very common ones ("the", "with", ...) are ignored. `room_id` narrows
+    the search to one room. Pass the X-Next-Cursor header of a response as
+    `after` for the next page.
+    """
+    after_key = parse_search_cursor(after) if after else None
+
+    if room_id is not None:
+        # Check if room exists
+        if not await room_exists(db, room_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat room not found"
+            )
+        
+        # Check if user is in the room
+        if not await is_room_member(db, room_id, current_user.id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You are not a member of this chat room"
+            )
+        room_ids = [room_id]
+    else:
+        room_ids = (await db.scalars(
+            select(RoomUsers.room_id).where(RoomUsers.user_id == current_user.id)
+        )).all()
+
+    hits = await search_backend.search(db, query_terms(q), room_ids, limit, after_key)
+    if not hits:
+        return []
+
+    rows = await db.execute(
+        select(
+            Messages.id,
+            Messages.text,
+            Messages.sender_id,
+            Messages.room_id,
+            Messages.created_at,
+            Users.name.label("sender_name"),
+        )
+        .join(Users, Users.id == Messages.sender_id)
+        .where(Messages.id.in_([hit.id for hit in hits]))
+    )
+    messages = {row.id: row for row in rows}
+
+    # A full page means there may be more
+    if len(hits) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(hits[-1].score, hits[-1].id)
+    return [
+        SearchResult(**messages[hit.id]._mapping, score=hit.score / SCORE_SCALE)
+        for hit in hits
+        if hit.id in messages
+    ]
+
+
 @router.post("/rooms/{room_id}/join")
 async def join_chat_room(
     room_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Users = Depends(get_current_user)
 ):
     """Join a chat room"""
     # Check if room exists
-    room = db.query(ChatRooms).filter(ChatRooms.id == room_id).first()
-    if not room:
+    if not await room_exists(db, room_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Chat room not found"
         )
     
-    # Check if user is already in the room
-    room_user = db.query(RoomUsers).filter(
-        RoomUsers.room_id == room_id,
-        RoomUsers.user_id == current_user.id
-    ).first()
+    # Check if user is already in the room, straight from the database since
+    # a cached answer could be stale
+    room_user = await db.get(RoomUsers, (room_id, current_user.id))
     
     if room_user:
         raise HTTPException(
@@ -173,6 +584,7 @@ async def join_chat_room(
     # Add user to room
     room_user = RoomUsers(room_id=room_id, user_id=current_user.id)
     db.add(room_user)
-    db.commit()
+    await db.commit()
+    invalidate_membership(room_id, current_user.id)
     
     return {"detail": "Successfully joined chat room"} 
\ No newline at end of file
@@ -0,0 +1,143 @@
+from fastapi import APIRouter, Response
+
+from app.api.routes.websocket import manager
+from app.core import cache, log
+from app.core.archive import archive_maintenance
+from app.core.history import recent_messages
+from app.core.ingest import message_writer
+from app.core.metrics import CallbackMetric, render
+from app.core.security import password_hasher
+
+router = APIRouter(tags=["Metrics"])
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# State already tracked elsewhere, read when scraped so the hot paths
+# don't pay for it
+CallbackMetric(
+    "chat_ws_connections",
+    "Open WebSocket connections on this process by room",
+    "gauge",
+    lambda: {
+        (str(room_id),): manager.count_connections(room_id)
+        for room_id in manager.active_connections
+    },
+    ("room",),
+)
+CallbackMetric(
+    "chat_ws_sockets",
+    "Open WebSocket sockets on this process by wire protocol, each may "
+    "carry several rooms",
+    "gauge",
+    lambda: {
+        (protocol,): sum(
+            1 for sender in manager.connection_rooms
+            if sender.binary == (protocol == "msgpack")
+        )
+        for protocol in ("json", "msgpack")
+    },
+    ("protocol",),
+)
+CallbackMetric(
+    "chat_ws_reaped",
+    "Dead WebSocket connections evicted by the heartbeat, by reason",
+    "counter",
+    lambda: {(reason,): count for reason, count in manager.reaped.items()},
+    ("reason",),
+)
+CallbackMetric(
+    "chat_ws_pings_sent",
+    "Heartbeat pings queued to WebSocket clients",
+    "counter",
+    lambda: {(): manager.pings_sent},
+)
+CallbackMetric(
+    "chat_cache_hits",
+    "Cache lookups answered from the cache",
+    "counter",
+    lambda: {(c.name,): c.hits for c in cache.registry},
+    ("cache",),
+)
+CallbackMetric(
+    "chat_cache_misses",
+    "Cache lookups that fell through",
+    "counter",
+    lambda: {(c.name,): c.misses for c in cache.registry},
+    ("cache",),
+)
+CallbackMetric(
+    "chat_cache_entries",
+    "Entries currently held by each cache",
+    "gauge",
+    lambda: {(c.name,): len(c) for c in cache.registry},
+    ("cache",),
+)
+CallbackMetric(
+    "chat_recent_messages_lookups",
+    "History reads against the recent messages buffer by outcome",
+    "counter",
+    lambda: {
+        ("hit",): recent_messages.hits,
+        ("miss",): recent_messages.misses,
+    },
+    ("result",),
+)
+CallbackMetric(
+    "chat_recent_messages_bytes",
+    "Estimated memory held by the recent messages buffer",
+    "gauge",
+    lambda: {(): recent_messages.bytes},
+)
+CallbackMetric(
+    "chat_message_writer_pending",
+    "Messages queued for the next write-behind flush",
+    "gauge",
+    lambda: {(): message_writer.pending},
+)
+CallbackMetric(
+    "chat_message_writer_rows",
+    "Messages processed by the write-behind writer by outcome",
+    "counter",
+    lambda: {
+        ("flushed",): message_writer.flushed_rows,
+        ("failed",): message_writer.failed_rows,
+    },
+    ("result",),
+)
+CallbackMetric(
+    "chat_messages_archived",
+    "Messages moved from the database to archive files",
+    "counter",
+    lambda: {(): archive_maintenance.archived_rows},
+)
+CallbackMetric(
+    "chat_password_hash_in_flight",
+    "Password hashes queued or running",
+    "gauge",
+    lambda: {(): password_hasher.in_flight},
+)
+CallbackMetric(
+    "chat_password_hash_queue_depth",
+    "Password hashes waiting for a free worker",
+    "gauge",
+    lambda: {(): password_hasher.queue_depth},
+)
+CallbackMetric(
+    "chat_password_hash_rejected",
+    "Password hashes turned away because the queue was full",
+    "counter",
+    lambda: {(): password_hasher.rejected},
+)
+
+CallbackMetric(
+    "chat_log_records_dropped",
+    "Log records discarded because the log queue was full",
+    "counter",
+    lambda: {(): log.queue_handler.dropped if log.queue_handler else 0},
+)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
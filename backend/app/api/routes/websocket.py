@@ -1,77 +1,709 @@
+import asyncio
 import json
-from typing import Dict, List, Optional
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+import logging
+from datetime import datetime, timedelta, timezone
+from time import monotonic, perf_counter
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from jose import JWTError
 
-from app.core.db import get_db
+from app.core.db import get_async_db
+from app.core.backplane import Backplane, InMemoryBackplane, create_backplane
 from app.core.config import settings
-from app.models import Users, Messages, ChatRooms, RoomUsers
-from app.core.security import is_token_blacklisted
+from app.core.history import load_missed, recent_messages, warm_room
+from app.core.ingest import message_writer
+from app.core.log import bind
+from app.core.metrics import Histogram
+from app.core.ratelimit import message_rate_wait
+from app.models import Users
+from app.core.security import (
+    decode_token,
+    get_user_by_email,
+    is_room_member,
+    is_token_revoked,
+    room_exists
+)
+from app.utils import decode_msgpack, encode_cursor, encode_json, encode_msgpack, msgpack
 
 router = APIRouter(tags=["WebSocket"])
+logger = logging.getLogger(__name__)
+
+# Events whose latest instance supersedes earlier ones, since each carries
+# the full active_users list
+PRESENCE_EVENTS = {"user_joined", "user_left"}
+
+
+broadcast_duration = Histogram(
+    "chat_broadcast_duration_seconds",
+    "Time to encode a room broadcast, queue it locally and publish it",
+)
+broadcast_recipients = Histogram(
+    "chat_broadcast_recipients",
+    "Local connections each broadcast frame was queued for",
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000),
+)
+
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = EPOCH.replace(tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def compact_event(message: dict) -> dict:
+    """Event for binary clients, with created_at as integer epoch
+    milliseconds instead of an ISO string"""
+    event = dict(message)
+    created_at = event.get("created_at")
+    if isinstance(created_at, str):
+        moment = datetime.fromisoformat(created_at)
+        # Stored timestamps are naive UTC
+        epoch = EPOCH if moment.tzinfo is None else EPOCH_UTC
+        event["created_at"] = (moment - epoch) // MILLISECOND
+    messages = event.get("messages")
+    if isinstance(messages, list):
+        event["messages"] = [compact_event(item) for item in messages]
+    return event
+
+
+class Frame:
+    """A message already encoded for the wire, shared by every recipient.
+
+    `data` is the JSON text. The MessagePack form is only encoded the first
+    time a binary client needs it, then reused for the other recipients.
+    """
+
+    __slots__ = ("type", "data", "_message", "_packed")
+
+    def __init__(self, type: Optional[str], data: str, message: Optional[dict] = None):
+        self.type = type
+        self.data = data
+        self._message = message
+        self._packed: Optional[bytes] = None
+
+    @classmethod
+    def from_message(cls, message: dict) -> "Frame":
+        return cls(message.get("type"), encode_json(message), message)
+
+    @property
+    def packed(self) -> bytes:
+        if self._packed is None:
+            message = self._message if self._message is not None else json.loads(self.data)
+            self._packed = encode_msgpack(compact_event(message))
+        return self._packed
+
+
+PING_FRAME = Frame.from_message({"type": "ping"})
+PONG_FRAME = Frame.from_message({"type": "pong"})
+
+
+class ConnectionSender:
+    """Bounded outbound queue drained by a dedicated writer task.
+
+    Broadcasting only enqueues, so a slow receiver backs up its own queue
+    instead of stalling every other member of the room.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int = settings.WS_SEND_QUEUE_SIZE,
+        overflow_policy: str = settings.WS_OVERFLOW_POLICY,
+        paused: bool = False,
+        binary: bool = False,
+    ):
+        self.websocket = websocket
+        # MessagePack binary frames instead of JSON text
+        self.binary = binary
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self.closed = False
+        self.dropped_frames = 0
+        # When the client last sent anything, outbound writes can succeed
+        # for a long time after a peer has silently gone away
+        self.last_activity = monotonic()
+        # Set by ConnectionManager, for presence and the user_left event
+        self.user_id: Optional[int] = None
+        self.user_name: Optional[str] = None
+        self._writer: Optional[asyncio.Task] = None
+        if not paused:
+            self.resume()
+
+    def touch(self) -> None:
+        self.last_activity = monotonic()
+
+    def resume(self, first: Optional[Frame] = None) -> None:
+        """Start the writer of a paused sender, sending `first` before
+        anything that was queued meanwhile"""
+        if self._writer is None and not self.closed:
+            self._writer = asyncio.create_task(self._run(first))
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Queue a frame without blocking; False if the client was dropped"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow_policy == "coalesce":
+            self._coalesce()
+            self.queue.put_nowait(frame)
+            return True
+
+        # Client can't keep up, disconnect it rather than buffer forever
+        self.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return False
+
+    def _coalesce(self) -> None:
+        """Collapse superseded presence events, then drop the oldest frames"""
+        pending = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+
+        latest_presence = None
+        for index, frame in enumerate(pending):
+            if frame.type in PRESENCE_EVENTS:
+                latest_presence = index
+        kept = [
+            frame for index, frame in enumerate(pending)
+            if frame.type not in PRESENCE_EVENTS
+            or index == latest_presence
+        ]
+        # Leave room for the frame being enqueued
+        room = self.max_size - 1
+        if len(kept) > room:
+            kept = kept[len(kept) - room:]
+        self.dropped_frames += len(pending) - len(kept)
+
+        for frame in kept:
+            self.queue.put_nowait(frame)
+
+    async def _run(self, first: Optional[Frame] = None):
+        if self.binary:
+            send, encoding = self.websocket.send_bytes, "packed"
+        else:
+            send, encoding = self.websocket.send_text, "data"
+        try:
+            if first is not None:
+                await send(getattr(first, encoding))
+            while True:
+                frame = await self.queue.get()
+                await send(getattr(frame, encoding))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The peer is gone, the receive loop will clean up the registry
+            self.closed = True
+
+    def close(self, code: Optional[int] = None) -> None:
+        """Stop the writer and, if a close code is given, close the socket"""
+        if self.closed and (self._writer is None or self._writer.done()):
+            return
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
 
 # Keep track of active connections
 class ConnectionManager:
-    def __init__(self):
-        # Structure: {room_id: {user_id: WebSocket}}
-        self.active_connections: Dict[int, Dict[int, WebSocket]] = {}
+    """Registry of the WebSocket connections on this process.
+
+    A user may hold several connections to the same room (tabs, devices).
+    Presence follows the user: they join a room with their first
+    connection and leave it with their last.
+    """
+
+    def __init__(self, backplane: Optional[Backplane] = None):
+        # Structure: {room_id: {user_id: {ConnectionSender, ...}}}
+        self.active_connections: Dict[int, Dict[int, Set[ConnectionSender]]] = {}
+        # Reverse index so a connection is removed without scanning rooms
+        # Structure: {ConnectionSender: {room_id, ...}}
+        self.connection_rooms: Dict[ConnectionSender, Set[int]] = {}
+        # Fans frames and presence out to the other server processes
+        self.backplane = backplane or InMemoryBackplane()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        # Counters
+        self.pings_sent = 0
+        self.reaped = {"idle": 0, "closed": 0}
+
+    async def start(self):
+        await self.backplane.start(self._deliver_remote)
+        if settings.WS_PING_INTERVAL_SECONDS > 0:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+            self._heartbeat_task = None
+        await self.backplane.stop()
         
-    async def connect(self, websocket: WebSocket, room_id: int, user_id: int, already_accepted=False):
-        """Connect a WebSocket to a room"""
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: int,
+        user_id: int,
+        already_accepted=False,
+        paused=False,
+        user_name: Optional[str] = None,
+        binary=False
+    ) -> ConnectionSender:
+        """Connect a WebSocket to a room.
+
+        With `paused`, frames are queued but not sent until the returned
+        sender is resumed. Earlier connections of the same user stay open.
+        """
         # Only accept the connection if it hasn't been accepted already
         if not already_accepted:
             await websocket.accept()
             
-        # Register connection
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = {}
-        self.active_connections[room_id][user_id] = websocket
+        sender = self.register(websocket, user_id, user_name, paused=paused, binary=binary)
+        await self.join_room(sender, room_id)
+        return sender
+
+    def register(
+        self,
+        websocket: WebSocket,
+        user_id: int,
+        user_name: Optional[str] = None,
+        paused=False,
+        binary=False
+    ) -> ConnectionSender:
+        """Track an accepted connection that isn't in any room yet"""
+        sender = ConnectionSender(websocket, paused=paused, binary=binary)
+        sender.user_id = user_id
+        sender.user_name = user_name
+        self.connection_rooms[sender] = set()
+        return sender
+
+    def get_rooms(self, sender: ConnectionSender) -> Set[int]:
+        """Rooms the connection is subscribed to"""
+        return self.connection_rooms.get(sender, set())
+
+    async def join_room(self, sender: ConnectionSender, room_id: int) -> bool:
+        """Add a registered connection to a room.
+
+        Returns whether this is the user's first connection to the room,
+        i.e. whether they just became present.
+        """
+        rooms = self.connection_rooms[sender]
+        if room_id in rooms:
+            return False
+        rooms.add(room_id)
+
+        connections = self.active_connections.get(room_id)
+        if connections is None:
+            connections = self.active_connections[room_id] = {}
+            await self.backplane.subscribe(room_id)
+        sessions = connections.get(sender.user_id)
+        if sessions is None:
+            connections[sender.user_id] = {sender}
+            await self.backplane.join(room_id, sender.user_id)
+            return True
+        sessions.add(sender)
+        return False
+
+    async def leave_room(self, sender: ConnectionSender, room_id: int) -> bool:
+        """Remove a connection from one room.
+
+        Returns whether it was the user's last connection to the room,
+        i.e. whether they just left.
+        """
+        rooms = self.connection_rooms.get(sender)
+        if rooms is None or room_id not in rooms:
+            return False
+        rooms.discard(room_id)
+
+        connections = self.active_connections[room_id]
+        sessions = connections[sender.user_id]
+        sessions.discard(sender)
+        if sessions:
+            return False
+        del connections[sender.user_id]
+        await self.backplane.leave(room_id, sender.user_id)
+        if not connections:
+            del self.active_connections[room_id]
+            await self.backplane.unsubscribe(room_id)
+            if self.backplane.distributed:
+                # Other nodes' writes to this room stop arriving here
+                recent_messages.evict(room_id)
+        return True
         
-    def disconnect(self, room_id: int, user_id: int):
-        if room_id in self.active_connections:
-            if user_id in self.active_connections[room_id]:
-                del self.active_connections[room_id][user_id]
-            if not self.active_connections[room_id]:
-                del self.active_connections[room_id]
+    async def disconnect(self, sender: ConnectionSender) -> List[int]:
+        """Remove a connection from every room it is in and close it.
+
+        Safe to call more than once, e.g. by both the reaper and the
+        receive loop. Returns the rooms the user is no longer present in.
+        """
+        rooms = self.connection_rooms.get(sender)
+        if rooms is None:
+            return []
+        left = [
+            room_id for room_id in list(rooms)
+            if await self.leave_room(sender, room_id)
+        ]
+        del self.connection_rooms[sender]
+        sender.close()
+        return left
+
+    async def announce_joined(self, sender: ConnectionSender, room_id: int):
+        """Tell the room that the connection's user has joined.
+
+        Another tab or device of a user who is already present only needs
+        the presence list itself.
+        """
+        joined = {
+            "type": "user_joined",
+            "user_id": sender.user_id,
+            "user_name": sender.user_name,
+            "room_id": room_id,
+            "active_users": await self.get_connected_users(room_id)
+        }
+        if self.count_sessions(room_id, sender.user_id) == 1:
+            await self.broadcast_to_room(room_id, joined)
+        else:
+            sender.enqueue(Frame.from_message(joined))
+
+    async def announce_left(self, room_ids: List[int], user_id: int, user_name: Optional[str]):
+        """Tell each room that the user has left"""
+        for room_id in room_ids:
+            await self.broadcast_to_room(
+                room_id,
+                {
+                    "type": "user_left",
+                    "user_id": user_id,
+                    "user_name": user_name,
+                    "room_id": room_id,
+                    "active_users": await self.get_connected_users(room_id)
+                }
+            )
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_SECONDS)
+            try:
+                await self.reap_stale()
+            except Exception:
+                logger.exception("Heartbeat failed", extra={"event": "ws.heartbeat_failed"})
+
+    async def reap_stale(self, idle_timeout: float = settings.WS_IDLE_TIMEOUT_SECONDS) -> int:
+        """Ping live connections and evict dead ones.
+
+        A connection is dead once its writer has failed or the client has
+        sent nothing, not even a pong, for `idle_timeout` seconds. Half-open
+        TCP connections never raise on the receive side, so without this
+        they would stay registered forever. Returns how many were evicted.
+        """
+        now = monotonic()
+        stale = []
+        for sender in self.connection_rooms:
+            if sender.closed:
+                stale.append((sender, "closed"))
+            elif now - sender.last_activity > idle_timeout:
+                stale.append((sender, "idle"))
+            elif sender.enqueue(PING_FRAME):
+                self.pings_sent += 1
+
+        evicted = 0
+        for sender, reason in stale:
+            sender.close(code=status.WS_1001_GOING_AWAY)
+            # The receive loop may have cleaned it up meanwhile
+            if sender not in self.connection_rooms:
+                continue
+            rooms = sorted(self.connection_rooms[sender])
+            left = await self.disconnect(sender)
+            evicted += 1
+            self.reaped[reason] += 1
+            logger.info(
+                "Reaped WebSocket connection",
+                extra={
+                    "event": "ws.reaped",
+                    "reason": reason,
+                    "rooms": rooms,
+                    "user_id": sender.user_id
+                }
+            )
+            await self.announce_left(left, sender.user_id, sender.user_name)
+        return evicted
                 
     async def broadcast_to_room(self, room_id: int, message: dict):
-        if room_id in self.active_connections:
-            for user_id, connection in self.active_connections[room_id].items():
-                await connection.send_json(message)
+        """Enqueue a message for every connection in the room, cluster-wide.
+
+        The message is encoded once and the same frame is shared by every
+        recipient. Local sockets get it queued directly; other nodes get it
+        through the backplane. Delivery happens on each connection's writer
+        task.
+        """
+        start = perf_counter()
+        frame = Frame.from_message(message)
+        self._deliver_local(room_id, frame)
+        await self.backplane.publish(room_id, frame.type, frame.data)
+        broadcast_duration.observe(perf_counter() - start)
+
+    def _deliver_local(self, room_id: int, frame: Frame):
+        recipients = 0
+        connections = self.active_connections.get(room_id)
+        if connections:
+            for sessions in connections.values():
+                for sender in sessions:
+                    sender.enqueue(frame)
+                recipients += len(sessions)
+        broadcast_recipients.observe(recipients)
+
+    def _deliver_remote(self, room_id: int, frame_type: Optional[str], data: str):
+        event = None
+        if frame_type in ("message", "message_batch") and room_id in recent_messages:
+            event = json.loads(data)
+            for message in event["messages"] if frame_type == "message_batch" else [event]:
+                recent_messages.append({
+                    "id": message["id"],
+                    "text": message["text"],
+                    "sender_id": message["sender_id"],
+                    "room_id": message["room_id"],
+                    "created_at": datetime.fromisoformat(message["created_at"]),
+                })
+        self._deliver_local(room_id, Frame(frame_type, data, event))
+
+    def can_buffer_history(self, room_id: int) -> bool:
+        """Whether this process sees every write to the room.
+
+        With a distributed backplane that only holds while the room has
+        local connections, since frames arrive for subscribed rooms only.
+        """
+        return (
+            not self.backplane.distributed
+            or room_id in self.active_connections
+        )
                 
-    def get_user_connection(
-        self, room_id: int, user_id: int
-    ) -> Optional[WebSocket]:
-        if (room_id in self.active_connections and 
-                user_id in self.active_connections[room_id]):
-            return self.active_connections[room_id][user_id]
-        return None
-        
-    def get_connected_users(self, room_id: int) -> List[int]:
+    def get_user_connections(self, room_id: int, user_id: int) -> List[WebSocket]:
+        """Every connection the user has open to the room on this process"""
+        sessions = self.active_connections.get(room_id, {}).get(user_id, ())
+        return [sender.websocket for sender in sessions]
+
+    def count_sessions(self, room_id: int, user_id: int) -> int:
+        """Connections the user has open to the room on this process"""
+        return len(self.active_connections.get(room_id, {}).get(user_id, ()))
+
+    def count_connections(self, room_id: int) -> int:
+        return sum(
+            len(sessions)
+            for sessions in self.active_connections.get(room_id, {}).values()
+        )
+
+    def get_local_users(self, room_id: int) -> List[int]:
+        """Users connected to the room on this process only"""
         if room_id in self.active_connections:
             return list(self.active_connections[room_id].keys())
         return []
+        
+    async def get_connected_users(self, room_id: int) -> List[int]:
+        """Users connected to the room on any process"""
+        return await self.backplane.get_presence(room_id)
 
 
-manager = ConnectionManager()
+manager = ConnectionManager(create_backplane())
 
 
-async def get_current_user_from_token(token: str, db: Session) -> Users:
-    """Validate JWT token and return user"""
+# Subprotocols a client may offer, mapped to whether frames are binary
+SUBPROTOCOLS = {"chat.json": False, "chat.msgpack": True}
+
+
+def negotiate_protocol(websocket: WebSocket) -> Tuple[Optional[str], bool]:
+    """Pick the wire format for a connection.
+
+    Returns the subprotocol to accept, if the client offered one, and
+    whether to use MessagePack binary frames. Clients that can't set
+    subprotocols may pass ?format=msgpack instead. JSON text is the
+    default, and the only option without the msgpack package.
+    """
+    for name in websocket.scope.get("subprotocols", []):
+        binary = SUBPROTOCOLS.get(name)
+        if binary is not None and (msgpack is not None or not binary):
+            return name, binary
+    binary = websocket.query_params.get("format") == "msgpack" and msgpack is not None
+    return None, binary
+
+
+async def receive_frame(websocket: WebSocket) -> dict:
+    """Next client frame, JSON text or MessagePack binary"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+    if message.get("bytes") is not None:
+        return decode_msgpack(message["bytes"])
+    return json.loads(message["text"])
+
+
+def replay_event(room_id: int, messages: Optional[List[dict]]) -> dict:
+    """Batched frame of the messages a reconnecting client missed.
+
+    `truncated` means the client should fetch the rest over REST, starting
+    from `next_cursor` (or resync entirely if there is none).
+    """
+    # None means the last seen message is unknown
+    truncated = (
+        messages is None
+        or len(messages) >= settings.WS_REPLAY_MAX_MESSAGES
+    )
+    messages = messages or []
+    return {
+        "type": "replay",
+        "room_id": room_id,
+        "messages": [
+            {
+                "id": message["id"],
+                "text": message["text"],
+                "sender_id": message["sender_id"],
+                "room_id": message["room_id"],
+                "created_at": message["created_at"].isoformat()
+            }
+            for message in messages
+        ],
+        "truncated": truncated,
+        "next_cursor": (
+            encode_cursor(messages[-1]["created_at"].isoformat(), messages[-1]["id"])
+            if truncated and messages else None
+        )
+    }
+
+
+def message_event(row: dict, sender_name: str) -> dict:
+    """Broadcast payload for a chat message row"""
+    return {
+        "type": "message",
+        "id": row["id"],
+        "text": row["text"],
+        "sender_id": row["sender_id"],
+        "sender_name": sender_name,
+        "room_id": row["room_id"],
+        "created_at": row["created_at"].isoformat()
+    }
+
+
+def message_batch_event(room_id: int, rows: List[dict], sender_name: str) -> dict:
+    """One broadcast payload for messages posted together"""
+    return {
+        "type": "message_batch",
+        "room_id": room_id,
+        "messages": [
+            {
+                "id": row["id"],
+                "text": row["text"],
+                "sender_id": row["sender_id"],
+                "sender_name": sender_name,
+                "room_id": row["room_id"],
+                "created_at": row["created_at"].isoformat()
+            }
+            for row in rows
+        ]
+    }
+
+
+def error_event(code: str, error: str, room_id: Optional[int] = None) -> dict:
+    """Error frame that leaves the connection open"""
+    event = {"type": "error", "code": code, "error": error}
+    if room_id is not None:
+        event["room_id"] = room_id
+    return event
+
+
+def rate_limited_event(retry_after: float, room_id: Optional[int] = None) -> dict:
+    event = error_event(
+        "rate_limited", "Rate limit exceeded, message was not sent", room_id
+    )
+    event["retry_after"] = round(retry_after, 3)
+    return event
+
+
+async def wait_for_send_slot(user_id: int, room_id: int) -> float:
+    """Apply the message rate limit to a WebSocket client.
+
+    Returns 0 once the message may be sent, or the remaining wait if it
+    has to be rejected. With the "delay" policy the receive loop sleeps
+    here instead, which pushes back on the client through TCP.
+    """
+    wait = await message_rate_wait(user_id, room_id)
+    if settings.RATE_LIMIT_WS_POLICY == "delay":
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.RATE_LIMIT_MAX_DELAY_SECONDS
+        while wait and loop.time() + wait <= deadline:
+            await asyncio.sleep(wait)
+            wait = await message_rate_wait(user_id, room_id)
+    return wait
+
+
+async def send_chat_message(sender: ConnectionSender, room_id: int, text: str):
+    """Rate limit, persist and broadcast a message sent over a WebSocket"""
+    wait = await wait_for_send_slot(sender.user_id, room_id)
+    if wait:
+        sender.enqueue(Frame.from_message(rate_limited_event(wait, room_id)))
+        return
+
+    # Queue the message for persistence, this only waits when the
+    # write-behind buffer is full
+    row = message_writer.build(text=text, sender_id=sender.user_id, room_id=room_id)
+    await message_writer.submit(row)
+    recent_messages.append(row)
+
+    # Broadcast to all connected clients in the room
+    await manager.broadcast_to_room(room_id, message_event(row, sender.user_name))
+
+
+async def load_replay(db: AsyncSession, room_id: int, last_seen_id: int) -> Frame:
+    """Replay frame for a reconnecting client. If the missed messages
+    couldn't be loaded it is empty and truncated, so the client resyncs
+    over REST instead of silently missing them."""
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=["HS256"]
+        await warm_room(db, room_id)
+        missed = await load_missed(
+            db, room_id, last_seen_id, settings.WS_REPLAY_MAX_MESSAGES
+        )
+        await db.commit()
+        return Frame.from_message(replay_event(room_id, missed))
+    except Exception:
+        logger.exception(
+            "Failed to load replay",
+            extra={"event": "ws.replay_failed", "room_id": room_id}
         )
+        return Frame.from_message(replay_event(room_id, None))
+
+
+async def room_access_error(
+    db: AsyncSession, room_id: int, user_id: int
+) -> Optional[Tuple[str, str]]:
+    """(reason, message) if the user may not receive the room's traffic"""
+    if not await room_exists(db, room_id):
+        return "room_not_found", "Chat room not found"
+    if not await is_room_member(db, room_id, user_id):
+        return "not_member", "You are not a member of this chat room"
+    return None
+
+
+async def get_current_user_from_token(token: str, db: AsyncSession) -> Users:
+    """Validate JWT token and return user"""
+    try:
+        payload = decode_token(token)
         email: str = payload.get("sub")
         if email is None:
             return None
-        if is_token_blacklisted(token):
-            return None
     except JWTError:
         return None
+    if await is_token_revoked(token, payload):
+        return None
         
-    user = db.query(Users).filter(Users.email == email).first()
+    user = await get_user_by_email(db, email)
     return user
 
 
@@ -79,27 +711,38 @@ async def get_current_user_from_token(token: str, db: Session) -> Users:
 async def websocket_endpoint(
     websocket: WebSocket, 
     room_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Extract token from query parameters
-    token = None
+    token = websocket.query_params.get("token")
+    # A malformed last_seen_id is reported once the client is connected,
+    # it must not read as a missing token
+    last_seen_id = websocket.query_params.get("last_seen_id")
+    bad_last_seen_id = False
     try:
-        # Get query parameters from the URL
-        query_params = dict(websocket.query_params)
-        token = query_params.get("token")
-        print(f"WebSocket connection request for room {room_id}")
-        if token:
-            print(f"Token provided with length: {len(token)}")
-    except Exception as e:
-        print(f"Error extracting token: {str(e)}")
-        token = None
+        last_seen_id = int(last_seen_id) if last_seen_id else None
+    except ValueError:
+        logger.warning(
+            "Invalid last_seen_id: %r", last_seen_id,
+            extra={"event": "ws.bad_query"}
+        )
+        last_seen_id = None
+        bad_last_seen_id = True
+    
+    # Each connection runs in its own task, so the context set here is only
+    # seen by this connection's log records
+    bind(room_id=room_id)
     
     # Accept the connection first (required before sending any messages)
-    await websocket.accept()
-    print(f"WebSocket connection accepted for room {room_id}")
+    subprotocol, binary = negotiate_protocol(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    logger.debug("WebSocket connection accepted", extra={"event": "ws.accepted"})
     
     if not token:
-        print("No token provided")
+        logger.info(
+            "WebSocket rejected: no token",
+            extra={"event": "ws.rejected", "reason": "no_token"}
+        )
         await websocket.send_json({"error": "Authentication required"})
         await websocket.close()
         return
@@ -108,117 +751,222 @@ async def websocket_endpoint(
         # Authenticate user
         user = await get_current_user_from_token(token, db)
         if not user:
-            print(f"Invalid authentication token for room {room_id}")
+            logger.info(
+                "WebSocket rejected: invalid token",
+                extra={"event": "ws.rejected", "reason": "invalid_token"}
+            )
             await websocket.send_json({"error": "Invalid authentication token"})
             await websocket.close()
             return
             
-        print(f"User authenticated: {user.email} (ID: {user.id})")
+        bind(user_id=user.id)
             
-        # Check if room exists
-        room = db.query(ChatRooms).filter(ChatRooms.id == room_id).first()
-        if not room:
-            print(f"Room {room_id} not found")
-            await websocket.send_json({"error": "Chat room not found"})
-            await websocket.close()
-            return
-        
-        # Check if user is in the room
-        room_user = db.query(RoomUsers).filter(
-            RoomUsers.room_id == room_id,
-            RoomUsers.user_id == user.id
-        ).first()
-        
-        if not room_user:
-            print(f"User {user.id} is not a member of room {room_id}")
-            await websocket.send_json({
-                "error": "You are not a member of this chat room"
-            })
+        # Check that the room exists and the user is in it
+        denied = await room_access_error(db, room_id, user.id)
+        if denied:
+            reason, error = denied
+            logger.info(
+                "WebSocket rejected: %s", reason,
+                extra={"event": "ws.rejected", "reason": reason}
+            )
+            await websocket.send_json({"error": error})
             await websocket.close()
             return
         
-        print(f"User {user.id} is authorized for room {room_id}")
+        # End the read transaction so an idle socket doesn't pin a pooled
+        # connection for its whole lifetime
+        await db.commit()
         
         # Add to connection manager - note we don't need to accept again here
-        # since we already accepted the connection above
-        await manager.connect(websocket, room_id, user.id, already_accepted=True)
-        
-        # Notify room about new user
-        await manager.broadcast_to_room(
+        # since we already accepted the connection above. A reconnecting
+        # client's live traffic is held back until its replay is sent.
+        sender = await manager.connect(
+            websocket,
             room_id,
-            {
-                "type": "user_joined",
-                "user_id": user.id,
-                "user_name": user.name,
-                "room_id": room_id,
-                "active_users": manager.get_connected_users(room_id)
-            }
+            user.id,
+            already_accepted=True,
+            paused=last_seen_id is not None,
+            user_name=user.name,
+            binary=binary
         )
         
-        print(f"User {user.id} joined room {room_id} successfully")
+        if last_seen_id is not None:
+            sender.resume(await load_replay(db, room_id, last_seen_id))
+        elif bad_last_seen_id:
+            sender.enqueue(Frame.from_message(error_event(
+                "bad_request", "last_seen_id must be an integer", room_id
+            )))
+        
+        # Notify room about new user
+        await manager.announce_joined(sender, room_id)
+        
+        logger.info("WebSocket connected", extra={"event": "ws.connected"})
         
         try:
             while True:
                 # Wait for messages from the client
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
-                
-                # Save message to database
-                db_message = Messages(
-                    text=message_data.get("text", ""),
-                    sender_id=user.id,
-                    room_id=room_id
-                )
+                message_data = await receive_frame(websocket)
+                sender.touch()
                 
-                db.add(db_message)
-                db.commit()
-                db.refresh(db_message)
+                # Heartbeat frames aren't chat messages
+                frame_type = message_data.get("type")
+                if frame_type == "pong":
+                    continue
+                if frame_type == "ping":
+                    sender.enqueue(PONG_FRAME)
+                    continue
                 
-                # Broadcast to all connected clients in the room
-                await manager.broadcast_to_room(
-                    room_id,
-                    {
-                        "type": "message",
-                        "id": db_message.id,
-                        "text": db_message.text,
-                        "sender_id": db_message.sender_id,
-                        "sender_name": user.name,
-                        "room_id": db_message.room_id,
-                        "created_at": db_message.created_at.isoformat()
-                    }
-                )
+                await send_chat_message(sender, room_id, message_data.get("text", ""))
         except WebSocketDisconnect:
-            print(f"WebSocket disconnected for user {user.id} in room {room_id}")
-            # Remove from active connections
-            manager.disconnect(room_id, user.id)
-            
-            # Notify room about user leaving
-            await manager.broadcast_to_room(
-                room_id,
-                {
-                    "type": "user_left",
-                    "user_id": user.id,
-                    "user_name": user.name,
-                    "room_id": room_id,
-                    "active_users": manager.get_connected_users(room_id)
-                }
-            )
-        except Exception as e:
-            print(f"Error in WebSocket handler: {str(e)}")
-            # Remove from active connections
-            manager.disconnect(room_id, user.id)
-            
-            # Notify room about user leaving
-            await manager.broadcast_to_room(
-                room_id,
-                {
-                    "type": "user_left",
-                    "user_id": user.id,
-                    "user_name": user.name,
-                    "room_id": room_id,
-                    "active_users": manager.get_connected_users(room_id)
-                }
+            logger.info("WebSocket disconnected", extra={"event": "ws.disconnected"})
+            # Remove from active connections and notify the room if this was
+            # the user's last connection to it, unless it was already reaped
+            left = await manager.disconnect(sender)
+            await manager.announce_left(left, user.id, user.name)
+        except Exception:
+            logger.exception("Error in WebSocket handler", extra={"event": "ws.error"})
+            left = await manager.disconnect(sender)
+            await manager.announce_left(left, user.id, user.name)
+    except Exception:
+        logger.exception("Unhandled WebSocket error", extra={"event": "ws.error"})
+        await websocket.close() 
+
+
+async def subscribe(
+    db: AsyncSession,
+    sender: ConnectionSender,
+    room_id: int,
+    last_seen_id: Optional[int] = None
+):
+    """Add a multiplexed connection to a room after checking membership"""
+    rooms = manager.get_rooms(sender)
+    if room_id not in rooms:
+        if len(rooms) >= settings.WS_MAX_SUBSCRIPTIONS:
+            sender.enqueue(Frame.from_message(error_event(
+                "too_many_subscriptions",
+                f"At most {settings.WS_MAX_SUBSCRIPTIONS} rooms per connection",
+                room_id
+            )))
+            return
+        denied = await room_access_error(db, room_id, sender.user_id)
+        await db.commit()
+        if denied:
+            reason, error = denied
+            sender.enqueue(Frame.from_message(error_event(reason, error, room_id)))
+            return
+        await manager.join_room(sender, room_id)
+
+    sender.enqueue(Frame.from_message({"type": "subscribed", "room_id": room_id}))
+    if last_seen_id is not None:
+        # Live messages may already be queued ahead of the replay, clients
+        # merge the two by message ID
+        sender.enqueue(await load_replay(db, room_id, last_seen_id))
+    await manager.announce_joined(sender, room_id)
+
+
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(
+    websocket: WebSocket,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """One connection carrying all of a user's rooms.
+
+    The token is checked once, then the client picks rooms with
+    subscribe/unsubscribe frames. Every room frame carries its room_id.
+    """
+    token = websocket.query_params.get("token")
+    
+    subprotocol, binary = negotiate_protocol(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    logger.debug("WebSocket connection accepted", extra={"event": "ws.accepted"})
+    
+    if not token:
+        logger.info(
+            "WebSocket rejected: no token",
+            extra={"event": "ws.rejected", "reason": "no_token"}
+        )
+        await websocket.send_json({"error": "Authentication required"})
+        await websocket.close()
+        return
+    
+    try:
+        user = await get_current_user_from_token(token, db)
+        if not user:
+            logger.info(
+                "WebSocket rejected: invalid token",
+                extra={"event": "ws.rejected", "reason": "invalid_token"}
             )
-    except Exception as e:
-        print(f"Unhandled WebSocket error: {str(e)}")
-        await websocket.close() 
\ No newline at end of file
+            await websocket.send_json({"error": "Invalid authentication token"})
+            await websocket.close()
+            return
+        
+        bind(user_id=user.id)
+        await db.commit()
+        
+        sender = manager.register(websocket, user.id, user.name, binary=binary)
+        sender.enqueue(Frame.from_message({
+            "type": "connected",
+            "user_id": user.id,
+            "user_name": user.name
+        }))
+        logger.info("WebSocket connected", extra={"event": "ws.connected"})
+        
+        try:
+            while True:
+                message_data = await receive_frame(websocket)
+                sender.touch()
+                
+                if not isinstance(message_data, dict):
+                    sender.enqueue(Frame.from_message(error_event(
+                        "bad_request", "Frames must be JSON objects"
+                    )))
+                    continue
+                
+                frame_type = message_data.get("type")
+                if frame_type == "pong":
+                    continue
+                if frame_type == "ping":
+                    sender.enqueue(PONG_FRAME)
+                    continue
+                if frame_type not in ("subscribe", "unsubscribe", "message"):
+                    sender.enqueue(Frame.from_message(error_event(
+                        "bad_request", f"Unknown frame type: {frame_type}"
+                    )))
+                    continue
+                
+                try:
+                    room_id = int(message_data["room_id"])
+                    last_seen_id = message_data.get("last_seen_id")
+                    if last_seen_id is not None:
+                        last_seen_id = int(last_seen_id)
+                except (KeyError, TypeError, ValueError):
+                    sender.enqueue(Frame.from_message(error_event(
+                        "bad_request", "room_id must be an integer"
+                    )))
+                    continue
+                
+                if frame_type == "subscribe":
+                    await subscribe(db, sender, room_id, last_seen_id)
+                elif frame_type == "unsubscribe":
+                    if await manager.leave_room(sender, room_id):
+                        await manager.announce_left([room_id], user.id, user.name)
+                    sender.enqueue(Frame.from_message(
+                        {"type": "unsubscribed", "room_id": room_id}
+                    ))
+                elif room_id in manager.get_rooms(sender):
+                    await send_chat_message(sender, room_id, message_data.get("text", ""))
+                else:
+                    sender.enqueue(Frame.from_message(error_event(
+                        "not_subscribed", "Subscribe to the room first", room_id
+                    )))
+        except WebSocketDisconnect:
+            logger.info("WebSocket disconnected", extra={"event": "ws.disconnected"})
+            left = await manager.disconnect(sender)
+            await manager.announce_left(left, user.id, user.name)
+        except Exception:
+            logger.exception("Error in WebSocket handler", extra={"event": "ws.error"})
+            left = await manager.disconnect(sender)
+            await manager.announce_left(left, user.id, user.name)
+    except Exception:
+        logger.exception("Unhandled WebSocket error", extra={"event": "ws.error"})
+        await websocket.close()
@@ -0,0 +1,319 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.core.history import Key, message_key, message_to_dict
+from app.core.ids import min_id_at
+from app.models import Messages
+from app.utils import encode_json
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = ".ndjson.gz"
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def month_label(moment: datetime) -> str:
+    """YYYY-MM, which sorts in time order"""
+    return f"{moment.year:04d}-{moment.month:02d}"
+
+
+def timestamp_ms(moment: datetime) -> int:
+    """Milliseconds since the Unix epoch of a naive UTC datetime"""
+    return (moment - EPOCH) // MILLISECOND
+
+
+class MessageArchive:
+    """Cold history as gzip NDJSON files, {root}/{room_id}/{YYYY-MM}.ndjson.gz.
+
+    Each file holds one room's messages for one month, oldest first, in
+    the same shape as a history row. Reads decode a whole month at once
+    and keep the most recently used months in memory, so paging through
+    an archived month costs one file read. File IO runs in threads.
+    """
+
+    def __init__(self, root: str = settings.ARCHIVE_DIR):
+        self.root = root
+        # {room_id: [month labels]}, short TTL so other workers' archiving
+        # shows up
+        self._months = TTLCache("archive_months", 10000, 10)
+        # {(room_id, label): (rows, keys)}
+        self._pages = TTLCache("archive_pages", settings.ARCHIVE_CACHE_MAX_MONTHS, 3600)
+
+    def path(self, room_id: int, label: str) -> str:
+        return os.path.join(self.root, str(room_id), label + SUFFIX)
+
+    def list_months(self, room_id: int) -> List[str]:
+        try:
+            names = os.listdir(os.path.join(self.root, str(room_id)))
+        except FileNotFoundError:
+            names = []
+        return sorted(name[:-len(SUFFIX)] for name in names if name.endswith(SUFFIX))
+
+    async def months(self, room_id: int) -> List[str]:
+        """Labels of the room's archived months, oldest first"""
+        labels = self._months.get(room_id)
+        if labels is None:
+            labels = await asyncio.to_thread(self.list_months, room_id)
+            self._months.set(room_id, labels)
+        return labels
+
+    def read_month(self, room_id: int, label: str) -> List[dict]:
+        try:
+            with gzip.open(self.path(room_id, label), "rt", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return []
+        for row in rows:
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+        rows.sort(key=message_key)
+        return rows
+
+    def write_month(self, room_id: int, label: str, rows: List[dict]) -> None:
+        """Add rows to a month's file, replacing it atomically.
+
+        Rows already in the file are kept, so a run interrupted between
+        writing a file and deleting its rows can simply be repeated.
+        """
+        merged = {row["id"]: row for row in self.read_month(room_id, label)}
+        merged.update((row["id"], row) for row in rows)
+        path = self.path(room_id, label)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = path + ".partial"
+        with gzip.open(partial, "wt", encoding="utf-8") as f:
+            for row in sorted(merged.values(), key=message_key):
+                f.write(encode_json({**row, "created_at": row["created_at"].isoformat()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+        self._months.invalidate(room_id)
+        self._pages.invalidate((room_id, label))
+
+    async def _load(self, room_id: int, label: str) -> Tuple[List[dict], List[Key]]:
+        page = self._pages.get((room_id, label))
+        if page is None:
+            rows = await asyncio.to_thread(self.read_month, room_id, label)
+            page = rows, [message_key(row) for row in rows]
+            self._pages.set((room_id, label), page)
+        return page
+
+    async def get_before(
+        self, room_id: int, limit: int, before: Optional[Key] = None
+    ) -> List[dict]:
+        """Up to `limit` archived messages older than `before`, newest first"""
+        page: List[dict] = []
+        for label in reversed(await self.months(room_id)):
+            if before is not None and label > month_label(before[0]):
+                continue
+            rows, keys = await self._load(room_id, label)
+            end = len(rows) if before is None else bisect_left(keys, before)
+            start = max(0, end - (limit - len(page)))
+            page.extend(reversed(rows[start:end]))
+            if len(page) >= limit:
+                break
+        return page
+
+    async def get_after(self, room_id: int, limit: int, after: Key) -> List[dict]:
+        """Up to `limit` archived messages newer than `after`, oldest first"""
+        page: List[dict] = []
+        first = month_label(after[0])
+        for label in await self.months(room_id):
+            if label < first:
+                continue
+            rows, keys = await self._load(room_id, label)
+            start = bisect_right(keys, after)
+            page.extend(rows[start:start + limit - len(page)])
+            if len(page) >= limit:
+                break
+        return page
+
+    async def iter_months(
+        self,
+        room_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> AsyncIterator[List[dict]]:
+        """Archived messages from `since` (inclusive) to `until`
+        (exclusive), oldest first, a month per item. Bypasses the cache so
+        an export doesn't push out the months readers are paging through."""
+        for label in await self.months(room_id):
+            if since is not None and label < month_label(since):
+                continue
+            if until is not None and label > month_label(until):
+                break
+            rows = await asyncio.to_thread(self.read_month, room_id, label)
+            rows = [
+                row for row in rows
+                if (since is None or row["created_at"] >= since)
+                and (until is None or row["created_at"] < until)
+            ]
+            if rows:
+                yield rows
+
+
+message_archive = MessageArchive()
+
+
+async def archive_messages(
+    before: datetime,
+    archive: MessageArchive = message_archive,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+    batch_size: int = settings.ARCHIVE_DELETE_BATCH_SIZE
+) -> int:
+    """Move messages created before `before` into the archive, a month at a
+    time, oldest first. Returns how many were moved.
+
+    A month's rows are only deleted once every room's file is on disk, and
+    oldest first, so readers merging the two tiers never see a gap. New
+    messages are always stamped with the current time, so nothing lands
+    in a month while it is being archived.
+    """
+    archived = 0
+    while True:
+        async with session_factory() as db:
+            # IDs are time ordered, so this is a primary key lookup
+            oldest = await db.scalar(
+                select(Messages.created_at).order_by(Messages.id).limit(1)
+            )
+        if oldest is None or oldest >= before:
+            return archived
+        moved = await _archive_until(
+            min(add_months(month_start(oldest), 1), before),
+            archive, session_factory, batch_size
+        )
+        if not moved:
+            logger.warning(
+                "Oldest message could not be archived",
+                extra={"event": "archive.stuck", "created_at": oldest.isoformat()}
+            )
+            return archived
+        archived += moved
+
+
+async def _archive_until(
+    end: datetime,
+    archive: MessageArchive,
+    session_factory: Callable[[], AsyncSession],
+    batch_size: int
+) -> int:
+    # IDs are time ordered, this bound keeps every scan to the cold end of
+    # the primary key
+    bound = min_id_at(timestamp_ms(end))
+    archived = 0
+    async with session_factory() as db:
+        room_ids = (await db.scalars(
+            select(Messages.room_id).distinct().where(
+                Messages.id < bound, Messages.created_at < end
+            )
+        )).all()
+
+    for room_id in room_ids:
+        async with session_factory() as db:
+            result = await db.scalars(
+                select(Messages)
+                .where(Messages.room_id == room_id, Messages.created_at < end)
+                .order_by(Messages.created_at, Messages.id)
+            )
+            rows = [message_to_dict(message) for message in result]
+        for label, month in groupby(rows, key=lambda row: month_label(row["created_at"])):
+            await asyncio.to_thread(archive.write_month, room_id, label, list(month))
+        archived += len(rows)
+
+    async with session_factory() as db:
+        while True:
+            ids = (await db.scalars(
+                select(Messages.id)
+                .where(Messages.id < bound, Messages.created_at < end)
+                .order_by(Messages.id)
+                .limit(batch_size)
+            )).all()
+            if not ids:
+                break
+            await db.execute(delete(Messages).where(Messages.id.in_(ids)))
+            await db.commit()
+    return archived
+
+
+class ArchiveMaintenance:
+    """Background task that archives every month older than
+    ARCHIVE_AFTER_MONTHS, once per ARCHIVE_INTERVAL_SECONDS"""
+
+    def __init__(
+        self,
+        archive: MessageArchive = message_archive,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal
+    ):
+        self.archive = archive
+        self.session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        # Counters
+        self.archived_rows = 0
+        self.runs = 0
+
+    @staticmethod
+    def cutoff(months: int, now: Optional[datetime] = None) -> datetime:
+        """Start of the oldest month kept in the database"""
+        return add_months(month_start(now or datetime.utcnow()), -months)
+
+    def start(self) -> None:
+        if settings.ARCHIVE_AFTER_MONTHS <= 0 or settings.ARCHIVE_INTERVAL_SECONDS <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(
+        self, months: int = settings.ARCHIVE_AFTER_MONTHS, now: Optional[datetime] = None
+    ) -> int:
+        """Archive every month older than `months`, 0 archives nothing"""
+        if months <= 0:
+            return 0
+        archived = await archive_messages(
+            self.cutoff(months, now), self.archive, self.session_factory
+        )
+        self.archived_rows += archived
+        self.runs += 1
+        if archived:
+            logger.info(
+                "Archived messages",
+                extra={"event": "archive.done", "rows": archived}
+            )
+        return archived
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Archiving failed", extra={"event": "archive.failed"})
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+
+archive_maintenance = ArchiveMaintenance()
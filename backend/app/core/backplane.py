@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional, Set
+
+from app.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - only needed for the redis backplane
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Called with (room_id, frame_type, data) for frames published by other nodes
+FrameHandler = Callable[[int, Optional[str], str], None]
+
+
+class Backplane:
+    """Carries room broadcasts and presence between server processes.
+
+    ConnectionManager delivers frames to its own sockets directly and
+    publishes them here so other nodes can deliver them to theirs. Nodes
+    only receive frames for rooms they have subscribed to, i.e. rooms with
+    at least one local connection.
+    """
+
+    # Whether other processes may publish to the same rooms
+    distributed = False
+
+    def __init__(self, node_id: Optional[str] = None):
+        self.node_id = node_id or uuid.uuid4().hex[:12]
+        self._handler: Optional[FrameHandler] = None
+
+    async def start(self, handler: FrameHandler) -> None:
+        self._handler = handler
+
+    async def stop(self) -> None:
+        self._handler = None
+
+    async def subscribe(self, room_id: int) -> None:
+        raise NotImplementedError
+
+    async def unsubscribe(self, room_id: int) -> None:
+        raise NotImplementedError
+
+    async def publish(self, room_id: int, frame_type: Optional[str], data: str) -> None:
+        raise NotImplementedError
+
+    async def join(self, room_id: int, user_id: int) -> None:
+        raise NotImplementedError
+
+    async def leave(self, room_id: int, user_id: int) -> None:
+        raise NotImplementedError
+
+    async def get_presence(self, room_id: int) -> List[int]:
+        """User IDs connected to the room on any node"""
+        raise NotImplementedError
+
+
+class InMemoryHub:
+    """Shared state for InMemoryBackplane instances living in one process"""
+
+    def __init__(self):
+        self.nodes: Dict[str, "InMemoryBackplane"] = {}
+        # Structure: {room_id: {node_id: {user_id: connection count}}}
+        self.presence: Dict[int, Dict[str, Dict[int, int]]] = {}
+
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane.
+
+    With the default private hub it only tracks presence. Several instances
+    sharing a hub behave like separate nodes, which is handy for tests.
+    """
+
+    def __init__(self, hub: Optional[InMemoryHub] = None, node_id: Optional[str] = None):
+        super().__init__(node_id)
+        self.distributed = hub is not None
+        self.hub = hub or InMemoryHub()
+        self.rooms: Set[int] = set()
+
+    async def start(self, handler: FrameHandler) -> None:
+        await super().start(handler)
+        self.hub.nodes[self.node_id] = self
+
+    async def stop(self) -> None:
+        self.hub.nodes.pop(self.node_id, None)
+        await super().stop()
+
+    async def subscribe(self, room_id: int) -> None:
+        self.rooms.add(room_id)
+
+    async def unsubscribe(self, room_id: int) -> None:
+        self.rooms.discard(room_id)
+
+    async def publish(self, room_id: int, frame_type: Optional[str], data: str) -> None:
+        for node_id, node in list(self.hub.nodes.items()):
+            if node_id != self.node_id and room_id in node.rooms and node._handler:
+                node._handler(room_id, frame_type, data)
+
+    async def join(self, room_id: int, user_id: int) -> None:
+        users = self.hub.presence.setdefault(room_id, {}).setdefault(self.node_id, {})
+        users[user_id] = users.get(user_id, 0) + 1
+
+    async def leave(self, room_id: int, user_id: int) -> None:
+        nodes = self.hub.presence.get(room_id, {})
+        users = nodes.get(self.node_id, {})
+        if user_id in users:
+            users[user_id] -= 1
+            if users[user_id] <= 0:
+                del users[user_id]
+        if not users:
+            nodes.pop(self.node_id, None)
+        if not nodes:
+            self.hub.presence.pop(room_id, None)
+
+    async def get_presence(self, room_id: int) -> List[int]:
+        users: Set[int] = set()
+        for node_users in self.hub.presence.get(room_id, {}).values():
+            users.update(node_users)
+        return sorted(users)
+
+
+# Decrements a presence count and drops it at zero in one step, so a join
+# from the same node can't land in between and be deleted
+LEAVE_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis pub/sub, one channel per room.
+
+    Presence lives in a hash per room with one field per (user, node) pair.
+    Each node refreshes a liveness key while running, so entries left
+    behind by a crashed node stop counting once its key expires.
+    """
+
+    HEARTBEAT_INTERVAL = 10
+    NODE_TTL = 30
+    distributed = True
+
+    def __init__(
+        self,
+        client=None,
+        prefix: str = "chat:",
+        node_id: Optional[str] = None,
+    ):
+        super().__init__(node_id)
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("The redis backplane requires the 'redis' package")
+            client = aioredis.from_url(settings.REDIS_URL)
+        self.redis = client
+        self.prefix = prefix
+        self._leave = client.register_script(LEAVE_SCRIPT)
+        self._pubsub = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _room_channel(self, room_id: int) -> str:
+        return f"{self.prefix}room:{room_id}"
+
+    def _presence_key(self, room_id: int) -> str:
+        return f"{self.prefix}presence:{room_id}"
+
+    def _node_key(self, node_id: str) -> str:
+        return f"{self.prefix}node:{node_id}"
+
+    async def start(self, handler: FrameHandler) -> None:
+        await super().start(handler)
+        await self.redis.set(self._node_key(self.node_id), 1, ex=self.NODE_TTL)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        # A subscription of our own keeps the pub/sub connection open while
+        # no rooms are subscribed
+        await self._pubsub.subscribe(self._node_key(self.node_id))
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.redis.delete(self._node_key(self.node_id))
+        await super().stop()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_INTERVAL)
+            await self.redis.set(self._node_key(self.node_id), 1, ex=self.NODE_TTL)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Backplane receive error", extra={"event": "backplane.error"})
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            # A bad frame must not end the listener, or this node would
+            # silently stop receiving every room
+            try:
+                self._dispatch(message["data"])
+            except Exception:
+                logger.exception(
+                    "Dropping undeliverable backplane frame",
+                    extra={"event": "backplane.bad_frame"}
+                )
+
+    def _dispatch(self, payload) -> None:
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8")
+        header, _, data = payload.partition("\n")
+        origin, room_id, frame_type = header.split(":", 2)
+        # Our own frames were already delivered locally
+        if origin != self.node_id and self._handler:
+            self._handler(int(room_id), frame_type or None, data)
+
+    async def subscribe(self, room_id: int) -> None:
+        await self._pubsub.subscribe(self._room_channel(room_id))
+
+    async def unsubscribe(self, room_id: int) -> None:
+        await self._pubsub.unsubscribe(self._room_channel(room_id))
+
+    async def publish(self, room_id: int, frame_type: Optional[str], data: str) -> None:
+        payload = f"{self.node_id}:{room_id}:{frame_type or ''}\n{data}"
+        await self.redis.publish(self._room_channel(room_id), payload)
+
+    async def join(self, room_id: int, user_id: int) -> None:
+        await self.redis.hincrby(self._presence_key(room_id), f"{user_id}:{self.node_id}", 1)
+
+    async def leave(self, room_id: int, user_id: int) -> None:
+        await self._leave(
+            keys=[self._presence_key(room_id)], args=[f"{user_id}:{self.node_id}"]
+        )
+
+    async def get_presence(self, room_id: int) -> List[int]:
+        fields = await self.redis.hkeys(self._presence_key(room_id))
+        if not fields:
+            return []
+        entries = []
+        for field in fields:
+            if isinstance(field, bytes):
+                field = field.decode("utf-8")
+            user_id, _, node_id = field.partition(":")
+            entries.append((int(user_id), node_id))
+
+        node_ids = sorted({node_id for _, node_id in entries})
+        alive = await self.redis.mget([self._node_key(n) for n in node_ids])
+        live_nodes = {n for n, flag in zip(node_ids, alive) if flag is not None}
+        return sorted({user_id for user_id, node_id in entries if node_id in live_nodes})
+
+
+def create_backplane() -> Backplane:
+    """Build the backplane selected by the BACKPLANE setting"""
+    if settings.BACKPLANE == "redis":
+        return RedisBackplane()
+    return InMemoryBackplane()
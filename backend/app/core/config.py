@@ -1,5 +1,5 @@
 import secrets
-from typing import Any, Optional
+from typing import Any, Dict, Literal, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -27,15 +27,153 @@ class Settings(BaseSettings):
     MYSQL_USER: str
     MYSQL_PASSWORD: str
     
+    # Optional full URLs that take precedence over the MySQL settings above,
+    # e.g. sqlite:///./chat.db and sqlite+aiosqlite:///./chat.db
+    DATABASE_URL: Optional[str] = None
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
     @property
     def SQLALCHEMY_DATABASE_URL(self) -> str:
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         return (
             f"mysql+mysqlconnector://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}"
             f"@{self.MYSQL_SERVER}:{self.MYSQL_PORT}/{self.MYSQL_DB}"
         )
+
+    @property
+    def ASYNC_SQLALCHEMY_DATABASE_URL(self) -> str:
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        return (
+            f"mysql+aiomysql://{self.MYSQL_USER}:{self.MYSQL_PASSWORD}"
+            f"@{self.MYSQL_SERVER}:{self.MYSQL_PORT}/{self.MYSQL_DB}"
+        )
         
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
 
+    # Password hashing. bcrypt runs on its own thread pool so logins don't
+    # stall the event loop; requests beyond PASSWORD_HASH_MAX_PENDING queued
+    # or running hashes are rejected with a 503.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # Re-hash a stored password on login when its cost differs from
+    # BCRYPT_ROUNDS
+    PASSWORD_REHASH_ON_LOGIN: bool = True
+
+    # Distinguishes processes when assigning message IDs (0-127). Unset,
+    # each process leases a free one at startup: through Redis with the
+    # redis backplane, otherwise through lock files, which only covers
+    # workers on the same host.
+    NODE_ID: Optional[int] = None
+
+    # Write-behind message persistence
+    MESSAGE_FLUSH_BATCH_SIZE: int = 500
+    MESSAGE_FLUSH_INTERVAL_MS: int = 50
+    MESSAGE_QUEUE_MAX: int = 10000
+    MESSAGE_FLUSH_RETRIES: int = 3
+    # Most messages accepted by one POST /rooms/{room_id}/messages/batch
+    MESSAGE_BATCH_MAX_SIZE: int = 1000
+    # Rows fetched per round trip while streaming a room export
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Message search: "fulltext" uses MySQL's FULLTEXT index, "memory" an
+    # inverted index built in process at startup (for tests and single
+    # process deployments). Unset picks fulltext on MySQL, memory otherwise.
+    SEARCH_BACKEND: Optional[Literal["fulltext", "memory"]] = None
+    # Shorter words aren't searchable; keep in step with MySQL's
+    # innodb_ft_min_token_size
+    SEARCH_MIN_TOKEN_LENGTH: int = 3
+
+    # History archival. Whole months of messages older than
+    # ARCHIVE_AFTER_MONTHS are moved out of the messages table into gzip
+    # NDJSON files under ARCHIVE_DIR, one per room and month; history and
+    # exports read them back transparently. 0 keeps everything in the
+    # database. ARCHIVE_DIR must be shared by every worker, and only one of
+    # them should run the maintenance task (ARCHIVE_INTERVAL_SECONDS > 0),
+    # or run scripts/archive_messages.py from cron instead.
+    ARCHIVE_AFTER_MONTHS: int = 0
+    ARCHIVE_DIR: str = "archive"
+    ARCHIVE_INTERVAL_SECONDS: float = 3600
+    # Archived rows deleted from the database per statement
+    ARCHIVE_DELETE_BATCH_SIZE: int = 1000
+    # Decoded room-months kept in memory for paging through archives
+    ARCHIVE_CACHE_MAX_MONTHS: int = 64
+
+    # Caches for resolved users, room existence and room membership.
+    # Negative results are kept briefly since other workers can't
+    # invalidate them.
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_NEGATIVE_TTL_SECONDS: int = 5
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    # Verified JWT claims, so repeat requests skip the signature check.
+    # 0 disables it.
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000
+    # Serialized pages of GET /chat/rooms. Creating a room clears them on
+    # the worker that created it; other workers catch up within the TTL.
+    ROOM_LIST_CACHE_TTL_SECONDS: int = 10
+    ROOM_LIST_CACHE_MAX_ENTRIES: int = 1000
+
+    # In-process buffers of each active room's newest messages
+    RECENT_MESSAGES_PER_ROOM: int = 100
+    RECENT_MESSAGES_MAX_ROOMS: int = 10000
+    RECENT_MESSAGES_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Cross-process fan-out: "memory" for a single process, "redis" to
+    # share rooms and presence between workers
+    BACKPLANE: Literal["memory", "redis"] = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Where logged out tokens are remembered: "memory" for a single
+    # process, "redis" so every worker sees them and they survive restarts
+    TOKEN_REVOCATION_STORE: Literal["memory", "redis"] = "memory"
+
+    # Token bucket limits on posting messages, per user and per room
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: Literal["memory", "redis"] = "memory"
+    RATE_LIMIT_USER_MESSAGES_PER_SECOND: float = 5
+    RATE_LIMIT_USER_BURST: int = 20
+    RATE_LIMIT_ROOM_MESSAGES_PER_SECOND: float = 100
+    RATE_LIMIT_ROOM_BURST: int = 200
+    # Messages sent through the batch endpoint, per user. The burst should
+    # be at least MESSAGE_BATCH_MAX_SIZE or the largest batches never pass
+    RATE_LIMIT_BATCH_MESSAGES_PER_SECOND: float = 100
+    RATE_LIMIT_BATCH_BURST: int = 1000
+    # What a WebSocket client over its limit gets: "reject" drops the
+    # message with an error frame, "delay" holds its receive loop until a
+    # token is free (up to RATE_LIMIT_MAX_DELAY_SECONDS, then rejects)
+    RATE_LIMIT_WS_POLICY: Literal["reject", "delay"] = "reject"
+    RATE_LIMIT_MAX_DELAY_SECONDS: float = 2
+
+    # Logging. Records are written as JSON (or plain text) by a background
+    # thread; LOG_QUEUE_SIZE records may wait before new ones are dropped.
+    LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    LOG_QUEUE_SIZE: int = 10000
+    # Fraction of records to keep per event, e.g. {"ws.connected": 0.01}
+    LOG_SAMPLE_RATES: Dict[str, float] = {}
+
+    # Time every SQL statement for /metrics. Engine events add CPU to each
+    # statement (see scripts/bench_metrics_overhead.py); turn off if that
+    # matters more than the query histogram.
+    METRICS_QUERY_TIMING: bool = True
+
+    # WebSocket settings
+    WS_SEND_QUEUE_SIZE: int = 256
+    # What to do when a client's outbound queue is full:
+    # "disconnect" drops the client, "coalesce" discards stale frames
+    WS_OVERFLOW_POLICY: Literal["disconnect", "coalesce"] = "disconnect"
+    # Most missed messages sent to a client reconnecting with last_seen_id
+    WS_REPLAY_MAX_MESSAGES: int = 200
+    # The server sends {"type": "ping"} this often; clients answer with
+    # {"type": "pong"} (any inbound frame counts). Connections silent for
+    # WS_IDLE_TIMEOUT_SECONDS are closed and removed from their room.
+    WS_PING_INTERVAL_SECONDS: float = 20
+    WS_IDLE_TIMEOUT_SECONDS: float = 60
+    # Most rooms a single /ws connection may subscribe to
+    WS_MAX_SUBSCRIPTIONS: int = 100
+
 
 settings = Settings()  # type: ignore
@@ -1,20 +1,100 @@
-from sqlalchemy import create_engine
+from time import perf_counter
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from .config import settings
+from .metrics import Histogram
 import os
 
+pool_checkout_wait = Histogram(
+    "chat_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection",
+    ("engine",),
+)
+query_duration = Histogram(
+    "chat_db_query_duration_seconds",
+    "Database statement execution time",
+    ("engine",),
+)
+
+
+class _TimedCheckout:
+    """Pool mixin recording how long each checkout waits for a connection"""
+
+    _wait_metric = pool_checkout_wait.labels("sync")
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self._wait_metric.observe(perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    _wait_metric = pool_checkout_wait.labels("async")
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool configuration for the given database URL"""
+    if url.startswith("sqlite"):
+        # SQLite uses its own pool classes that don't take sizing arguments
+        return {}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_pre_ping": True,  # Enable connection pool pre-ping
+        "pool_size": 5,  # Set connection pool size
+        "max_overflow": 10,  # Maximum number of connections to overflow
+    }
+
+
+def instrument_queries(sync_engine, label: str) -> None:
+    """Record statement timings for an engine in query_duration"""
+    metric = query_duration.labels(label)
+
+    # The execution context is per statement, cheaper to stash the start
+    # time on than conn.info
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metric.observe(perf_counter() - context._query_start)
+
+
 # Create SQLAlchemy engine with MySQL-specific configuration
 engine = create_engine(
     settings.SQLALCHEMY_DATABASE_URL,
-    pool_pre_ping=True,  # Enable connection pool pre-ping
-    pool_size=5,  # Set connection pool size
-    max_overflow=10  # Maximum number of connections to overflow
+    **engine_options(settings.SQLALCHEMY_DATABASE_URL)
+)
+
+# Async engine used by the WebSocket and chat routes so queries don't block
+# the event loop
+async_engine = create_async_engine(
+    settings.ASYNC_SQLALCHEMY_DATABASE_URL,
+    **engine_options(settings.ASYNC_SQLALCHEMY_DATABASE_URL, is_async=True)
 )
 
+if settings.METRICS_QUERY_TIMING:
+    instrument_queries(engine, "sync")
+    instrument_queries(async_engine.sync_engine, "async")
+
 # Create SessionLocal class for database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Objects stay usable after commit, lazy refreshes aren't possible with
+# async sessions
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # Create Base class for declarative models
 Base = declarative_base()
 
@@ -24,4 +104,10 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,322 @@
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import desc, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.ingest import message_writer
+from app.models import Messages
+
+# Rough per-entry cost of the dict, its datetime and ints, on top of the text
+ENTRY_OVERHEAD = 400
+
+Key = Tuple[datetime, int]
+
+
+def message_key(message: dict) -> Key:
+    """Ordering key matching the (created_at, id) history index"""
+    return message["created_at"], message["id"]
+
+
+def message_to_dict(message) -> dict:
+    """Plain dict of a Messages row, the shape kept in the buffer"""
+    return {
+        "id": message.id,
+        "text": message.text,
+        "sender_id": message.sender_id,
+        "room_id": message.room_id,
+        "created_at": message.created_at,
+    }
+
+
+def history_query(
+    room_id: int,
+    limit: int,
+    before: Optional[Key] = None,
+    after: Optional[Key] = None
+):
+    """Keyset page of a room's messages.
+
+    Newest first, or oldest first when paging forward with `after`. Both
+    walk the (room_id, created_at, id) index, so a page costs the same no
+    matter how deep it is.
+    """
+    query = select(Messages).where(Messages.room_id == room_id)
+    if before is not None:
+        created_at, message_id = before
+        # The leading bound lets the index range scan, the OR breaks ties
+        query = query.where(
+            Messages.created_at <= created_at,
+            or_(Messages.created_at < created_at, Messages.id < message_id)
+        )
+    if after is not None:
+        created_at, message_id = after
+        query = query.where(
+            Messages.created_at >= created_at,
+            or_(Messages.created_at > created_at, Messages.id > message_id)
+        )
+        return query.order_by(Messages.created_at, Messages.id).limit(limit)
+    return query.order_by(
+        desc(Messages.created_at), desc(Messages.id)
+    ).limit(limit)
+
+
+async def oldest_message_key(db: AsyncSession, room_id: int) -> Optional[Key]:
+    """Key of the room's oldest message in the database, None if it has
+    none. One step into the history index."""
+    row = (await db.execute(
+        select(Messages.created_at, Messages.id)
+        .where(Messages.room_id == room_id)
+        .order_by(Messages.created_at, Messages.id)
+        .limit(1)
+    )).first()
+    return None if row is None else (row.created_at, row.id)
+
+
+class RoomBuffer:
+    def __init__(self):
+        # Oldest first
+        self.messages: List[dict] = []
+        # Whether the buffer holds the room's entire history
+        self.complete = False
+        # Still being filled from the database, not safe to serve reads
+        self.warming = True
+        self.size = 0
+
+
+class RecentMessages:
+    """Per-room ring buffers of the newest messages, in process.
+
+    Rooms are only buffered once they have been warmed from the database,
+    after that every write path appends to them. Cold rooms are evicted
+    least recently used first when the room count or the estimated memory
+    goes over budget.
+    """
+
+    def __init__(
+        self,
+        per_room: int = settings.RECENT_MESSAGES_PER_ROOM,
+        max_rooms: int = settings.RECENT_MESSAGES_MAX_ROOMS,
+        max_bytes: int = settings.RECENT_MESSAGES_MAX_BYTES,
+    ):
+        self.per_room = per_room
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self._rooms: "OrderedDict[int, RoomBuffer]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(message: dict) -> int:
+        return sys.getsizeof(message["text"]) + ENTRY_OVERHEAD
+
+    def __contains__(self, room_id: int) -> bool:
+        return room_id in self._rooms
+
+    def append(self, message: dict) -> None:
+        """Record a new message if its room is buffered"""
+        buffer = self._rooms.get(message["room_id"])
+        if buffer is None:
+            return
+        self._insert(buffer, message)
+        self._trim(buffer)
+        self._enforce_budget()
+
+    def _insert(self, buffer: RoomBuffer, message: dict) -> None:
+        messages = buffer.messages
+        key = message_key(message)
+        # Messages almost always arrive in order, so scan from the end
+        index = len(messages)
+        while index > 0 and message_key(messages[index - 1]) > key:
+            index -= 1
+        if index > 0 and messages[index - 1]["id"] == message["id"]:
+            return
+        messages.insert(index, message)
+        size = self._entry_size(message)
+        buffer.size += size
+        self.bytes += size
+
+    def _trim(self, buffer: RoomBuffer) -> None:
+        overflow = len(buffer.messages) - self.per_room
+        if overflow > 0:
+            for message in buffer.messages[:overflow]:
+                size = self._entry_size(message)
+                buffer.size -= size
+                self.bytes -= size
+            del buffer.messages[:overflow]
+            buffer.complete = False
+
+    def _enforce_budget(self) -> None:
+        while self._rooms and (
+            len(self._rooms) > self.max_rooms or self.bytes > self.max_bytes
+        ):
+            _, buffer = self._rooms.popitem(last=False)
+            self.bytes -= buffer.size
+            self.evictions += 1
+
+    def begin_warm(self, room_id: int) -> None:
+        """Start buffering a room; writes from now on are kept"""
+        if room_id not in self._rooms:
+            self._rooms[room_id] = RoomBuffer()
+
+    def finish_warm(self, room_id: int, messages: Iterable[dict], complete: bool) -> None:
+        """Merge the newest messages loaded from storage into the buffer.
+
+        `complete` says whether storage returned the room's whole history.
+        """
+        buffer = self._rooms.get(room_id)
+        if buffer is None:
+            # Evicted while the query was running
+            return
+        for message in messages:
+            self._insert(buffer, message)
+        buffer.complete = complete and len(buffer.messages) <= self.per_room
+        self._trim(buffer)
+        buffer.warming = False
+        self._rooms.move_to_end(room_id)
+        self._enforce_budget()
+
+    def evict(self, room_id: int) -> None:
+        buffer = self._rooms.pop(room_id, None)
+        if buffer is not None:
+            self.bytes -= buffer.size
+
+    def _ready(self, room_id: int) -> Optional[RoomBuffer]:
+        buffer = self._rooms.get(room_id)
+        if buffer is None or buffer.warming:
+            return None
+        self._rooms.move_to_end(room_id)
+        return buffer
+
+    def get_before(
+        self, room_id: int, limit: int, before: Optional[Key] = None
+    ) -> Optional[List[dict]]:
+        """Up to `limit` messages older than `before`, newest first.
+
+        None when the buffer can't answer for certain and the caller has to
+        go to the database.
+        """
+        buffer = self._ready(room_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        messages = buffer.messages
+        end = len(messages)
+        if before is not None:
+            while end > 0 and message_key(messages[end - 1]) >= before:
+                end -= 1
+        start = max(0, end - limit)
+        # Only serve if nothing older could be missing from the page
+        if end - start < limit and not buffer.complete:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return messages[start:end][::-1]
+
+    def get_after(self, room_id: int, limit: int, after: Key) -> Optional[List[dict]]:
+        """Up to `limit` messages newer than `after`, oldest first"""
+        buffer = self._ready(room_id)
+        if buffer is None:
+            self.misses += 1
+            return None
+        messages = buffer.messages
+        # The buffer must reach back to the cursor to know nothing is missing
+        if not buffer.complete and (
+            not messages or message_key(messages[0]) > after
+        ):
+            self.misses += 1
+            return None
+        start = len(messages)
+        while start > 0 and message_key(messages[start - 1]) > after:
+            start -= 1
+        self.hits += 1
+        return messages[start:start + limit]
+
+    def find_key(self, room_id: int, message_id: int) -> Optional[Key]:
+        """Ordering key of a buffered message, looked up by ID"""
+        buffer = self._rooms.get(room_id)
+        if buffer is None or buffer.warming:
+            return None
+        for message in reversed(buffer.messages):
+            if message["id"] == message_id:
+                return message_key(message)
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "rooms": len(self._rooms),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+recent_messages = RecentMessages()
+
+
+async def warm_room(db: AsyncSession, room_id: int) -> None:
+    """Load a room's newest messages into the buffer if it isn't there.
+
+    Writes that happen while the query runs are captured by the buffer, and
+    rows still waiting in the write-behind queue are merged in.
+    """
+    if room_id in recent_messages:
+        return
+    recent_messages.begin_warm(room_id)
+    try:
+        pending = message_writer.pending_rows(room_id)
+        result = await db.scalars(
+            history_query(room_id, recent_messages.per_room)
+        )
+        rows = [message_to_dict(message) for message in result]
+    except Exception:
+        recent_messages.evict(room_id)
+        raise
+    recent_messages.finish_warm(
+        room_id, rows + pending, complete=len(rows) < recent_messages.per_room
+    )
+
+
+async def load_missed(
+    db: AsyncSession, room_id: int, last_seen_id: int, limit: int
+) -> Optional[List[dict]]:
+    """Up to `limit` messages posted after `last_seen_id`, oldest first.
+
+    Served from the buffer when it reaches back far enough, otherwise with
+    a range scan on the history index. None if the message is unknown.
+    """
+    key = recent_messages.find_key(room_id, last_seen_id)
+    if key is None:
+        for row in message_writer.pending_rows(room_id):
+            if row["id"] == last_seen_id:
+                key = message_key(row)
+    if key is None:
+        row = (await db.execute(
+            select(Messages.created_at).where(
+                Messages.id == last_seen_id,
+                Messages.room_id == room_id
+            )
+        )).first()
+        if row is None:
+            return None
+        key = (row.created_at, last_seen_id)
+
+    messages = recent_messages.get_after(room_id, limit, key)
+    if messages is not None:
+        return messages
+
+    result = await db.scalars(history_query(room_id, limit, after=key))
+    merged = {message.id: message_to_dict(message) for message in result}
+    # Rows still in the write-behind queue aren't visible to the query
+    for row in message_writer.pending_rows(room_id):
+        if message_key(row) > key:
+            merged.setdefault(row["id"], row)
+    return sorted(merged.values(), key=message_key)[:limit]
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.core.ids import SnowflakeGenerator
+from app.models import Messages
+
+logger = logging.getLogger(__name__)
+
+# Node 0 until app.core.nodes leases this process its own at startup
+message_ids = SnowflakeGenerator(settings.NODE_ID or 0)
+
+
+class MessageWriter:
+    """Write-behind pipeline that persists chat messages in bulk.
+
+    Callers get a fully formed row (ID and timestamp assigned in-process)
+    that can be broadcast immediately, while a background task flushes
+    queued rows as one multi-row INSERT whenever MESSAGE_FLUSH_BATCH_SIZE
+    rows are waiting or MESSAGE_FLUSH_INTERVAL_MS has passed.
+
+    Durability: a row is only durable once the future returned by submit()
+    resolves. Failed flushes are retried with backoff; if every retry fails
+    the futures carry the error. A batch rejected by a constraint is
+    retried row by row, so only the offending rows fail. Rows still buffered when the process dies
+    without a graceful stop() are lost, so at most one flush interval (or
+    one full queue under backpressure) of messages is at risk.
+
+    Backpressure: the queue holds at most MESSAGE_QUEUE_MAX rows. submit()
+    waits for space, which stalls the sender's receive loop rather than
+    growing memory without bound.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession] = AsyncSessionLocal,
+        batch_size: int = settings.MESSAGE_FLUSH_BATCH_SIZE,
+        flush_interval: float = settings.MESSAGE_FLUSH_INTERVAL_MS / 1000,
+        max_pending: int = settings.MESSAGE_QUEUE_MAX,
+        retries: int = settings.MESSAGE_FLUSH_RETRIES,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Rows accepted but not yet committed, with their futures, by ID
+        self._unflushed: Dict[int, Tuple[dict, asyncio.Future]] = {}
+        # Called with the rows of each committed batch
+        self.listeners: List[Callable[[List[dict]], None]] = []
+        # Counters
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_rows = 0
+
+    @staticmethod
+    def build(text: str, sender_id: int, room_id: int) -> dict:
+        """Create a message row with its ID and timestamp assigned.
+
+        The timestamp is truncated to whole seconds, the precision MySQL's
+        DATETIME stores, so the (created_at, id) history keys of a row are
+        the same in the database, the recent-messages buffer and on the
+        wire.
+        """
+        return {
+            "id": message_ids.next_id(),
+            "text": text,
+            "sender_id": sender_id,
+            "room_id": room_id,
+            "created_at": datetime.utcnow().replace(microsecond=0),
+        }
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def pending_rows(self, room_id: int) -> List[dict]:
+        """Rows for the room that readers can't see in the database yet"""
+        return [row for row, _ in self._unflushed.values() if row["room_id"] == room_id]
+
+    async def wait_flushed(self, room_id: int) -> None:
+        """Wait until every row accepted so far for the room has been
+        committed (or has failed), at most about one flush interval"""
+        futures = [
+            future for row, future in self._unflushed.values()
+            if row["room_id"] == room_id
+        ]
+        if futures:
+            await asyncio.wait(futures)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, row: dict) -> asyncio.Future:
+        """Queue a row for persistence, waiting while the queue is full.
+
+        Returns a future that resolves once the row has been committed.
+        """
+        if self._stopping or self._task is None:
+            raise RuntimeError("Message writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        self._unflushed[row["id"]] = (row, future)
+        return future
+
+    async def stop(self) -> None:
+        """Stop accepting rows and flush everything already queued"""
+        if self._task is None:
+            return
+        self._stopping = True
+        # Sentinel tells the flush loop to exit once the queue is drained
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            done = False
+            while len(batch) < self.batch_size:
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    item = self._queue.get_nowait()
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if done:
+                return
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        rows = [row for row, _ in batch]
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.session_factory() as db:
+                    # executemany with explicit IDs is sent as multi-row INSERTs
+                    await db.execute(insert(Messages), rows)
+                    await db.commit()
+                break
+            except IntegrityError as e:
+                # Retrying the statement can't succeed. One bad row (e.g. a
+                # duplicate ID) fails the whole batch, so retry row by row
+                # to keep the rest.
+                if len(batch) > 1:
+                    for item in batch:
+                        await self._flush([item])
+                    return
+                self._fail(batch, e)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    self._fail(batch, e)
+                    return
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+        self.flushed_rows += len(rows)
+        self.flushed_batches += 1
+        for row, future in batch:
+            self._unflushed.pop(row["id"], None)
+            if not future.done():
+                future.set_result(row["id"])
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception:
+                logger.exception(
+                    "Flush listener failed", extra={"event": "messages.listener_failed"}
+                )
+
+    def _fail(self, batch: List[Tuple[dict, asyncio.Future]], error: Exception):
+        logger.error(
+            "Dropping %d messages after failed flush", len(batch),
+            exc_info=error,
+            extra={"event": "messages.flush_failed", "rows": len(batch)}
+        )
+        self.failed_rows += len(batch)
+        for row, future in batch:
+            self._unflushed.pop(row["id"], None)
+            if not future.done():
+                future.set_exception(error)
+                # Already reported above, don't warn again for callers
+                # that never await the future
+                future.exception()
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import tempfile
+import uuid
+from typing import Optional
+
+from app.core.config import settings
+from app.core.ids import MAX_NODE_ID, SnowflakeGenerator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - only needed for the redis lease
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class NodeIdLease:
+    """Gives this process a message ID node that no other running process
+    holds, so two processes can never assign the same ID.
+
+    start() claims an ID and sets it on the generator; stop() gives it up.
+    """
+
+    def __init__(self):
+        self.node_id: Optional[int] = None
+        self._generator: Optional[SnowflakeGenerator] = None
+
+    async def start(self, generator: SnowflakeGenerator) -> None:
+        self._generator = generator
+        self._assign(await self.acquire())
+
+    async def stop(self) -> None:
+        if self.node_id is not None:
+            await self.release()
+            self.node_id = None
+
+    def _assign(self, node_id: int) -> None:
+        self.node_id = node_id
+        self._generator.node_id = node_id
+        logger.info(
+            "Assigning message IDs as node %d", node_id,
+            extra={"event": "node_id.acquired", "node_id": node_id}
+        )
+
+    async def acquire(self) -> int:
+        raise NotImplementedError
+
+    async def release(self) -> None:
+        pass
+
+
+class FixedNodeId(NodeIdLease):
+    """The NODE_ID setting, for deployments that assign IDs themselves"""
+
+    def __init__(self, node_id: int):
+        super().__init__()
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"NODE_ID must be between 0 and {MAX_NODE_ID}")
+        self.fixed_id = node_id
+
+    async def acquire(self) -> int:
+        return self.fixed_id
+
+
+class LocalNodeIdLease(NodeIdLease):
+    """IDs leased through lock files, for workers sharing one host.
+
+    Holds an exclusive flock on {directory}/chat-node-{id}.lock. The OS
+    drops the lock when the process exits, however it exits, so nothing
+    needs renewing or cleaning up.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        super().__init__()
+        self.directory = directory or tempfile.gettempdir()
+        self._file = None
+
+    async def acquire(self) -> int:
+        if fcntl is None:
+            logger.warning(
+                "File locks unavailable, using node ID 0; set NODE_ID per worker",
+                extra={"event": "node_id.unleased"}
+            )
+            return 0
+        for node_id in range(MAX_NODE_ID + 1):
+            path = os.path.join(self.directory, f"chat-node-{node_id}.lock")
+            f = open(path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            self._file = f
+            return node_id
+        raise RuntimeError(f"All {MAX_NODE_ID + 1} node IDs are held on this host")
+
+    async def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Extends the lease only if we still hold it
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisNodeIdLease(NodeIdLease):
+    """IDs leased through Redis keys, for workers on any number of hosts.
+
+    Each ID is a key set with NX and a TTL, renewed every TTL / 3. Leases
+    of a crashed process expire after LEASE_TTL. If a renewal finds the
+    lease gone (e.g. Redis was unreachable for longer than the TTL), a new
+    ID is leased and the generator switches to it.
+    """
+
+    LEASE_TTL = 60
+
+    def __init__(self, client=None, prefix: str = "chat:"):
+        super().__init__()
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("The redis node ID lease requires the 'redis' package")
+            client = aioredis.from_url(settings.REDIS_URL)
+        self.redis = client
+        self.prefix = prefix
+        self.owner = uuid.uuid4().hex
+        self._renew = client.register_script(RENEW_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._task: Optional[asyncio.Task] = None
+
+    def _key(self, node_id: int) -> str:
+        return f"{self.prefix}node-id:{node_id}"
+
+    async def start(self, generator: SnowflakeGenerator) -> None:
+        await super().start(generator)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await super().stop()
+
+    async def acquire(self) -> int:
+        # Start where the last process left off so restarts don't all race
+        # for the lowest free ID
+        start = await self.redis.incr(f"{self.prefix}node-id:next")
+        for offset in range(MAX_NODE_ID + 1):
+            node_id = (start + offset) % (MAX_NODE_ID + 1)
+            if await self.redis.set(
+                self._key(node_id), self.owner, nx=True, ex=self.LEASE_TTL
+            ):
+                return node_id
+        raise RuntimeError(f"All {MAX_NODE_ID + 1} node IDs are leased")
+
+    async def release(self) -> None:
+        await self._release(keys=[self._key(self.node_id)], args=[self.owner])
+
+    async def renew(self) -> None:
+        held = await self._renew(
+            keys=[self._key(self.node_id)], args=[self.owner, self.LEASE_TTL * 1000]
+        )
+        if not held:
+            logger.error(
+                "Lost the lease on node ID %d", self.node_id,
+                extra={"event": "node_id.lost", "node_id": self.node_id}
+            )
+            self._assign(await self.acquire())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.LEASE_TTL / 3)
+            try:
+                await self.renew()
+            except Exception:
+                logger.exception(
+                    "Renewing the node ID lease failed", extra={"event": "node_id.renew_failed"}
+                )
+
+
+def create_node_id_lease() -> NodeIdLease:
+    """NODE_ID if it is set, otherwise a lease shared through Redis when
+    workers already share it, or through lock files on this host"""
+    if settings.NODE_ID is not None:
+        return FixedNodeId(settings.NODE_ID)
+    if settings.BACKPLANE == "redis":
+        return RedisNodeIdLease()
+    return LocalNodeIdLease()
+
+
+node_id_lease = create_node_id_lease()
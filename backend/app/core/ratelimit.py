@@ -0,0 +1,235 @@
+from time import monotonic
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from app.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - only needed for the redis limiter
+    aioredis = None
+
+
+class RateLimit(NamedTuple):
+    # Tokens added per second
+    rate: float
+    # Bucket capacity, i.e. how many actions may happen back to back
+    burst: int
+
+
+class RateLimiter:
+    """Token buckets, one per key.
+
+    acquire() takes `cost` tokens (one by default) from the key's bucket and
+    returns 0, or returns how many seconds to wait before they will be
+    available without taking any. A cost above the bucket's burst never
+    succeeds.
+    """
+
+    async def acquire(self, key: str, limit: RateLimit, cost: int = 1) -> float:
+        return await self.acquire_all([(key, limit)], cost)
+
+    async def acquire_all(
+        self, buckets: Sequence[Tuple[str, RateLimit]], cost: int = 1
+    ) -> float:
+        """acquire() across several buckets at once: the tokens are taken
+        from every bucket only if each has enough, otherwise nothing is
+        taken and the longest wait is returned"""
+        raise NotImplementedError
+
+
+class InMemoryRateLimiter(RateLimiter):
+    """Per-process buckets.
+
+    A key without a bucket counts as full, so buckets that have refilled
+    are dropped whenever the table grows past `max_keys`.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._prune_at = max_keys
+        # Longest time any bucket seen so far takes to refill
+        self._refill_time = 0.0
+        # Structure: {key: [tokens, updated_at]}
+        self._buckets: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, key: str, limit: RateLimit) -> float:
+        """Synchronous acquire() for callers on the event loop"""
+        rate, burst = limit
+        now = monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if burst < 1:
+                return 1 / rate
+            self._buckets[key] = [burst - 1, now]
+            self._refill_time = max(self._refill_time, burst / rate)
+            if len(self._buckets) > self._prune_at:
+                self._prune(now)
+            return 0.0
+        tokens = bucket[0] + (now - bucket[1]) * rate
+        if tokens > burst:
+            tokens = burst
+        if tokens < 1:
+            return (1 - tokens) / rate
+        # Updated in place, allocating a new entry per check is measurably
+        # slower
+        bucket[0] = tokens - 1
+        bucket[1] = now
+        return 0.0
+
+    def check_all(self, buckets: Sequence[Tuple[str, RateLimit]], cost: int = 1) -> float:
+        """Synchronous acquire_all() for callers on the event loop"""
+        now = monotonic()
+        wait = 0.0
+        levels = []
+        for key, (rate, burst) in buckets:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if tokens < cost:
+                wait = max(wait, (cost - tokens) / rate)
+            levels.append((bucket, tokens))
+        if wait:
+            return wait
+        for (key, (rate, burst)), (bucket, tokens) in zip(buckets, levels):
+            if bucket is None:
+                self._buckets[key] = [tokens - cost, now]
+                self._refill_time = max(self._refill_time, burst / rate)
+            else:
+                bucket[0] = tokens - cost
+                bucket[1] = now
+        if len(self._buckets) > self._prune_at:
+            self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        for key, (_, updated_at) in list(self._buckets.items()):
+            if now - updated_at >= self._refill_time:
+                del self._buckets[key]
+        # Don't rescan on every insert while most buckets are active
+        self._prune_at = max(self.max_keys, len(self._buckets) * 2)
+
+    async def acquire(self, key: str, limit: RateLimit, cost: int = 1) -> float:
+        if cost != 1:
+            return self.check_all([(key, limit)], cost)
+        return self.check(key, limit)
+
+    async def acquire_all(
+        self, buckets: Sequence[Tuple[str, RateLimit]], cost: int = 1
+    ) -> float:
+        return self.check_all(buckets, cost)
+
+
+# Refills the buckets in KEYS (rate and burst of each in ARGV, then the
+# cost) and takes the cost from all of them, or from none if any is short,
+# atomically. Uses the server's clock so every worker agrees on elapsed
+# time.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local cost = tonumber(ARGV[#KEYS * 2 + 1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = tonumber(state[1])
+    if tokens == nil then
+        tokens = burst
+    else
+        tokens = math.min(burst, tokens + (now - tonumber(state[2])) * rate)
+    end
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'updated_at', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000))
+end
+return '0'
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """Buckets shared by every worker, one hash per key.
+
+    Keys expire once their bucket would have refilled.
+    """
+
+    def __init__(self, client=None, prefix: str = "chat:"):
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("The redis rate limiter requires the 'redis' package")
+            client = aioredis.from_url(settings.REDIS_URL)
+        self.redis = client
+        self.prefix = prefix
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def acquire_all(
+        self, buckets: Sequence[Tuple[str, RateLimit]], cost: int = 1
+    ) -> float:
+        wait = await self._script(
+            keys=[f"{self.prefix}ratelimit:{key}" for key, _ in buckets],
+            args=[value for _, limit in buckets for value in limit] + [cost]
+        )
+        return float(wait)
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter selected by the RATE_LIMIT_BACKEND setting"""
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter()
+    return InMemoryRateLimiter()
+
+
+rate_limiter = create_rate_limiter()
+
+user_message_limit = RateLimit(
+    settings.RATE_LIMIT_USER_MESSAGES_PER_SECOND, settings.RATE_LIMIT_USER_BURST
+)
+room_message_limit = RateLimit(
+    settings.RATE_LIMIT_ROOM_MESSAGES_PER_SECOND, settings.RATE_LIMIT_ROOM_BURST
+)
+batch_message_limit = RateLimit(
+    settings.RATE_LIMIT_BATCH_MESSAGES_PER_SECOND, settings.RATE_LIMIT_BATCH_BURST
+)
+
+
+async def message_rate_wait(user_id: int, room_id: int) -> float:
+    """Seconds until the user may post to the room, 0 if they may now.
+
+    Tokens are only taken when both the sender's and the room's bucket
+    have one, so a rejection costs neither: a user over their limit can't
+    drain the room's budget, and a busy room doesn't use up the user's
+    budget for their other rooms.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0.0
+    return await rate_limiter.acquire_all([
+        (f"user:{user_id}", user_message_limit),
+        (f"room:{room_id}", room_message_limit),
+    ])
+
+
+async def batch_rate_wait(user_id: int, count: int) -> float:
+    """message_rate_wait() for a batch of `count` messages.
+
+    Batches draw on a bucket of their own, one token per message, sized
+    for bots and bridges: charged to the per-message buckets, a batch
+    larger than their burst could never be sent.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return 0.0
+    return await rate_limiter.acquire(f"batch:{user_id}", batch_message_limit, count)
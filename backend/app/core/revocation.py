@@ -0,0 +1,99 @@
+import heapq
+import math
+import time
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - only needed for the redis store
+    aioredis = None
+
+
+class RevocationStore:
+    """Remembers revoked tokens until they would have expired anyway.
+
+    Tokens are identified by their `jti` claim. Entries only need to live
+    until the token's `exp`, after which signature checks reject it on
+    their own.
+    """
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        """Revoke a token; `expires_at` is its `exp` as a Unix timestamp"""
+        raise NotImplementedError
+
+    async def is_revoked(self, jti: str) -> bool:
+        raise NotImplementedError
+
+
+class InMemoryRevocationStore(RevocationStore):
+    """Per-process store.
+
+    A min-heap ordered by expiry sits next to the lookup dict, so purging
+    expired entries only ever pops from the front of the heap instead of
+    scanning every revoked token.
+    """
+
+    def __init__(self):
+        # Structure: {jti: expires_at}
+        self._expiry: Dict[str, float] = {}
+        # (expires_at, jti), may hold stale entries for re-revoked tokens
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def _purge(self, now: float) -> None:
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, jti = heapq.heappop(heap)
+            if self._expiry.get(jti) == expires_at:
+                del self._expiry[jti]
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        self._purge(now)
+        if expires_at <= now or self._expiry.get(jti, 0) >= expires_at:
+            return
+        self._expiry[jti] = expires_at
+        heapq.heappush(self._heap, (expires_at, jti))
+
+    async def is_revoked(self, jti: str) -> bool:
+        now = time.time()
+        self._purge(now)
+        return self._expiry.get(jti, 0) > now
+
+
+class RedisRevocationStore(RevocationStore):
+    """Store shared by every worker, one key per revoked token.
+
+    Keys are written with a TTL reaching the token's expiry, so Redis does
+    the purging.
+    """
+
+    def __init__(self, client=None, prefix: str = "chat:"):
+        if client is None:
+            if aioredis is None:
+                raise RuntimeError("The redis revocation store requires the 'redis' package")
+            client = aioredis.from_url(settings.REDIS_URL)
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, jti: str) -> str:
+        return f"{self.prefix}revoked:{jti}"
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        ttl = math.ceil(expires_at - time.time())
+        if ttl > 0:
+            await self.redis.set(self._key(jti), 1, ex=ttl)
+
+    async def is_revoked(self, jti: str) -> bool:
+        return bool(await self.redis.exists(self._key(jti)))
+
+
+def create_revocation_store() -> RevocationStore:
+    """Build the store selected by the TOKEN_REVOCATION_STORE setting"""
+    if settings.TOKEN_REVOCATION_STORE == "redis":
+        return RedisRevocationStore()
+    return InMemoryRevocationStore()
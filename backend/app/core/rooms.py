@@ -0,0 +1,125 @@
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import ChatRooms
+from app.schemas.chat import ChatRoom
+from app.utils import encode_cursor
+
+# (name, id) of the last room on the previous page
+Key = Tuple[str, int]
+
+room_list_adapter = TypeAdapter(List[ChatRoom])
+
+
+class RoomListing(NamedTuple):
+    """A page of the room listing, already serialized"""
+    body: bytes
+    etag: str
+    next_cursor: Optional[str]
+
+
+# Pages of the listing keyed by (version, prefix, after, limit). Creating a
+# room bumps the version, which orphans every cached page at once; the
+# orphans age out of the LRU. Other workers only see new rooms once their
+# own pages expire.
+room_list_cache = TTLCache(
+    "room_listing",
+    settings.ROOM_LIST_CACHE_MAX_ENTRIES,
+    settings.ROOM_LIST_CACHE_TTL_SECONDS
+)
+_version = 0
+
+
+def invalidate_room_listing() -> None:
+    global _version
+    _version += 1
+
+
+def escape_like(value: str, escape: str = "/") -> str:
+    """Escape LIKE wildcards so `value` matches literally"""
+    return (
+        value.replace(escape, escape + escape)
+        .replace("%", escape + "%")
+        .replace("_", escape + "_")
+    )
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with `prefix`"""
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return None
+    return prefix[:-1] + chr(last + 1)
+
+
+def room_list_query(limit: int, after: Optional[Key] = None, prefix: Optional[str] = None):
+    """Keyset page of rooms ordered by name.
+
+    Walks the (name, id) index: a prefix is a range on its leading column
+    and the cursor continues the range, so every page costs the same.
+    """
+    query = select(ChatRooms.id, ChatRooms.name, ChatRooms.created_at)
+    if prefix:
+        # Explicit bounds keep the scan on the index on every database
+        # (SQLite won't use one for LIKE ... ESCAPE), LIKE does the exact
+        # match
+        query = query.where(
+            ChatRooms.name >= prefix,
+            ChatRooms.name.like(escape_like(prefix) + "%", escape="/")
+        )
+        upper = prefix_upper_bound(prefix)
+        if upper is not None:
+            query = query.where(ChatRooms.name < upper)
+    if after is not None:
+        name, room_id = after
+        # The leading bound lets the index range scan, the OR breaks ties
+        query = query.where(
+            ChatRooms.name >= name,
+            or_(ChatRooms.name > name, ChatRooms.id > room_id)
+        )
+    return query.order_by(ChatRooms.name, ChatRooms.id).limit(limit)
+
+
+def build_room_listing(rows: list, limit: int) -> RoomListing:
+    """Serialize a page once, for every client that asks for it"""
+    body = room_list_adapter.dump_json(
+        [ChatRoom(id=row.id, name=row.name, created_at=row.created_at) for row in rows]
+    )
+    next_cursor = None
+    # A full page means there may be more
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1].name, rows[-1].id)
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+    return RoomListing(body, etag, next_cursor)
+
+
+async def load_room_listing(
+    db: AsyncSession,
+    limit: int,
+    after: Optional[Key] = None,
+    prefix: Optional[str] = None
+) -> RoomListing:
+    key = (_version, prefix, after, limit)
+    listing = room_list_cache.get(key)
+    if listing is None:
+        rows = (await db.execute(room_list_query(limit, after, prefix))).all()
+        listing = build_room_listing(rows, limit)
+        room_list_cache.set(key, listing)
+    return listing
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
@@ -0,0 +1,254 @@
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models import Messages
+
+# (score key, id) of the last hit on the previous page
+Key = Tuple[int, int]
+
+# Scores are compared as integers so cursors round-trip exactly; MySQL's
+# relevance is a float that doesn't survive a trip through a decimal string
+SCORE_SCALE = 1_000_000
+
+# InnoDB's default FULLTEXT stopword list, so both backends ignore the same
+# words
+STOPWORDS = frozenset((
+    "a", "about", "an", "are", "as", "at", "be", "by", "com", "de", "en",
+    "for", "from", "how", "i", "in", "is", "it", "la", "of", "on", "or",
+    "that", "the", "this", "to", "was", "what", "when", "where", "who",
+    "will", "with", "und", "www",
+))
+
+_token = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Words of `text` as a FULLTEXT index sees them: lowercased, split on
+    non-word characters, without stopwords or words shorter than
+    SEARCH_MIN_TOKEN_LENGTH"""
+    min_length = settings.SEARCH_MIN_TOKEN_LENGTH
+    return [
+        token for token in _token.findall(text.lower())
+        if len(token) >= min_length and token not in STOPWORDS
+    ]
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct searchable words of a query, in order"""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+class SearchHit(NamedTuple):
+    id: int
+    score: int
+
+    @property
+    def key(self) -> Key:
+        return self.score, self.id
+
+
+class SearchBackend:
+    """Ranked full-text search over message text.
+
+    search() returns hits for messages containing every term, best first
+    (ties newest first), restricted to `room_ids` and continuing after the
+    `after` key of the previous page.
+    """
+
+    async def start(self) -> None:
+        pass
+
+    def index_messages(self, rows: Iterable[dict]) -> None:
+        """Called with rows once they are committed"""
+
+    async def search(
+        self,
+        db: AsyncSession,
+        terms: Sequence[str],
+        room_ids: Sequence[int],
+        limit: int,
+        after: Optional[Key] = None
+    ) -> List[SearchHit]:
+        raise NotImplementedError
+
+
+class FullTextSearch(SearchBackend):
+    """MySQL FULLTEXT index on messages.text, in boolean mode with every
+    term required. InnoDB ranks hits by TF-IDF."""
+
+    async def search(self, db, terms, room_ids, limit, after=None):
+        if not terms or not room_ids:
+            return []
+        relevance = match(Messages.text, against=" ".join("+" + term for term in terms))
+        relevance = relevance.in_boolean_mode()
+        scaled = relevance * SCORE_SCALE
+        score = func.floor(scaled).label("score")
+        query = (
+            select(Messages.id, score)
+            .where(relevance, Messages.room_id.in_(room_ids))
+        )
+        if after is not None:
+            after_score, after_id = after
+            # FLOOR(x) < n is x < n and FLOOR(x) = n is n <= x < n + 1
+            query = query.where(or_(
+                scaled < after_score,
+                and_(scaled < after_score + 1, Messages.id < after_id)
+            ))
+        query = query.order_by(score.desc(), Messages.id.desc()).limit(limit)
+        return [
+            SearchHit(row.id, int(row.score))
+            for row in await db.execute(query)
+        ]
+
+
+class Postings:
+    """Messages containing a term: parallel arrays sorted by message ID,
+    with each message's room and how often the term occurs in it"""
+
+    __slots__ = ("ids", "rooms", "counts")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.rooms = array("i")
+        self.counts = array("B")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, message_id: int, room_id: int, count: int) -> None:
+        count = min(count, 255)
+        if not self.ids or message_id > self.ids[-1]:
+            self.ids.append(message_id)
+            self.rooms.append(room_id)
+            self.counts.append(count)
+            return
+        # Rows from the batch endpoint and the writer can commit slightly
+        # out of ID order
+        i = bisect_left(self.ids, message_id)
+        self.ids.insert(i, message_id)
+        self.rooms.insert(i, room_id)
+        self.counts.insert(i, count)
+
+    def count(self, message_id: int) -> int:
+        """Occurrences in the message, 0 if it doesn't contain the term"""
+        i = bisect_left(self.ids, message_id)
+        if i < len(self.ids) and self.ids[i] == message_id:
+            return self.counts[i]
+        return 0
+
+
+class InMemorySearch(SearchBackend):
+    """Inverted index of message text kept in process.
+
+    Structure: {term: Postings}, about 13 bytes per (term, message) pair.
+    A search scans the postings of its rarest term for messages in the
+    rooms it is scoped to, then looks each one up in the other terms'
+    postings by binary search. Scores follow InnoDB's relevance, sum of
+    tf * idf^2 with idf = log10(messages / matches), so results rank as
+    they do on MySQL.
+
+    Meant for tests and single process deployments: the index is loaded
+    from the database at startup and each worker only sees what it writes
+    afterwards.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession] = AsyncSessionLocal):
+        self.session_factory = session_factory
+        self._postings: Dict[str, Postings] = {}
+        self.documents = 0
+
+    def __len__(self) -> int:
+        return self.documents
+
+    async def start(self) -> None:
+        """Index every message already in the database"""
+        self._postings.clear()
+        self.documents = 0
+        async with self.session_factory() as db:
+            result = await db.stream(
+                select(Messages.id, Messages.room_id, Messages.text)
+                .order_by(Messages.id)
+                .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+            )
+            async for rows in result.partitions():
+                for row in rows:
+                    self.add(row.id, row.room_id, row.text)
+
+    def add(self, message_id: int, room_id: int, text: str) -> None:
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = Postings()
+            postings.add(message_id, room_id, count)
+        self.documents += 1
+
+    def index_messages(self, rows):
+        for row in rows:
+            self.add(row["id"], row["room_id"], row["text"])
+
+    def _score(self, terms: Sequence[str], room_ids: Sequence[int]) -> Dict[int, float]:
+        """Scores of the messages in `room_ids` containing every term"""
+        postings = []
+        for term in terms:
+            term_postings = self._postings.get(term)
+            if term_postings is None:
+                return {}
+            postings.append(term_postings)
+        postings.sort(key=len)
+        # idf^2 of each term
+        weights = [math.log10(self.documents / len(p)) ** 2 for p in postings]
+
+        rarest, weight = postings[0], weights[0]
+        rooms = set(room_ids)
+        scores = {
+            message_id: count * weight
+            for message_id, room_id, count in zip(rarest.ids, rarest.rooms, rarest.counts)
+            if room_id in rooms
+        }
+        for term_postings, weight in zip(postings[1:], weights[1:]):
+            narrowed = {}
+            for message_id, score in scores.items():
+                count = term_postings.count(message_id)
+                if count:
+                    narrowed[message_id] = score + count * weight
+            scores = narrowed
+        return scores
+
+    async def search(self, db, terms, room_ids, limit, after=None):
+        if not terms or not room_ids:
+            return []
+        keys = (
+            (math.floor(score * SCORE_SCALE), message_id)
+            for message_id, score in self._score(terms, room_ids).items()
+        )
+        if after is not None:
+            keys = (key for key in keys if key < after)
+        return [SearchHit(message_id, score) for score, message_id in heapq.nlargest(limit, keys)]
+
+
+def create_search_backend() -> SearchBackend:
+    """Build the backend selected by SEARCH_BACKEND, by default FULLTEXT
+    on MySQL and the in-process index on anything else"""
+    backend = settings.SEARCH_BACKEND
+    if backend is None:
+        is_mysql = settings.ASYNC_SQLALCHEMY_DATABASE_URL.startswith("mysql")
+        backend = "fulltext" if is_mysql else "memory"
+    if backend == "fulltext":
+        return FullTextSearch()
+    return InMemorySearch()
+
+
+search_backend = create_search_backend()
@@ -1,24 +1,143 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, Set
+from typing import Any, Callable, Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.db import get_db
-from app.models import Users
+from app.core.db import get_async_db
+from app.core.metrics import Histogram
+from app.core.revocation import create_revocation_store
+from app.models import ChatRooms, RoomUsers, Users
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost than BCRYPT_ROUNDS count as needing an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+password_hash_duration = Histogram(
+    "chat_password_hash_duration_seconds",
+    "bcrypt time per operation, excluding time queued for a worker",
+    ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5),
+)
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool.
+
+    bcrypt releases the GIL, so hashing on worker threads keeps the event
+    loop free for other requests. At most `workers` hashes run at once and
+    at most `max_pending` may be queued or running; past that callers get
+    a 503 instead of waiting behind an ever longer queue.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.PASSWORD_HASH_WORKERS,
+        max_pending: int = settings.PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Hashes queued or running
+        self.in_flight = 0
+        # Counters
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Hashes waiting for a free worker"""
+        return max(0, self.in_flight - self.workers)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="bcrypt"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    @staticmethod
+    def _timed(func: Callable, *args) -> Tuple[Any, float]:
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+    async def _run(self, operation: str, func: Callable, *args) -> Any:
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(
+                self._get_executor(), self._timed, func, *args
+            )
+        finally:
+            self.in_flight -= 1
+        # Counted here rather than on the worker thread so updates don't race
+        self.completed += 1
+        self.busy_seconds += elapsed
+        password_hash_duration.labels(operation).observe(elapsed)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", pwd_context.hash, password)
+
+    async def verify(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """Check a password against its stored hash.
+
+        Returns (valid, new_hash); new_hash is set when the password is
+        valid but the stored hash uses an outdated cost factor.
+        """
+        valid, new_hash = await self._run(
+            "verify", pwd_context.verify_and_update, password, hashed_password
+        )
+        if new_hash is not None:
+            self.rehashed += 1
+        return valid, new_hash
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "busy_seconds": self.busy_seconds,
+        }
+
+
+password_hasher = PasswordHasher()
 
 
 def create_access_token(
@@ -29,63 +148,149 @@ def create_access_token(
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm="HS256"
     )
     return encoded_jwt
 
 
-# Token blacklist for logout functionality
-token_blacklist: Set[str] = set()
-blacklist_expiry: dict[str, datetime] = {}
+# Verified claims by token digest, each kept until the token expires
+token_cache = TTLCache(
+    "tokens", settings.TOKEN_CACHE_MAX_ENTRIES, settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
 
 
-def blacklist_token(token: str) -> None:
-    """Add token to blacklist with expiration time based on the JWT expiry"""
-    try:
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str) -> dict:
+    """Verified claims of an access token, raising JWTError if invalid.
+
+    Tokens are long-lived and sent with every request, so the signature
+    is only checked the first time a token is seen. Revocation still has
+    to be checked separately.
+    """
+    key = token_digest(token)
+    payload = token_cache.get(key)
+    if payload is None:
         payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY, 
-            algorithms=["HS256"], 
-            options={"verify_signature": True}
+            token, settings.SECRET_KEY, algorithms=["HS256"]
         )
-        exp_timestamp = payload.get("exp")
-        if exp_timestamp:
-            expiry = datetime.fromtimestamp(exp_timestamp)
-            blacklist_expiry[token] = expiry
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            token_cache.set(key, payload, ttl=ttl)
+    return payload
+
+
+# Tokens revoked by logout, kept until they expire
+revocation_store = create_revocation_store()
+
+
+def token_id(token: str, payload: dict) -> str:
+    """Key a token is revoked under: its jti, or a digest of tokens issued
+    before jti was added"""
+    return payload.get("jti") or token_digest(token)
+
+
+async def revoke_token(token: str) -> None:
+    try:
+        payload = decode_token(token)
     except JWTError:
-        # If we can't decode the token, blacklist it for 24 hours as a precaution
-        blacklist_expiry[token] = datetime.utcnow() + timedelta(hours=24)
-    
-    token_blacklist.add(token)
-    # Clean expired tokens occasionally to prevent memory leaks
-    clean_expired_tokens()
+        # Invalid or expired tokens are rejected anyway
+        return
+    token_cache.invalidate(token_digest(token))
+    await revocation_store.revoke(token_id(token, payload), float(payload["exp"]))
 
 
-def is_token_blacklisted(token: str) -> bool:
-    return token in token_blacklist
+async def is_token_revoked(token: str, payload: dict) -> bool:
+    return await revocation_store.is_revoked(token_id(token, payload))
 
 
-def clean_expired_tokens() -> None:
-    """Remove expired tokens from the blacklist"""
-    current_time = datetime.utcnow()
-    expired_tokens = [
-        token 
-        for token, expiry in blacklist_expiry.items() 
-        if expiry < current_time
-    ]
-    
-    for token in expired_tokens:
-        if token in token_blacklist:
-            token_blacklist.remove(token)
-        if token in blacklist_expiry:
-            del blacklist_expiry[token]
+# Caches for the lookups every authenticated request and WebSocket handshake
+# repeats
+user_cache = TTLCache(
+    "users", settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS
+)
+room_cache = TTLCache(
+    "rooms", settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS
+)
+membership_cache = TTLCache(
+    "room_memberships",
+    settings.AUTH_CACHE_MAX_ENTRIES,
+    settings.AUTH_CACHE_TTL_SECONDS
+)
+
+
+def _snapshot_user(user: Users) -> Users:
+    """Copy a user's columns into an instance no session can expire"""
+    return Users(
+        id=user.id,
+        name=user.name,
+        email=user.email,
+        password=user.password,
+        created_at=user.created_at
+    )
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[Users]:
+    user = user_cache.get(email)
+    if user is None:
+        user = await db.scalar(select(Users).where(Users.email == email))
+        if user is not None:
+            user = _snapshot_user(user)
+            user_cache.set(email, user)
+    return user
+
+
+async def room_exists(db: AsyncSession, room_id: int) -> bool:
+    exists = room_cache.get(room_id)
+    if exists is None:
+        exists = await db.scalar(
+            select(ChatRooms.id).where(ChatRooms.id == room_id)
+        ) is not None
+        room_cache.set(
+            room_id,
+            exists,
+            ttl=None if exists else settings.AUTH_CACHE_NEGATIVE_TTL_SECONDS
+        )
+    return exists
+
+
+async def is_room_member(db: AsyncSession, room_id: int, user_id: int) -> bool:
+    key = (room_id, user_id)
+    member = membership_cache.get(key)
+    if member is None:
+        member = await db.scalar(
+            select(RoomUsers.user_id).where(
+                RoomUsers.room_id == room_id,
+                RoomUsers.user_id == user_id
+            )
+        ) is not None
+        membership_cache.set(
+            key,
+            member,
+            ttl=None if member else settings.AUTH_CACHE_NEGATIVE_TTL_SECONDS
+        )
+    return member
+
+
+def invalidate_user(email: str) -> None:
+    user_cache.invalidate(email)
+
+
+def invalidate_room(room_id: int) -> None:
+    room_cache.invalidate(room_id)
+
+
+def invalidate_membership(room_id: int, user_id: int) -> None:
+    membership_cache.invalidate((room_id, user_id))
 
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Users:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -93,25 +298,23 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    # Check if token is blacklisted
-    if is_token_blacklisted(token):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has been revoked",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-        
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=["HS256"]
-        )
+        payload = decode_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    
+    # Check if token was revoked by logout
+    if await is_token_revoked(token, payload):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
         
-    user = db.query(Users).filter(Users.email == email).first()
+    user = await get_user_by_email(db, email)
     if user is None:
         raise credentials_exception
     return user
\ No newline at end of file
@@ -2,10 +2,18 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 from starlette.staticfiles import StaticFiles
 import os
-from app.api.routes.websocket import router as websocket_router
+from app.api.routes.metrics import router as metrics_router
+from app.api.routes.websocket import manager, router as websocket_router
 from app.api.main import api_router
+from app.core.archive import archive_maintenance
 from app.core.config import settings
 from app.core.db import engine
+from app.core.ingest import message_ids, message_writer
+from app.core.log import setup_logging, stop_logging
+from app.core.metrics import MetricsMiddleware
+from app.core.nodes import node_id_lease
+from app.core.search import search_backend
+from app.core.security import password_hasher
 from app.models import Base
 
 Base.metadata.create_all(bind=engine)
@@ -23,7 +31,32 @@ app.add_middleware(
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag"],
     )
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    setup_logging()
+    if search_backend.index_messages not in message_writer.listeners:
+        message_writer.listeners.append(search_backend.index_messages)
+    await search_backend.start()
+    await node_id_lease.start(message_ids)
+    message_writer.start()
+    await manager.start()
+    archive_maintenance.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await archive_maintenance.stop()
+    await manager.stop()
+    # Flush buffered chat messages before the process exits
+    await message_writer.stop()
+    await node_id_lease.stop()
+    password_hasher.shutdown()
+    stop_logging()
 
 
 @app.get("/")
@@ -33,6 +66,7 @@ async def root():
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(websocket_router)
+app.include_router(metrics_router)
 
 
 # Mount static files directory
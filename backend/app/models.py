@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import BigInteger, Column, Index, Integer, String, DateTime, Text, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.core.db import Base
@@ -27,10 +27,20 @@ class ChatRooms(Base):
     messages = relationship("Messages", back_populates="room")
     users = relationship("Users", secondary="room_users", back_populates="rooms")
 
+    __table_args__ = (
+        # Serves the room listing's name prefix filter and keyset pages
+        Index("ix_chat_rooms_name_id", "name", "id"),
+    )
+
 class Messages(Base):
     __tablename__ = "messages"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Snowflake IDs assigned by the application (see app.core.ids)
+    id = Column(
+        BigInteger().with_variant(Integer, "sqlite"),
+        primary_key=True,
+        index=True
+    )
     text = Column(Text, nullable=False)
     sender_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     room_id = Column(Integer, ForeignKey("chat_rooms.id", ondelete="CASCADE"), nullable=False)
@@ -40,6 +50,13 @@ class Messages(Base):
     sender = relationship("Users", back_populates="messages")
     room = relationship("ChatRooms", back_populates="messages")
 
+    __table_args__ = (
+        # Serves keyset pagination of a room's history
+        Index("ix_messages_room_created_id", "room_id", "created_at", "id"),
+        # Message search on MySQL, see app.core.search
+        Index("ix_messages_text_fulltext", "text", mysql_prefix="FULLTEXT").ddl_if(dialect="mysql"),
+    )
+
 class RoomUsers(Base):
     __tablename__ = "room_users"
 
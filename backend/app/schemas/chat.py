@@ -30,6 +30,17 @@ class Message(MessageBase):
         from_attributes = True
 
 
+class SearchResult(Message):
+    sender_name: str
+    # Relevance, higher is better; comparable within one query only
+    score: float
+
+
+class MessageBatchResult(BaseModel):
+    # IDs assigned to the batch, in the order the messages were sent
+    ids: List[int]
+
+
 class ChatRoomBase(BaseModel):
     name: str
 
@@ -47,8 +58,8 @@ class ChatRoom(ChatRoomBase):
 
 
 class ChatRoomDetail(ChatRoom):
-    # Users needs to be a list of IDs since that's what Room.users provides
     users: List[UserInfo] = Field(default_factory=list)
+    # Newest messages only, see the messages_limit query parameter
     messages: List[Message] = Field(default_factory=list)
     
     class Config:
@@ -0,0 +1,54 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - only needed for binary WebSocket clients
+    msgpack = None
+
+
+def encode_json(data: Any) -> str:
+    """Encode data as compact JSON text, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_msgpack(data: Any) -> bytes:
+    """Encode data as MessagePack, requires the optional msgpack package"""
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def decode_msgpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Encode keyset pagination values as an opaque URL-safe token"""
+    return base64.urlsafe_b64encode(encode_json(list(values)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: str) -> list:
+    """Reverse encode_cursor, raising ValueError for malformed tokens"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """A datetime as naive UTC, how timestamps are stored; naive values
+    are taken to be UTC already"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Move old months of messages from the database into the archive once.
+
+The same job the app runs every ARCHIVE_INTERVAL_SECONDS when
+ARCHIVE_AFTER_MONTHS is set, for deployments that would rather schedule
+it (e.g. from cron) than have a worker do it. Safe to run again after an
+interruption.
+
+Usage:
+    python scripts/archive_messages.py [--months 12] [--dir archive]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.archive import ArchiveMaintenance, MessageArchive  # noqa: E402
+from app.core.config import settings  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--months", type=int, default=settings.ARCHIVE_AFTER_MONTHS,
+        help="Months of history to keep in the database (default ARCHIVE_AFTER_MONTHS)"
+    )
+    parser.add_argument(
+        "--dir", default=settings.ARCHIVE_DIR,
+        help="Archive directory (default ARCHIVE_DIR)"
+    )
+    args = parser.parse_args()
+    if args.months <= 0:
+        parser.error("--months must be at least 1 (or set ARCHIVE_AFTER_MONTHS)")
+
+    maintenance = ArchiveMaintenance(MessageArchive(args.dir))
+    cutoff = maintenance.cutoff(args.months)
+    archived = asyncio.run(maintenance.run_once(args.months))
+    print(f"Archived {archived} messages created before {cutoff:%Y-%m-%d} to {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Benchmark archiving old months of history out of the messages table.
+
+Seeds a SQLite database with N messages spread evenly over --months
+months and --rooms rooms (IDs assigned from each message's time, as the
+app does), then archives everything but the newest --keep months. It
+reports the table and file sizes before and after, the size of the
+archive, how long archiving took, and history page latency through
+load_history_page: the newest page, and a page from the oldest month
+served by the database before archiving and by the archive after (first
+read of the month file, then from the month cache).
+
+Usage:
+    python scripts/bench_archive.py [--messages 2000000] [--rooms 200]
+        [--months 24] [--keep 3]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+os.environ["LOG_LEVEL"] = "WARNING"
+_directory = tempfile.TemporaryDirectory()
+_path = os.path.join(_directory.name, "archive.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_path}"
+
+from sqlalchemy import create_engine, func, insert, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.api.routes.chat import load_history_page  # noqa: E402
+from app.core.archive import (  # noqa: E402
+    add_months,
+    archive_messages,
+    message_archive,
+    month_start,
+    timestamp_ms
+)
+from app.core.ids import min_id_at  # noqa: E402
+from app.models import Base, ChatRooms, Messages, Users  # noqa: E402
+
+PAGE = 50
+ROOM_ID = 1
+
+
+def seed(engine, messages, rooms, months, now):
+    Base.metadata.create_all(engine)
+    start = add_months(month_start(now), -months + 1)
+    step = (now - start) / messages
+    with Session(engine) as db:
+        db.execute(insert(Users), [{"id": 1, "name": "bench", "email": "b@x.io", "password": "x"}])
+        db.execute(insert(ChatRooms), [{"id": i, "name": f"room{i}"} for i in range(1, rooms + 1)])
+        batch = 100_000
+        for offset in range(0, messages, batch):
+            rows = []
+            for i in range(offset, min(offset + batch, messages)):
+                created_at = start + step * i
+                rows.append({
+                    "id": min_id_at(timestamp_ms(created_at)),
+                    "text": "message number %d, with a bit of chat text around it" % i,
+                    "sender_id": 1,
+                    "room_id": i % rooms + 1,
+                    "created_at": created_at,
+                })
+            db.execute(insert(Messages), rows)
+            db.commit()
+            print(f"  seeded {min(offset + batch, messages)} messages", end="\r")
+        print()
+    return start
+
+
+def sizes(engine):
+    with engine.connect() as conn:
+        rows = conn.scalar(select(func.count()).select_from(Messages))
+    return rows, os.path.getsize(_path)
+
+
+def archive_size(root):
+    total = 0
+    for directory, _, names in os.walk(root):
+        total += sum(os.path.getsize(os.path.join(directory, name)) for name in names)
+    return total
+
+
+async def page_latency(session_factory, before, repeat):
+    samples = []
+    async with session_factory() as db:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = await load_history_page(db, ROOM_ID, PAGE, before=before)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(page)
+
+
+async def bench(args, archive, engine, oldest):
+    async_engine = create_async_engine(os.environ["ASYNC_DATABASE_URL"])
+
+    def session_factory():
+        return AsyncSession(async_engine)
+
+    # Cursor a few pages into the oldest month
+    deep = (oldest + timedelta(days=7), 0)
+
+    print(f"{'page':>36} {'latency':>11} {'rows':>5}")
+    for label, before in (("newest (before archiving)", None), ("oldest month (database)", deep)):
+        elapsed, rows = await page_latency(session_factory, before, args.repeat)
+        print(f"{label:>36} {elapsed * 1000:>9.2f}ms {rows:>5}")
+
+    start = time.perf_counter()
+    cutoff = add_months(month_start(datetime.utcnow()), -args.keep)
+    moved = await archive_messages(cutoff, archive, session_factory)
+    elapsed = time.perf_counter() - start
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+
+    cold = await page_latency(session_factory, deep, 1)
+    cached = await page_latency(session_factory, deep, args.repeat)
+    newest = await page_latency(session_factory, None, args.repeat)
+    for label, (latency, rows) in (
+        ("newest (after archiving)", newest),
+        ("oldest month (archive, cold)", cold),
+        ("oldest month (archive, cached)", cached),
+    ):
+        print(f"{label:>36} {latency * 1000:>9.2f}ms {rows:>5}")
+    await async_engine.dispose()
+    return moved, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--keep", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ["DATABASE_URL"])
+    oldest = seed(engine, args.messages, args.rooms, args.months, datetime.utcnow())
+    rows_before, file_before = sizes(engine)
+    archive = message_archive
+    archive.root = os.path.join(_directory.name, "archive")
+
+    moved, elapsed = asyncio.run(bench(args, archive, engine, oldest))
+
+    rows_after, file_after = sizes(engine)
+    print()
+    print(f"archived {moved} messages in {elapsed:.1f}s ({moved / elapsed:.0f}/s)")
+    print(f"messages table: {rows_before} -> {rows_after} rows")
+    print(f"database file:  {file_before / 2**20:.0f}MB -> {file_after / 2**20:.0f}MB")
+    print(f"archive files:  {archive_size(archive.root) / 2**20:.0f}MB")
+    engine.dispose()
+    _directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Benchmark authenticated request throughput with and without the token cache.
+
+Drives the app in-process against a throwaway SQLite database and measures
+requests per second on GET /chat/rooms, first with every request verifying
+the JWT signature, then with verified claims served from the token cache.
+The cost of the token check on its own is reported next to it.
+
+Usage:
+    python scripts/bench_auth_cache.py [--seconds 5] [--concurrency 16]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+_directory = tempfile.TemporaryDirectory()
+_path = os.path.join(_directory.name, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_path}"
+
+import httpx  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.security import decode_token, token_cache  # noqa: E402
+from app.main import app  # noqa: E402
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+
+
+def decode_cost(token, iterations=20_000):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode_token(token)
+    return (time.perf_counter() - start) / iterations
+
+
+async def request_loop(client, headers, deadline):
+    count = 0
+    while time.perf_counter() < deadline:
+        response = await client.get(f"{settings.API_V1_STR}/chat/rooms", headers=headers)
+        assert response.status_code == 200, response.text
+        count += 1
+    return count
+
+
+async def measure(client, headers, args):
+    deadline = time.perf_counter() + args.seconds
+    counts = await asyncio.gather(*[
+        request_loop(client, headers, deadline) for _ in range(args.concurrency)
+    ])
+    return sum(counts) / args.seconds
+
+
+async def run(args):
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post(
+            f"{settings.API_V1_STR}/register",
+            json={"email": EMAIL, "name": "bench", "password": PASSWORD},
+        )
+        response = await client.post(
+            f"{settings.API_V1_STR}/login",
+            data={"username": EMAIL, "password": PASSWORD},
+        )
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for i in range(10):
+            await client.post(
+                f"{settings.API_V1_STR}/chat/rooms", json={"name": f"room {i}"}, headers=headers
+            )
+
+        maxsize = token_cache.maxsize
+        results = []
+        for label, size in (("without cache", 0), ("with cache", maxsize)):
+            token_cache.clear()
+            token_cache.maxsize = size
+            results.append((
+                label, decode_cost(token), await measure(client, headers, args)
+            ))
+    await app.router.shutdown()
+
+    print(f"GET /chat/rooms, {args.concurrency} concurrent clients, {args.seconds}s each")
+    print(f"{'':>14} {'req/s':>10} {'token check':>12}")
+    for label, cost, rate in results:
+        print(f"{label:>14} {rate:>10.0f} {cost * 1e6:>10.1f}us")
+    print(f"{'speedup':>14} {results[1][2] / results[0][2]:>9.2f}x {results[0][1] / results[1][1]:>10.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        _directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
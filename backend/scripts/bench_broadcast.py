@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Benchmark broadcast latency in a large room against the slowest receiver.
+
+Compares the old sequential fan-out (awaiting send_json on every socket in
+turn) with ConnectionManager's per-connection send queues. One member of the
+room is made artificially slow; everyone else is fast.
+
+Usage:
+    python scripts/bench_broadcast.py [--members 1000] [--rounds 20]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings require database credentials even though no connection is made
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from app.api.routes.websocket import ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    """Stands in for a client whose sends take `delay` seconds."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.received = 0
+        self.last_received_at = 0.0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def _deliver(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+        self.last_received_at = time.perf_counter()
+
+    async def send_json(self, message):
+        await self._deliver()
+
+    async def send_text(self, data):
+        await self._deliver()
+
+    async def send_bytes(self, data):
+        await self._deliver()
+
+
+async def sequential_broadcast(sockets, message):
+    for websocket in sockets:
+        await websocket.send_json(message)
+
+
+async def run(members, rounds, slow_delay):
+    sockets = [FakeWebSocket() for _ in range(members - 1)]
+    slow = FakeWebSocket(delay=slow_delay)
+    sockets.append(slow)
+    fast = sockets[:-1]
+    message = {"type": "message", "text": "hello", "room_id": 1}
+
+    # Sequential fan-out: broadcast only returns once the slow client is done
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await sequential_broadcast(sockets, message)
+    sequential = (time.perf_counter() - start) / rounds
+
+    manager = ConnectionManager()
+    senders = [
+        await manager.connect(websocket, 1, user_id, already_accepted=True)
+        for user_id, websocket in enumerate(sockets)
+    ]
+    # Warm-up broadcast so every writer task is started and parked
+    await manager.broadcast_to_room(1, message)
+    while any(websocket.received < 1 for websocket in fast):
+        await asyncio.sleep(0)
+    for websocket in sockets:
+        websocket.received = 0
+
+    enqueue_total = 0.0
+    delivery_total = 0.0
+    for round_number in range(1, rounds + 1):
+        start = time.perf_counter()
+        await manager.broadcast_to_room(1, message)
+        enqueue_total += time.perf_counter() - start
+        # Wait until every fast member has the frame
+        while any(websocket.received < round_number for websocket in fast):
+            await asyncio.sleep(0)
+        delivery_total += max(w.last_received_at for w in fast) - start
+
+    for sender in senders:
+        await manager.disconnect(sender)
+
+    return sequential, enqueue_total / rounds, delivery_total / rounds
+
+
+async def run_all(members, rounds):
+    print(f"{members}-member room, {rounds} broadcasts per row")
+    print(f"{'slowest':>10} {'sequential':>12} {'enqueue':>12} {'fast delivery':>14}")
+    # Warm-up pass so first-use costs don't land in the first row
+    await run(members, 1, 0.0)
+    for slow_delay in (0.0, 0.001, 0.01, 0.1):
+        sequential, enqueue, delivery = await run(members, rounds, slow_delay)
+        print(
+            f"{slow_delay * 1000:>8.1f}ms {sequential * 1000:>10.2f}ms "
+            f"{enqueue * 1000:>10.3f}ms {delivery * 1000:>12.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run_all(args.members, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
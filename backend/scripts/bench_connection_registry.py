@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Benchmark ConnectionManager registration and cleanup as connections grow.
+
+Registers N connections spread over rooms, several per user, and times
+connect, presence lookups and disconnect per connection. With the per-user
+connection sets and the reverse index every column should stay flat as N
+grows.
+
+Usage:
+    python scripts/bench_connection_registry.py [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from app.api.routes.websocket import ConnectionManager  # noqa: E402
+from app.core.backplane import InMemoryBackplane  # noqa: E402
+
+USERS_PER_ROOM = 50
+SESSIONS_PER_USER = 3
+
+
+class NullSocket:
+    async def send_text(self, data):
+        pass
+
+    async def close(self, code=None):
+        pass
+
+
+async def run(size):
+    manager = ConnectionManager(InMemoryBackplane())
+    layout = [
+        (index // (USERS_PER_ROOM * SESSIONS_PER_USER), index // SESSIONS_PER_USER)
+        for index in range(size)
+    ]
+
+    start = time.perf_counter()
+    senders = [
+        await manager.connect(NullSocket(), room_id, user_id, already_accepted=True, paused=True)
+        for room_id, user_id in layout
+    ]
+    connect = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for room_id, user_id in layout:
+        manager.count_sessions(room_id, user_id)
+    lookup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for sender in senders:
+        await manager.disconnect(sender)
+    disconnect = time.perf_counter() - start
+
+    assert not manager.active_connections and not manager.connection_rooms
+    print(
+        f"{size:>11} {connect / size * 1e6:>11.2f}us {lookup / size * 1e6:>11.2f}us"
+        f" {disconnect / size * 1e6:>11.2f}us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+    print(f"{'connections':>11} {'connect':>13} {'sessions':>13} {'disconnect':>13}")
+    for size in args.sizes:
+        asyncio.run(run(size))
+
+
+if __name__ == "__main__":
+    main()
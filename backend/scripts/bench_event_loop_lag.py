@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Load test of event-loop lag caused by database access in async handlers.
+
+Runs a burst of concurrent "requests" that each execute a query, first with
+a synchronous Session called directly on the event loop (the old behaviour
+of the async routes) and then with an AsyncSession. A ticker task measures
+how late the loop wakes it up, which is the delay every other WebSocket on
+the worker would see.
+
+Runs against a throwaway SQLite database, aiosqlite must be installed.
+
+Usage:
+    python scripts/bench_event_loop_lag.py [--requests 200] [--rows 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+# Scans enough rows to take a few milliseconds, like a history query would
+QUERY = text("SELECT count(*), max(length(text)) FROM messages WHERE room_id = :room_id")
+TICK = 0.001
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+
+
+async def measure(handler, requests):
+    lags = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 5)
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(i % 10) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick_task
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    p50 = statistics.median(lags) if lags else 0.0
+    return elapsed, len(lags), p50, p99, max(lags, default=0.0)
+
+
+def seed(url, rows):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, room_id INTEGER, text TEXT)"
+        ))
+        conn.execute(
+            text("INSERT INTO messages (room_id, text) VALUES (:room_id, :text)"),
+            [{"room_id": i % 10, "text": "message %d" % i} for i in range(rows)],
+        )
+    return engine
+
+
+async def run(path, requests, rows):
+    sync_engine = seed(f"sqlite:///{path}", rows)
+    SessionLocal = sessionmaker(bind=sync_engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    AsyncSessionLocal = async_sessionmaker(async_engine)
+
+    async def blocking_handler(room_id):
+        db = SessionLocal()
+        try:
+            db.execute(QUERY, {"room_id": room_id}).all()
+        finally:
+            db.close()
+        await asyncio.sleep(0)
+
+    async def async_handler(room_id):
+        async with AsyncSessionLocal() as db:
+            (await db.execute(QUERY, {"room_id": room_id})).all()
+
+    print(f"{requests} concurrent queries over {rows} rows")
+    # A blocked loop also shows up as few ticks over the same wall time
+    print(
+        f"{'session':>14} {'total':>10} {'ticks':>7} {'lag p50':>10} "
+        f"{'lag p99':>10} {'lag max':>10}"
+    )
+    for name, handler in (("sync on loop", blocking_handler), ("AsyncSession", async_handler)):
+        elapsed, ticks, p50, p99, worst = await measure(handler, requests)
+        print(
+            f"{name:>14} {elapsed * 1000:>8.1f}ms {ticks:>7} {p50 * 1000:>8.2f}ms "
+            f"{p99 * 1000:>8.2f}ms {worst * 1000:>8.2f}ms"
+        )
+
+    await async_engine.dispose()
+    sync_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, "bench.db"), args.requests, args.rows))
+
+
+if __name__ == "__main__":
+    main()
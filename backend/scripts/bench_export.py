@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Benchmark the streaming room export against loading the history at once.
+
+Seeds a SQLite room with N messages (with the app's indexes), then runs
+export_messages for NDJSON, CSV and gzipped NDJSON, reporting throughput
+and the peak Python memory allocated while exporting. The baseline loads
+every row as ORM objects first, as get_chat_history does for a page.
+Streaming peaks should stay the same as N grows.
+
+Usage:
+    python scripts/bench_export.py [--rows 100000 1000000] [--db path]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from sqlalchemy import create_engine, delete, func, insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.export import export_messages, gzip_stream  # noqa: E402
+from app.models import Base, ChatRooms, Messages, Users  # noqa: E402
+
+ROOM_ID = 1
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        if db.scalar(select(func.count()).select_from(Messages)) == rows:
+            return
+        db.execute(delete(Messages))
+        db.execute(delete(ChatRooms))
+        db.execute(delete(Users))
+        db.execute(insert(Users), [{"id": 1, "name": "bench", "email": "b@x.io", "password": "x"}])
+        db.execute(insert(ChatRooms), [{"id": ROOM_ID, "name": "bench"}])
+        start = datetime(2024, 1, 1)
+        batch = 100_000
+        for offset in range(0, rows, batch):
+            db.execute(insert(Messages), [
+                {
+                    "id": i + 1,
+                    "text": "message number %d, with a bit of chat text around it" % i,
+                    "sender_id": 1,
+                    "room_id": ROOM_ID,
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for i in range(offset, min(offset + batch, rows))
+            ])
+            db.commit()
+            print(f"  seeded {min(offset + batch, rows)} rows", end="\r")
+        print()
+
+
+async def consume(chunks):
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+async def load_all(session_factory):
+    async with session_factory() as db:
+        messages = (await db.scalars(
+            select(Messages).where(Messages.room_id == ROOM_ID)
+            .order_by(Messages.created_at, Messages.id)
+        )).all()
+        return len(messages)
+
+
+async def measure(run):
+    """(seconds, result) of one run, then peak bytes of a traced run"""
+    start = time.perf_counter()
+    result = await run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    await run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, result, peak
+
+
+async def bench(path, rows):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+    def session_factory():
+        return AsyncSession(engine)
+
+    cases = (
+        ("load all (baseline)", lambda: load_all(session_factory)),
+        ("stream ndjson", lambda: consume(export_messages(
+            ROOM_ID, "ndjson", session_factory=session_factory))),
+        ("stream csv", lambda: consume(export_messages(
+            ROOM_ID, "csv", session_factory=session_factory))),
+        ("stream ndjson gzip", lambda: consume(gzip_stream(export_messages(
+            ROOM_ID, "ndjson", session_factory=session_factory)))),
+    )
+    for label, run in cases:
+        elapsed, result, peak = await measure(run)
+        output = "-" if label.startswith("load") else f"{result / 2**20:.1f}MB"
+        print(
+            f"{rows:>9} {label:>20} {rows / elapsed:>11.0f} {output:>10}"
+            f" {peak / 2**20:>9.1f}MB"
+        )
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--db", help="SQLite file to seed or reuse")
+    args = parser.parse_args()
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "export.db")
+
+    print(f"{'rows':>9} {'export':>20} {'rows/s':>11} {'output':>10} {'peak mem':>11}")
+    for rows in args.rows:
+        seed(create_engine(f"sqlite:///{path}"), rows)
+        asyncio.run(bench(path, rows))
+
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
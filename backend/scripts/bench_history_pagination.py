@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark chat history page latency against scroll depth.
+
+Seeds a SQLite copy of the messages table (with the app's indexes) and
+compares LIMIT/OFFSET paging with the keyset query used by
+get_chat_history. Keyset pages should cost the same at any depth.
+
+Usage:
+    python scripts/bench_history_pagination.py [--rows 10000000] [--db path]
+
+Seeding 10M rows takes a few minutes; pass --db to keep the file and reuse
+it across runs.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from sqlalchemy import create_engine, desc, func, insert, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.history import history_query  # noqa: E402
+from app.models import Base, ChatRooms, Messages, Users  # noqa: E402
+
+ROOM_ID = 1
+PAGE = 50
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        if db.scalar(select(func.count()).select_from(Messages)) >= rows:
+            return
+        db.execute(insert(Users), [{"id": 1, "name": "bench", "email": "b@x.io", "password": "x"}])
+        db.execute(insert(ChatRooms), [{"id": ROOM_ID, "name": "bench"}])
+        start = datetime(2024, 1, 1)
+        batch = 100_000
+        for offset in range(0, rows, batch):
+            db.execute(insert(Messages), [
+                {
+                    "id": i + 1,
+                    "text": "message %d" % i,
+                    "sender_id": 1,
+                    "room_id": ROOM_ID,
+                    "created_at": start + timedelta(seconds=i),
+                }
+                for i in range(offset, min(offset + batch, rows))
+            ])
+            db.commit()
+            print(f"  seeded {min(offset + batch, rows)} rows", end="\r")
+        print()
+
+
+def timed(db, query, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.execute(query).all()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", help="SQLite file to seed or reuse")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "history.db")
+
+    engine = create_engine(f"sqlite:///{path}")
+    seed(engine, args.rows)
+
+    newest_first = select(Messages).where(Messages.room_id == ROOM_ID).order_by(
+        desc(Messages.created_at), desc(Messages.id)
+    )
+    print(f"{'depth (rows)':>14} {'offset':>12} {'keyset':>12}")
+    with Session(engine) as db:
+        depth = PAGE
+        while depth < args.rows:
+            # Cursor of the last row on the previous page
+            anchor = db.execute(
+                newest_first.with_only_columns(Messages.created_at, Messages.id)
+                .offset(depth - 1).limit(1)
+            ).one()
+            offset_time = timed(db, newest_first.offset(depth).limit(PAGE), args.repeat)
+            keyset_time = timed(
+                db, history_query(ROOM_ID, PAGE, before=tuple(anchor)), args.repeat
+            )
+            print(f"{depth:>14} {offset_time * 1000:>10.2f}ms {keyset_time * 1000:>10.2f}ms")
+            depth *= 10
+
+    engine.dispose()
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
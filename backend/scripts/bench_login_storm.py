@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+Benchmark latency of unrelated requests while a login storm is running.
+
+Drives the app in-process against a throwaway SQLite database: a number of
+clients log in back to back while another client requests GET / every 10ms
+and records its latency. Run with --inline to hash on the event loop
+instead of the password worker pool and compare the p99 figures.
+
+Usage:
+    python scripts/bench_login_storm.py [--logins 8] [--seconds 5] [--inline]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+_directory = tempfile.TemporaryDirectory()
+_path = os.path.join(_directory.name, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_path}"
+
+import httpx  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.security import password_hasher  # noqa: E402
+from app.main import app  # noqa: E402
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+PROBE_INTERVAL = 0.01
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def login_loop(client, stop):
+    count = 0
+    while not stop.is_set():
+        response = await client.post(
+            f"{settings.API_V1_STR}/login",
+            data={"username": EMAIL, "password": PASSWORD},
+        )
+        if response.status_code == 200:
+            count += 1
+    return count
+
+
+async def probe_loop(client, stop, samples):
+    # Latency is measured from when each probe was due, so time spent
+    # waiting for a blocked event loop counts against the request
+    due = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(max(0, due - time.perf_counter()))
+        await client.get("/")
+        samples.append(time.perf_counter() - due)
+        due += PROBE_INTERVAL
+
+
+async def run(args):
+    if args.inline:
+        # Hash on the event loop, as a plain async route calling bcrypt would
+        async def inline(operation, func, *func_args):
+            return func(*func_args)
+        password_hasher._run = inline
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post(
+            f"{settings.API_V1_STR}/register",
+            json={"email": EMAIL, "name": "bench", "password": PASSWORD},
+        )
+
+        idle = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_loop(client, stop, idle))
+        await asyncio.sleep(1)
+        stop.set()
+        await probe
+
+        busy = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(probe_loop(client, stop, busy))
+        storm = [asyncio.create_task(login_loop(client, stop)) for _ in range(args.logins)]
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        logins = sum(await asyncio.gather(*storm))
+        await probe
+    await app.router.shutdown()
+
+    mode = "inline" if args.inline else f"pool ({password_hasher.workers} workers)"
+    print(f"hashing: {mode}, bcrypt rounds: {settings.BCRYPT_ROUNDS}")
+    print(f"logins completed: {logins} ({logins / args.seconds:.1f}/s)")
+    print(f"{'GET /':>10} {'samples':>8} {'p50':>10} {'p99':>10} {'max':>10}")
+    for label, samples in (("idle", idle), ("storm", busy)):
+        print(
+            f"{label:>10} {len(samples):>8}"
+            f" {statistics.median(samples) * 1000:>8.2f}ms"
+            f" {percentile(samples, 0.99) * 1000:>8.2f}ms"
+            f" {max(samples) * 1000:>8.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        _directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Benchmark message ingestion through the batch endpoint against one POST
+per message.
+
+Runs the app in-process on a temporary SQLite database, with rate limiting
+off, and posts messages to a room through
+POST /rooms/{room_id}/messages (sequentially, as a bridge replaying a log
+does, and with concurrent requests) and through
+POST /rooms/{room_id}/messages/batch at several batch sizes.
+
+The sequential case waits out a write-behind flush per message, so it
+only posts --sequential messages.
+
+Usage:
+    python scripts/bench_message_batch.py [--messages 5000] [--sequential 200]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["LOG_LEVEL"] = "WARNING"
+_directory = tempfile.TemporaryDirectory()
+_path = os.path.join(_directory.name, "batch.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_path}"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_path}"
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+API = "/api/v1/chat"
+
+
+async def per_message(client, headers, room_id, messages, concurrency):
+    queue = iter(range(messages))
+
+    async def worker():
+        for index in queue:
+            response = await client.post(
+                f"{API}/rooms/{room_id}/messages", json={"text": f"message {index}"},
+                headers=headers
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def batched(client, headers, room_id, messages, size):
+    for offset in range(0, messages, size):
+        batch = [{"text": f"message {i}"} for i in range(offset, min(offset + size, messages))]
+        response = await client.post(
+            f"{API}/rooms/{room_id}/messages/batch", json=batch, headers=headers
+        )
+        response.raise_for_status()
+
+
+async def run(messages, sequential):
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        credentials = {"email": "bridge@example.com", "name": "bridge", "password": "bench"}
+        (await client.post("/api/v1/register", json=credentials)).raise_for_status()
+        response = await client.post(
+            "/api/v1/login", data={"username": credentials["email"], "password": "bench"}
+        )
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await client.post(f"{API}/rooms", json={"name": "bridge"}, headers=headers)
+        room_id = response.json()["id"]
+
+        cases = [
+            ("1 per request, sequential", per_message, sequential, 1),
+            ("1 per request, 32 concurrent", per_message, messages, 32),
+            ("batch of 100", batched, messages, 100),
+            ("batch of 1000", batched, messages, 1000),
+        ]
+        print(f"{'ingestion':>30} {'messages':>9} {'messages/s':>12} {'total':>9}")
+        for label, func, count, arg in cases:
+            start = time.perf_counter()
+            await func(client, headers, room_id, count, arg)
+            elapsed = time.perf_counter() - start
+            print(f"{label:>30} {count:>9} {count / elapsed:>12.0f} {elapsed:>8.2f}s")
+    await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--sequential", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.sequential))
+    _directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
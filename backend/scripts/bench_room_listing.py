@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Benchmark GET /chat/rooms against a large room table.
+
+Seeds a SQLite copy of chat_rooms (with the app's indexes) and compares
+the old unpaginated listing, loading and serializing every room, with the
+keyset pages served by load_room_listing: the first page, a page deep into
+the table, a name prefix page, and a page answered from the listing cache.
+A 304 to a matching If-None-Match sends headers only.
+
+Usage:
+    python scripts/bench_room_listing.py [--rooms 1000000] [--db path]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import create_engine, func, insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.core.rooms import load_room_listing, room_list_cache, room_list_query  # noqa: E402
+from app.models import Base, ChatRooms  # noqa: E402
+from app.schemas.chat import ChatRoom  # noqa: E402
+
+PAGE = 50
+
+
+def seed(engine, rooms):
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        if db.scalar(select(func.count()).select_from(ChatRooms)) >= rooms:
+            return
+        rng = random.Random(1)
+        created_at = datetime(2024, 1, 1)
+        batch = 100_000
+        for offset in range(0, rooms, batch):
+            db.execute(insert(ChatRooms), [
+                {
+                    "id": i + 1,
+                    "name": "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 16))),
+                    "created_at": created_at,
+                }
+                for i in range(offset, min(offset + batch, rooms))
+            ])
+            db.commit()
+            print(f"  seeded {min(offset + batch, rooms)} rooms", end="\r")
+        print()
+
+
+def full_listing(engine):
+    """What GET /chat/rooms used to do: every room through Pydantic"""
+    with Session(engine) as db:
+        rooms = db.scalars(select(ChatRooms)).all()
+        return TypeAdapter(List[ChatRoom]).dump_json(
+            [ChatRoom.model_validate(room) for room in rooms]
+        )
+
+
+async def timed_listing(session_factory, repeat, cached=False, **kwargs):
+    samples = []
+    listing = None
+    async with session_factory() as db:
+        for _ in range(repeat):
+            if not cached:
+                room_list_cache.clear()
+            start = time.perf_counter()
+            listing = await load_room_listing(db, PAGE, **kwargs)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(listing.body)
+
+
+async def bench_pages(path, anchor, repeat):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+    def session_factory():
+        return AsyncSession(engine)
+
+    cases = (
+        ("first page", {}, False),
+        ("deep page (90%)", {"after": anchor}, False),
+        ("prefix 'mq' page", {"prefix": "mq"}, False),
+        ("cached page", {}, True),
+    )
+    for label, kwargs, cached in cases:
+        elapsed, size = await timed_listing(session_factory, repeat, cached, **kwargs)
+        print(f"{label:>20} {elapsed * 1000:>10.3f}ms {size:>12}B")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rooms", type=int, default=1_000_000)
+    parser.add_argument("--db", help="SQLite file to seed or reuse")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "rooms.db")
+
+    engine = create_engine(f"sqlite:///{path}")
+    seed(engine, args.rooms)
+    with Session(engine) as db:
+        # Cursor of the room 90% of the way through the listing
+        anchor = db.execute(
+            room_list_query(1).with_only_columns(ChatRooms.name, ChatRooms.id)
+            .offset(args.rooms * 9 // 10)
+        ).one()
+
+    print(f"{'request':>20} {'latency':>12} {'body':>13}")
+    start = time.perf_counter()
+    body = full_listing(engine)
+    elapsed = time.perf_counter() - start
+    print(f"{'all rooms (before)':>20} {elapsed * 1000:>10.3f}ms {len(body):>12}B")
+    engine.dispose()
+
+    asyncio.run(bench_pages(path, tuple(anchor), args.repeat))
+    print(f"{'304 Not Modified':>20} {'-':>12} {0:>12}B")
+
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Benchmark message search latency on a large corpus.
+
+Seeds N messages of Zipf-distributed words spread over many rooms, then
+searches as a user who belongs to --member-of of them, comparing:
+
+- a LIKE '%word%' scan over the user's rooms, the only option without an
+  index (unranked, so it may stop at the first page of matches)
+- the in-process inverted index (InMemorySearch), after building it from
+  the database
+- the MySQL FULLTEXT index (FullTextSearch), when --url points at MySQL
+
+for a common word, a mid-frequency word, a rare word and a two-word query.
+
+Reads /proc for memory use, so runs on Linux only.
+
+Usage:
+    python scripts/bench_search.py [--messages 5000000] [--rooms 1000]
+        [--member-of 50] [--url mysql+aiomysql://user:pw@host/db]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from sqlalchemy import func, insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from app.core.search import FullTextSearch, InMemorySearch, STOPWORDS  # noqa: E402
+from app.models import Base, ChatRooms, Messages, Users  # noqa: E402
+
+PAGE = 20
+VOCABULARY = 30_000
+
+
+def vocabulary(rng):
+    words = set()
+    while len(words) < VOCABULARY:
+        word = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+        if word not in STOPWORDS:
+            words.add(word)
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+
+def rss_mb():
+    """Resident memory of this process right now"""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+async def seed(engine, messages, rooms, words):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as db:
+        if await db.scalar(select(func.count()).select_from(Messages)) >= messages:
+            return
+        rng = random.Random(2)
+        # Zipf's law, roughly how often words occur in real text
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+        await db.execute(insert(Users), [{"id": 1, "name": "bench", "email": "b@x.io", "password": "x"}])
+        await db.execute(insert(ChatRooms), [{"id": i, "name": f"room{i}"} for i in range(1, rooms + 1)])
+        batch = 20_000
+        for offset in range(0, messages, batch):
+            await db.execute(insert(Messages), [
+                {
+                    "id": i + 1,
+                    "text": " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(4, 20))),
+                    "sender_id": 1,
+                    "room_id": rng.randint(1, rooms),
+                }
+                for i in range(offset, min(offset + batch, messages))
+            ])
+            await db.commit()
+            print(f"  seeded {min(offset + batch, messages)} messages", end="\r")
+        print()
+
+
+async def like_scan(db, terms, room_ids):
+    query = select(Messages.id).where(Messages.room_id.in_(room_ids))
+    for term in terms:
+        query = query.where(Messages.text.like(f"%{term}%"))
+    return (await db.scalars(query.order_by(Messages.id.desc()).limit(PAGE))).all()
+
+
+async def timed(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        hits = await run()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), len(hits)
+
+
+async def bench(url, args):
+    engine = create_async_engine(url)
+    rng = random.Random(1)
+    words = vocabulary(rng)
+    await seed(engine, args.messages, args.rooms, words)
+    room_ids = list(range(1, args.member_of + 1))
+
+    def session_factory():
+        return AsyncSession(engine)
+
+    memory = InMemorySearch(session_factory)
+    rss = rss_mb()
+    start = time.perf_counter()
+    await memory.start()
+    elapsed = time.perf_counter() - start
+    grown = rss_mb() - rss
+    print(f"in-memory index: {len(memory)} messages in {elapsed:.1f}s, ~{grown:.0f}MB")
+
+    backends = [("LIKE scan", None), ("in-memory index", memory)]
+    if engine.dialect.name == "mysql":
+        backends.append(("FULLTEXT", FullTextSearch()))
+
+    queries = (
+        ("common word", [words[4]]),
+        ("mid word", [words[500]]),
+        ("rare word", [words[20_000]]),
+        ("two words", [words[4], words[500]]),
+    )
+    print(f"{'query':>12} {'search':>16} {'latency':>11} {'hits':>5}")
+    async with session_factory() as db:
+        for label, terms in queries:
+            for name, backend in backends:
+                if backend is None:
+                    def run():
+                        return like_scan(db, terms, room_ids)
+                else:
+                    def run():
+                        return backend.search(db, terms, room_ids, PAGE)
+                elapsed, hits = await timed(run, args.repeat)
+                print(f"{label:>12} {name:>16} {elapsed * 1000:>9.2f}ms {hits:>5}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=5_000_000)
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--member-of", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", help="Async database URL to seed or reuse, SQLite by default")
+    args = parser.parse_args()
+
+    directory = None
+    url = args.url
+    if url is None:
+        directory = tempfile.TemporaryDirectory()
+        url = f"sqlite+aiosqlite:///{os.path.join(directory.name, 'search.db')}"
+
+    asyncio.run(bench(url, args))
+
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of CPU time spent encoding one broadcast.
+
+Compares re-encoding the message for every recipient (what send_json does)
+with encoding it once and sharing the frame, using both the standard json
+module and orjson when it is installed.
+
+Usage:
+    python scripts/bench_serialization.py [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import encode_json, orjson  # noqa: E402
+
+MESSAGE = {
+    "type": "message",
+    "id": 7205759403792793,
+    "text": "Anyone around to look at the deploy? " * 3,
+    "sender_id": 42,
+    "sender_name": "Jane Smith",
+    "room_id": 1,
+    "created_at": datetime(2025, 3, 23, 12, 0, 0).isoformat(),
+}
+
+
+def per_recipient(recipients):
+    # Mirrors starlette's WebSocket.send_json
+    for _ in range(recipients):
+        json.dumps(MESSAGE, separators=(",", ":"), ensure_ascii=False)
+
+
+def once_json(recipients):
+    frame = json.dumps(MESSAGE, separators=(",", ":"), ensure_ascii=False)
+    for _ in range(recipients):
+        frame  # noqa: B018 - the shared frame is handed to every sender
+
+
+def once_fast(recipients):
+    frame = encode_json(MESSAGE)
+    for _ in range(recipients):
+        frame  # noqa: B018
+
+
+def cpu_per_call(func, recipients, repeat):
+    # Enough calls that the small rooms still get a measurable sample
+    calls = max(1, 100_000 // recipients)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for _ in range(calls):
+            func(recipients)
+        best = min(best, (time.process_time() - start) / calls)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fast_name = "once (orjson)" if orjson is not None else "once (json)"
+    strategies = [
+        ("per recipient", per_recipient),
+        ("once (json)", once_json),
+        (fast_name, once_fast),
+    ]
+    print("CPU microseconds per broadcast")
+    print(f"{'recipients':>10}" + "".join(f"{name:>16}" for name, _ in strategies))
+    for recipients in (10, 100, 10_000):
+        row = [cpu_per_call(f, recipients, args.repeat) for _, f in strategies]
+        print(f"{recipients:>10}" + "".join(f"{t * 1e6:>16.2f}" for t in row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""
+Compare the JSON and MessagePack WebSocket protocols on a chat workload.
+
+Replays a recording of server frames, one JSON frame per line as a client
+receives them (e.g. saved from the browser's devtools), or generates a
+comparable workload: chat messages of varied length, presence changes
+carrying the member list, and the occasional reconnect replay. For each
+protocol it reports bytes on the wire, the server's cost to encode a frame
+(paid once per broadcast) and the client's cost to decode it.
+
+Usage:
+    python scripts/bench_wire_protocol.py [--workload frames.ndjson]
+        [--frames 20000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from app.api.routes.websocket import Frame, message_event, replay_event  # noqa: E402
+from app.utils import decode_msgpack, msgpack  # noqa: E402
+
+ROOM_ID = 42
+MEMBERS = 40
+WORDS = (
+    "ok yes no sure thanks lol see you tomorrow meeting the build is green again "
+    "can someone review my pull request deploy finished rolling back now"
+).split()
+
+
+def generate(frames):
+    rng = random.Random(7)
+    start = datetime(2024, 5, 1, 9, 0, 0)
+    next_id = 7_200_000_000_000_000
+    online = set(range(1, MEMBERS // 2))
+    recent = []
+    events = []
+    for index in range(frames):
+        roll = rng.random()
+        moment = start + timedelta(seconds=index * 1.7)
+        if roll < 0.04:
+            user_id = rng.randint(1, MEMBERS)
+            joined = user_id not in online
+            (online.add if joined else online.discard)(user_id)
+            events.append({
+                "type": "user_joined" if joined else "user_left",
+                "user_id": user_id,
+                "user_name": f"user{user_id}",
+                "room_id": ROOM_ID,
+                "active_users": sorted(online),
+            })
+        elif roll < 0.045 and recent:
+            events.append(replay_event(ROOM_ID, recent[-rng.randint(1, 20):]))
+        else:
+            next_id += rng.randint(1, 1 << 22)
+            user_id = rng.choice(sorted(online) or [1])
+            row = {
+                "id": next_id,
+                "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 25))),
+                "sender_id": user_id,
+                "room_id": ROOM_ID,
+                "created_at": moment,
+            }
+            recent = (recent + [row])[-200:]
+            events.append(message_event(row, f"user{user_id}"))
+    return events
+
+
+def timed(func, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", help="recorded server frames, one JSON object per line")
+    parser.add_argument("--frames", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if msgpack is None:
+        sys.exit("msgpack is not installed")
+
+    if args.workload:
+        with open(args.workload) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = generate(args.frames)
+
+    text = [Frame.from_message(event).data for event in events]
+    packed = [Frame.from_message(event).packed for event in events]
+    json_bytes = sum(len(data.encode("utf-8")) for data in text)
+    packed_bytes = sum(len(data) for data in packed)
+
+    # A fresh Frame per broadcast, as the server builds one per message
+    json_encode = timed(lambda event: Frame.from_message(event).data, events, args.repeat)
+    packed_encode = timed(lambda event: Frame.from_message(event).packed, events, args.repeat)
+    json_decode = timed(json.loads, text, args.repeat)
+    packed_decode = timed(decode_msgpack, packed, args.repeat)
+
+    print(f"{len(events)} frames")
+    print(f"{'protocol':>9} {'bytes':>11} {'per frame':>10} {'encode':>10} {'decode':>10}")
+    print(
+        f"{'json':>9} {json_bytes:>11} {json_bytes / len(events):>9.1f}B"
+        f" {json_encode:>8.2f}us {json_decode:>8.2f}us"
+    )
+    print(
+        f"{'msgpack':>9} {packed_bytes:>11} {packed_bytes / len(events):>9.1f}B"
+        f" {packed_encode:>8.2f}us {packed_decode:>8.2f}us"
+    )
+    print(f"msgpack saves {1 - packed_bytes / json_bytes:.1%} of bytes on the wire")
+    print("msgpack encode includes the JSON text every frame keeps for the backplane")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Compare server-side cost of one socket per room with one multiplexed socket.
+
+Connects the same population, by default 10k users in 20 rooms each, to a
+ConnectionManager twice. The first run uses one /ws/{room_id} connection
+per room and the second one /ws connection per user with a subscription
+per room. For each layout it reports the Python memory held by the
+registry, send queues and writer tasks, the file descriptors needed (one
+per accepted socket), and the auth work done on connect.
+
+Kernel socket buffers and the ASGI server's per-connection state come on
+top of the memory figure and also scale with the socket count.
+
+Usage:
+    python scripts/bench_ws_multiplex.py [--users 10000] [--rooms-per-user 20]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MYSQL_PORT", "3306")
+
+from app.api.routes.websocket import ConnectionManager  # noqa: E402
+from app.core.backplane import InMemoryBackplane  # noqa: E402
+
+USERS_PER_ROOM = 200
+
+
+class NullSocket:
+    async def send_text(self, data):
+        pass
+
+    async def close(self, code=None):
+        pass
+
+
+def membership(users, rooms_per_user):
+    rooms = max(1, users * rooms_per_user // USERS_PER_ROOM)
+    rng = random.Random(42)
+    return {
+        user_id: rng.sample(range(rooms), min(rooms_per_user, rooms))
+        for user_id in range(users)
+    }
+
+
+async def connect_per_room(manager, members):
+    for user_id, rooms in members.items():
+        for room_id in rooms:
+            await manager.connect(NullSocket(), room_id, user_id, already_accepted=True)
+
+
+async def connect_multiplexed(manager, members):
+    for user_id, rooms in members.items():
+        sender = manager.register(NullSocket(), user_id)
+        for room_id in rooms:
+            await manager.join_room(sender, room_id)
+
+
+async def measure(connect, members):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    manager = ConnectionManager(InMemoryBackplane())
+    await connect(manager, members)
+    # Let every writer task start and park on its queue
+    await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    sockets = len(manager.connection_rooms)
+    for sender in list(manager.connection_rooms):
+        await manager.disconnect(sender)
+    return memory, sockets, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rooms-per-user", type=int, default=20)
+    args = parser.parse_args()
+    members = membership(args.users, args.rooms_per_user)
+    subscriptions = sum(len(rooms) for rooms in members.values())
+
+    print(f"{args.users} users, {subscriptions} room subscriptions")
+    print(
+        f"{'layout':>14} {'sockets/FDs':>12} {'memory':>10} {'per user':>10}"
+        f" {'token checks':>13} {'auth queries':>13} {'connect':>9}"
+    )
+    layouts = (
+        # Each per-room socket decodes the token and loads the user, and
+        # both layouts check room and membership once per room
+        ("/ws/{room_id}", connect_per_room, subscriptions, subscriptions * 3),
+        ("/ws", connect_multiplexed, args.users, args.users + subscriptions * 2),
+    )
+    for label, connect, token_checks, queries in layouts:
+        memory, sockets, elapsed = asyncio.run(measure(connect, members))
+        print(
+            f"{label:>14} {sockets:>12} {memory / 2**20:>8.1f}MB"
+            f" {memory / args.users / 1024:>8.1f}KB {token_checks:>13}"
+            f" {queries:>13} {elapsed:>8.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
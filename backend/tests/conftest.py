@@ -0,0 +1,90 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read at import time, so point the app at a throwaway SQLite
+# database before anything imports it
+_directory = tempfile.TemporaryDirectory()
+for name in ("MYSQL_SERVER", "MYSQL_DB", "MYSQL_USER", "MYSQL_PASSWORD"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("MYSQL_PORT", "3306")
+os.environ["DATABASE_URL"] = f"sqlite:///{_directory.name}/chat.db"
+os.environ["ASYNC_DATABASE_URL"] = f"sqlite+aiosqlite:///{_directory.name}/chat.db"
+os.environ["ARCHIVE_DIR"] = os.path.join(_directory.name, "archive")
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["LOG_LEVEL"] = "WARNING"
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.core import cache  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.db import engine  # noqa: E402
+from app.core.history import recent_messages  # noqa: E402
+from app.core.ratelimit import InMemoryRateLimiter, rate_limiter  # noqa: E402
+from app.core.search import search_backend  # noqa: E402
+from app.main import app  # noqa: E402
+from app.models import Base  # noqa: E402
+
+API = "/api/v1"
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    # One client for the whole run: the background tasks started with the
+    # app are tied to its event loop
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def database():
+    """An empty database and cold in-process caches"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    for registered in cache.registry:
+        registered.clear()
+    for room_id in list(recent_messages._rooms):
+        recent_messages.evict(room_id)
+    if isinstance(rate_limiter, InMemoryRateLimiter):
+        rate_limiter._buckets.clear()
+
+
+@pytest.fixture
+def client(app_client, database):
+    """The app, started on an empty database"""
+    app_client.portal.call(search_backend.start)
+    return app_client
+
+
+@pytest.fixture
+async def session_factory(database):
+    """Sessions on an engine of the test's own, the app's engine belongs
+    to the event loop the app runs on"""
+    async_engine = create_async_engine(settings.ASYNC_SQLALCHEMY_DATABASE_URL)
+    yield async_sessionmaker(async_engine, expire_on_commit=False)
+    await async_engine.dispose()
+
+
+@pytest.fixture
+def register(client):
+    """Register and log in a user, returning their auth headers"""
+
+    def register(email: str, name: str = "Test User", password: str = "secret"):
+        response = client.post(
+            f"{API}/register", json={"email": email, "name": name, "password": password}
+        )
+        assert response.status_code == 200, response.text
+        response = client.post(
+            f"{API}/login", data={"username": email, "password": password}
+        )
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return register
@@ -0,0 +1,138 @@
+from tests.conftest import API
+
+
+def test_register_and_login(client, register):
+    headers = register("alice@example.com", name="Alice")
+    response = client.get(f"{API}/chat/rooms", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_register_rejects_duplicate_email(client, register):
+    register("alice@example.com")
+    response = client.post(
+        f"{API}/register",
+        json={"email": "alice@example.com", "name": "Again", "password": "secret"}
+    )
+    assert response.status_code == 400
+
+
+def test_login_rejects_wrong_password(client, register):
+    register("alice@example.com")
+    response = client.post(
+        f"{API}/login", data={"username": "alice@example.com", "password": "wrong"}
+    )
+    assert response.status_code == 401
+
+
+def test_requests_need_a_valid_token(client):
+    assert client.get(f"{API}/chat/rooms").status_code == 401
+    response = client.get(
+        f"{API}/chat/rooms", headers={"Authorization": "Bearer not-a-token"}
+    )
+    assert response.status_code == 401
+
+
+def test_logout_revokes_token(client, register):
+    headers = register("alice@example.com")
+    assert client.post(f"{API}/logout", headers=headers).status_code == 200
+    assert client.get(f"{API}/chat/rooms", headers=headers).status_code == 401
+
+
+def test_create_join_and_list_rooms(client, register):
+    alice = register("alice@example.com", name="Alice")
+    bob = register("bob@example.com", name="Bob")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    assert room["name"] == "general"
+
+    assert client.post(f"{API}/chat/rooms/{room['id']}/join", headers=bob).status_code == 200
+    rooms = client.get(f"{API}/chat/rooms", headers=bob).json()
+    assert [r["name"] for r in rooms] == ["general"]
+
+    detail = client.get(f"{API}/chat/rooms/{room['id']}", headers=bob).json()
+    assert sorted(user["name"] for user in detail["users"]) == ["Alice", "Bob"]
+    assert detail["messages"] == []
+
+    assert client.get(f"{API}/chat/rooms/999", headers=bob).status_code == 404
+
+
+def test_post_message_requires_membership(client, register):
+    alice = register("alice@example.com")
+    mallory = register("mallory@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+
+    response = client.post(
+        f"{API}/chat/rooms/{room['id']}/messages", json={"text": "hi"}, headers=mallory
+    )
+    assert response.status_code == 403
+    response = client.get(f"{API}/chat/rooms/{room['id']}/messages", headers=mallory)
+    assert response.status_code == 403
+    response = client.post(
+        f"{API}/chat/rooms/999/messages", json={"text": "hi"}, headers=alice
+    )
+    assert response.status_code == 404
+
+
+def test_history_pages_newest_first(client, register):
+    alice = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    url = f"{API}/chat/rooms/{room['id']}/messages"
+    sent = []
+    for i in range(7):
+        response = client.post(url, json={"text": f"message {i}"}, headers=alice)
+        assert response.status_code == 200, response.text
+        sent.append(response.json()["id"])
+
+    seen = []
+    params = {"limit": 3}
+    while True:
+        response = client.get(url, params=params, headers=alice)
+        assert response.status_code == 200
+        seen.extend(message["id"] for message in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 3, "before": cursor}
+    assert seen == sent[::-1]
+
+
+def test_history_pages_forward_with_after(client, register):
+    alice = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    url = f"{API}/chat/rooms/{room['id']}/messages"
+    sent = [
+        client.post(url, json={"text": f"message {i}"}, headers=alice).json()["id"]
+        for i in range(5)
+    ]
+
+    oldest = client.get(url, params={"limit": 5}, headers=alice).headers["X-Next-Cursor"]
+    response = client.get(url, params={"limit": 2, "after": oldest}, headers=alice)
+    # The two messages after the oldest, still newest first
+    assert [message["id"] for message in response.json()] == [sent[2], sent[1]]
+    response = client.get(
+        url, params={"limit": 2, "after": response.headers["X-Next-Cursor"]}, headers=alice
+    )
+    assert [message["id"] for message in response.json()] == [sent[4], sent[3]]
+
+
+def test_history_rejects_bad_cursor(client, register):
+    alice = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    response = client.get(
+        f"{API}/chat/rooms/{room['id']}/messages", params={"before": "garbage"}, headers=alice
+    )
+    assert response.status_code == 400
+
+
+def test_room_detail_includes_newest_messages(client, register):
+    alice = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    for i in range(3):
+        client.post(
+            f"{API}/chat/rooms/{room['id']}/messages", json={"text": f"m{i}"}, headers=alice
+        )
+    detail = client.get(
+        f"{API}/chat/rooms/{room['id']}", params={"messages_limit": 2}, headers=alice
+    )
+    assert [message["text"] for message in detail.json()["messages"]] == ["m2", "m1"]
+    assert "X-Next-Cursor" in detail.headers
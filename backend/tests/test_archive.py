@@ -0,0 +1,63 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.core.archive import archive_messages, message_archive
+from app.core.db import engine
+from app.core.history import recent_messages
+from app.models import Messages
+from tests.conftest import API
+
+
+def seed(room_id, sender_id):
+    rows = [
+        {"id": i + 1, "text": f"message {i}", "sender_id": sender_id, "room_id": room_id,
+         "created_at": datetime(2025, month, day, 12)}
+        for i, (month, day) in enumerate(
+            (month, day) for month in (1, 2, 3, 4) for day in (10, 20)
+        )
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Messages), rows)
+    # Written behind the app's back, so the room's buffer is stale
+    recent_messages.evict(room_id)
+
+
+def page(client, headers, room_id, **params):
+    response = client.get(
+        f"{API}/chat/rooms/{room_id}/messages", params=params, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return [message["text"] for message in response.json()], response.headers.get("X-Next-Cursor")
+
+
+def test_history_pages_across_the_archive(client, register, tmp_path, monkeypatch):
+    headers = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=headers).json()
+    seed(room["id"], 1)
+    monkeypatch.setattr(message_archive, "root", str(tmp_path))
+    # January and February move to the archive
+    assert client.portal.call(archive_messages, datetime(2025, 3, 1)) == 4
+
+    texts, cursor = page(client, headers, room["id"], limit=3)
+    assert texts == ["message 7", "message 6", "message 5"]
+    texts, cursor = page(client, headers, room["id"], limit=3, before=cursor)
+    assert texts == ["message 4", "message 3", "message 2"]
+    texts, oldest = page(client, headers, room["id"], limit=3, before=cursor)
+    assert texts == ["message 1", "message 0"]
+
+    # Forward from the archive into the database
+    _, oldest = page(client, headers, room["id"], limit=8)
+    texts, cursor = page(client, headers, room["id"], limit=3, after=oldest)
+    assert texts == ["message 3", "message 2", "message 1"]
+    texts, cursor = page(client, headers, room["id"], limit=3, after=cursor)
+    assert texts == ["message 6", "message 5", "message 4"]
+
+    # Once the cursor is past the oldest row in the database the archive
+    # isn't consulted
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("archive read")
+
+    monkeypatch.setattr(message_archive, "get_after", unexpected)
+    texts, _ = page(client, headers, room["id"], limit=3, after=cursor)
+    assert texts == ["message 7"]
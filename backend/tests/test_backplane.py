@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from app.api.routes.websocket import ConnectionManager
+from app.core.backplane import RedisBackplane
+from app.core.history import recent_messages
+
+pytestmark = pytest.mark.anyio
+
+ROOM_ID = 1
+
+
+class FakeSocket:
+    def __init__(self):
+        self.events = []
+
+    async def send_text(self, data):
+        self.events.append(json.loads(data))
+
+    async def close(self, code=None):
+        pass
+
+
+async def wait_for(condition, timeout=3.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def nodes(database):
+    """Two managers, as two worker processes, sharing one Redis"""
+    server = fakeredis.FakeServer()
+    managers = [
+        ConnectionManager(RedisBackplane(fakeredis.FakeAsyncRedis(server=server)))
+        for _ in range(2)
+    ]
+    for manager in managers:
+        await manager.start()
+    yield managers
+    for manager in managers:
+        await manager.stop()
+
+
+async def connect(manager, user_id):
+    socket = FakeSocket()
+    sender = await manager.connect(socket, ROOM_ID, user_id, already_accepted=True)
+    return socket, sender
+
+
+async def test_broadcast_reaches_other_node(nodes):
+    first, second = nodes
+    alice, _ = await connect(first, 1)
+    bob, _ = await connect(second, 2)
+
+    await first.broadcast_to_room(ROOM_ID, {"type": "message", "text": "hello"})
+    await wait_for(lambda: bob.events)
+    assert bob.events == [{"type": "message", "text": "hello"}]
+    # Delivered locally once, not echoed back through Redis
+    await asyncio.sleep(0.1)
+    assert alice.events == [{"type": "message", "text": "hello"}]
+
+
+async def test_presence_spans_nodes(nodes):
+    first, second = nodes
+    _, alice = await connect(first, 1)
+    await connect(second, 2)
+    assert await first.get_connected_users(ROOM_ID) == [1, 2]
+    assert await second.get_connected_users(ROOM_ID) == [1, 2]
+
+    await first.disconnect(alice)
+    assert await second.get_connected_users(ROOM_ID) == [2]
+
+
+async def test_presence_survives_reconnect_on_same_node(nodes):
+    first, _ = nodes
+    _, old_tab = await connect(first, 1)
+    # A reload: the new connection arrives before the old one is gone
+    await connect(first, 1)
+    await first.disconnect(old_tab)
+    assert await first.get_connected_users(ROOM_ID) == [1]
+
+
+async def test_bad_frame_does_not_stop_listener(nodes):
+    first, second = nodes
+    await connect(first, 1)
+    bob, _ = await connect(second, 2)
+
+    # A buffered room makes the receiving node decode message frames
+    recent_messages.begin_warm(ROOM_ID)
+    recent_messages.finish_warm(ROOM_ID, [], complete=True)
+    try:
+        channel = f"chat:room:{ROOM_ID}"
+        await first.backplane.redis.publish(channel, "bogus")
+        await first.backplane.redis.publish(channel, f"other:{ROOM_ID}:message\nnot json")
+        await first.broadcast_to_room(ROOM_ID, {"type": "joined"})
+        await wait_for(lambda: bob.events)
+    finally:
+        recent_messages.evict(ROOM_ID)
+    assert bob.events == [{"type": "joined"}]
+    assert all(not task.done() for task in second.backplane._tasks)
@@ -0,0 +1,91 @@
+import json
+
+from app.core import ratelimit
+from app.core.config import settings
+from app.core.ratelimit import RateLimit
+from tests.conftest import API
+
+
+def create_room(client, headers):
+    return client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=headers).json()["id"]
+
+
+def history(client, headers, room_id):
+    response = client.get(f"{API}/chat/rooms/{room_id}/messages", headers=headers)
+    return [message["text"] for message in response.json()][::-1]
+
+
+def test_batch_accepts_a_json_array(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    response = client.post(
+        f"{API}/chat/rooms/{room_id}/messages/batch",
+        json=[{"text": "one"}, {"text": "two"}, {"text": "three"}],
+        headers=alice
+    )
+    assert response.status_code == 200, response.text
+    ids = response.json()["ids"]
+    assert len(ids) == 3 and ids == sorted(ids)
+    assert history(client, alice, room_id) == ["one", "two", "three"]
+
+
+def test_batch_accepts_ndjson(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    body = "\n".join(json.dumps({"text": text}) for text in ("one", "two")) + "\n\n"
+    response = client.post(
+        f"{API}/chat/rooms/{room_id}/messages/batch",
+        content=body,
+        headers={**alice, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200, response.text
+    assert history(client, alice, room_id) == ["one", "two"]
+
+
+def test_batch_rejects_oversized_and_invalid_bodies(client, register, monkeypatch):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    url = f"{API}/chat/rooms/{room_id}/messages/batch"
+    monkeypatch.setattr(settings, "MESSAGE_BATCH_MAX_SIZE", 2)
+
+    response = client.post(url, json=[{"text": "m"}] * 3, headers=alice)
+    assert response.status_code == 413
+    response = client.post(url, json=[{"text": "ok"}, {"body": "no text"}], headers=alice)
+    assert response.status_code == 422
+    assert client.post(url, json=[], headers=alice).status_code == 400
+    assert client.post(url, content="not json", headers=alice).status_code == 400
+    # Nothing from the rejected batches was stored
+    assert history(client, alice, room_id) == []
+
+
+def test_batch_takes_a_token_per_message(client, register, monkeypatch):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    url = f"{API}/chat/rooms/{room_id}/messages/batch"
+    monkeypatch.setattr(ratelimit, "batch_message_limit", RateLimit(rate=0.001, burst=5))
+
+    assert client.post(url, json=[{"text": "m"}] * 3, headers=alice).status_code == 200
+    response = client.post(url, json=[{"text": "m"}] * 3, headers=alice)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert client.post(url, json=[{"text": "m"}] * 2, headers=alice).status_code == 200
+
+
+def test_batch_is_broadcast_and_searchable(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    token = alice["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token}") as ws:
+        assert ws.receive_json()["type"] == "user_joined"
+        response = client.post(
+            f"{API}/chat/rooms/{room_id}/messages/batch",
+            json=[{"text": "deploying tonight"}, {"text": "rollback plan ready"}],
+            headers=alice
+        )
+        event = ws.receive_json()
+    assert event["type"] == "message_batch"
+    assert [message["id"] for message in event["messages"]] == response.json()["ids"]
+
+    results = client.get(f"{API}/chat/search", params={"q": "rollback"}, headers=alice).json()
+    assert [result["text"] for result in results] == ["rollback plan ready"]
@@ -0,0 +1,49 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.core.archive import archive_messages, message_archive
+from app.core.db import engine
+from app.models import Messages
+from tests.conftest import API
+
+
+def seed(room_id, sender_id):
+    rows = [
+        {"id": i + 1, "text": f"message {i}", "sender_id": sender_id, "room_id": room_id,
+         "created_at": datetime(2025, month, 15, 12)}
+        for i, month in enumerate((1, 2, 3, 4))
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(Messages), rows)
+
+
+def export(client, headers, room_id, **params):
+    response = client.get(f"{API}/chat/rooms/{room_id}/export", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return [json.loads(line)["text"] for line in response.text.splitlines()]
+
+
+def test_export_accepts_timezone_aware_bounds(client, register, tmp_path, monkeypatch):
+    headers = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=headers).json()
+    seed(room["id"], 1)
+    monkeypatch.setattr(message_archive, "root", str(tmp_path))
+    # January and February move to the archive, the rest stays in the
+    # database
+    archived = client.portal.call(archive_messages, datetime(2025, 3, 1))
+    assert archived == 2
+
+    texts = export(client, headers, room["id"])
+    assert texts == [f"message {i}" for i in range(4)]
+    texts = export(
+        client, headers, room["id"],
+        since="2025-02-01T00:00:00Z", until="2025-04-01T00:00:00+00:00"
+    )
+    assert texts == ["message 1", "message 2"]
+    # 2025-02-15T14:00+02:00 is 12:00 UTC, the second message's time
+    texts = export(client, headers, room["id"], since="2025-02-15T14:00:00+02:00")
+    assert texts == ["message 1", "message 2", "message 3"]
+    texts = export(client, headers, room["id"], until="2025-02-15T13:00:00")
+    assert texts == ["message 0", "message 1"]
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api.routes.websocket import ConnectionManager
+from app.core.backplane import InMemoryBackplane
+
+pytestmark = pytest.mark.anyio
+
+ROOM_ID = 1
+IDLE_TIMEOUT = 0.2
+ROUND = 0.05
+LIVE = 50
+DEAD = 50
+
+
+class ResponsiveSocket:
+    """Answers pings the way the receive loop would record a pong"""
+
+    def __init__(self):
+        self.sender = None
+        self.events = []
+
+    async def send_text(self, data):
+        event = json.loads(data)
+        if event["type"] == "ping":
+            self.sender.touch()
+        else:
+            self.events.append(event)
+
+    async def close(self, code=None):
+        pass
+
+
+class HalfOpenSocket(ResponsiveSocket):
+    """Accepts writes but never answers, like a peer that vanished"""
+
+    async def send_text(self, data):
+        pass
+
+
+class StalledSocket(ResponsiveSocket):
+    """Blocks on the first write, like a peer whose TCP window is full"""
+
+    async def send_text(self, data):
+        await asyncio.Event().wait()
+
+
+async def test_unresponsive_clients_are_reaped(database):
+    manager = ConnectionManager(InMemoryBackplane())
+    sockets = {}
+    for user_id in range(LIVE + DEAD):
+        if user_id < LIVE:
+            socket = ResponsiveSocket()
+        elif user_id % 2:
+            socket = HalfOpenSocket()
+        else:
+            socket = StalledSocket()
+        socket.sender = await manager.connect(
+            socket, ROOM_ID, user_id, already_accepted=True, user_name=f"user {user_id}"
+        )
+        sockets[user_id] = socket
+
+    for _ in range(int(IDLE_TIMEOUT / ROUND) + 3):
+        await asyncio.sleep(ROUND)
+        await manager.reap_stale(idle_timeout=IDLE_TIMEOUT)
+    # Let writers deliver the last round of frames
+    await asyncio.sleep(ROUND)
+
+    live = set(range(LIVE))
+    assert set(manager.get_local_users(ROOM_ID)) == live
+    assert set(await manager.get_connected_users(ROOM_ID)) == live
+    left = {
+        event["user_id"] for event in sockets[0].events if event["type"] == "user_left"
+    }
+    assert left == set(sockets) - live
+    assert manager.reaped == {"idle": DEAD, "closed": 0}
+    assert manager.pings_sent > 0
+
+    for user_id in live:
+        await manager.disconnect(sockets[user_id].sender)
+
+
+async def test_closed_connection_is_reaped_on_next_round(database):
+    manager = ConnectionManager(InMemoryBackplane())
+    socket = ResponsiveSocket()
+    socket.sender = await manager.connect(socket, ROOM_ID, 1, already_accepted=True)
+    # The writer hit an error, e.g. the peer reset the connection
+    socket.sender.closed = True
+
+    assert await manager.reap_stale(idle_timeout=60) == 1
+    assert manager.reaped == {"idle": 0, "closed": 1}
+    assert manager.get_local_users(ROOM_ID) == []
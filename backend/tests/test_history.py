@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from app.core.history import RecentMessages, message_key, recent_messages
+from tests.conftest import API
+
+
+def message(message_id, room_id=1, text="hello"):
+    return {
+        "id": message_id, "text": text, "sender_id": 1, "room_id": room_id,
+        "created_at": datetime(2025, 1, 1, 0, 0, message_id),
+    }
+
+
+def warm(buffer, room_id, messages, complete):
+    buffer.begin_warm(room_id)
+    buffer.finish_warm(room_id, messages, complete=complete)
+
+
+def ids(messages):
+    return None if messages is None else [m["id"] for m in messages]
+
+
+def test_buffer_keeps_the_newest_messages_per_room():
+    buffer = RecentMessages(per_room=3, max_rooms=10, max_bytes=10**6)
+    warm(buffer, 1, [message(1), message(2)], complete=True)
+    assert ids(buffer.get_before(1, 10)) == [2, 1]
+
+    for message_id in (3, 4, 5):
+        buffer.append(message(message_id))
+    assert ids(buffer.get_before(1, 3)) == [5, 4, 3]
+    # Messages 1 and 2 were evicted, so a page reaching past message 3 has
+    # to come from the database
+    assert buffer.get_before(1, 10) is None
+    assert buffer.get_before(1, 2, message_key(message(4))) is None
+    assert ids(buffer.get_before(1, 1, message_key(message(4)))) == [3]
+    assert ids(buffer.get_after(1, 10, message_key(message(3)))) == [4, 5]
+    assert buffer.get_after(1, 10, message_key(message(1))) is None
+
+
+def test_buffer_evicts_least_recently_used_rooms():
+    buffer = RecentMessages(per_room=3, max_rooms=2, max_bytes=10**6)
+    for room_id in (1, 2):
+        warm(buffer, room_id, [message(room_id, room_id)], complete=True)
+    buffer.get_before(1, 10)
+    warm(buffer, 3, [message(3, 3)], complete=True)
+    assert 1 in buffer and 3 in buffer
+    assert 2 not in buffer
+    assert buffer.evictions == 1
+    # Writes to an unbuffered room are dropped
+    buffer.append(message(4, 2))
+    assert 2 not in buffer
+
+
+def test_history_falls_back_to_the_database_past_the_buffer(client, register, monkeypatch):
+    monkeypatch.setattr(recent_messages, "per_room", 3)
+    alice = register("alice@example.com")
+    room = client.post(f"{API}/chat/rooms", json={"name": "general"}, headers=alice).json()
+    url = f"{API}/chat/rooms/{room['id']}/messages"
+    sent = [
+        client.post(url, json={"text": f"m{i}"}, headers=alice).json()["id"] for i in range(7)
+    ]
+
+    hits, misses = recent_messages.hits, recent_messages.misses
+    response = client.get(url, params={"limit": 3}, headers=alice)
+    assert [m["id"] for m in response.json()] == sent[:3:-1]
+    assert recent_messages.hits == hits + 1
+
+    response = client.get(
+        url, params={"limit": 3, "before": response.headers["X-Next-Cursor"]}, headers=alice
+    )
+    assert [m["id"] for m in response.json()] == sent[3:0:-1]
+    assert recent_messages.misses == misses + 1
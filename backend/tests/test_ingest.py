@@ -0,0 +1,87 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from app.core.ids import SnowflakeGenerator
+from sqlalchemy import select
+
+from app.core.ingest import MessageWriter
+from app.core.nodes import LocalNodeIdLease, RedisNodeIdLease
+from app.models import ChatRooms, Messages, Users
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_room(session_factory):
+    async with session_factory() as db:
+        db.add(Users(id=1, name="Alice", email="alice@example.com", password="x"))
+        db.add(ChatRooms(id=1, name="general"))
+        await db.commit()
+
+
+def test_message_timestamps_are_whole_seconds():
+    row = MessageWriter.build("hi", sender_id=1, room_id=1)
+    assert row["created_at"].microsecond == 0
+
+
+async def test_duplicate_id_only_fails_its_own_row(session_factory):
+    await seed_room(session_factory)
+    writer = MessageWriter(session_factory, flush_interval=0.05, retries=0)
+    writer.start()
+    rows = [MessageWriter.build(f"message {i}", 1, 1) for i in range(5)]
+    # Same ID as the first row, as two nodes sharing a node ID would assign
+    rows.append({**MessageWriter.build("duplicate", 1, 1), "id": rows[0]["id"]})
+    futures = [await writer.submit(row) for row in rows]
+    await writer.stop()
+
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    assert results[:5] == [row["id"] for row in rows[:5]]
+    assert isinstance(results[5], Exception)
+    assert writer.flushed_rows == 5
+    assert writer.failed_rows == 1
+    async with session_factory() as db:
+        stored = (await db.scalars(select(Messages.text))).all()
+    assert sorted(stored) == [f"message {i}" for i in range(5)]
+
+
+async def test_local_leases_are_unique(tmp_path):
+    leases = [LocalNodeIdLease(str(tmp_path)) for _ in range(3)]
+    generators = [SnowflakeGenerator(0) for _ in leases]
+    for lease, generator in zip(leases, generators):
+        await lease.start(generator)
+    assert sorted(generator.node_id for generator in generators) == [0, 1, 2]
+
+    # A released ID is handed out again
+    await leases[1].stop()
+    again = LocalNodeIdLease(str(tmp_path))
+    await again.start(SnowflakeGenerator(0))
+    assert again.node_id == 1
+    for lease in (leases[0], leases[2], again):
+        await lease.stop()
+
+
+async def test_redis_leases_are_unique_and_renewed():
+    server = fakeredis.FakeServer()
+    leases = [
+        RedisNodeIdLease(fakeredis.FakeAsyncRedis(server=server)) for _ in range(4)
+    ]
+    generators = [SnowflakeGenerator(0) for _ in leases]
+    for lease, generator in zip(leases, generators):
+        await lease.start(generator)
+    assert len({generator.node_id for generator in generators}) == 4
+
+    # Another process took over an expired lease: renewing moves us to a
+    # free ID instead of sharing it
+    lost = leases[0]
+    old_id = lost.node_id
+    await lost.redis.set(lost._key(old_id), "someone else")
+    await lost.renew()
+    assert lost.node_id != old_id
+    assert generators[0].node_id == lost.node_id
+    assert lost.node_id not in {generator.node_id for generator in generators[1:]}
+
+    for lease in leases:
+        await lease.stop()
+    # Only the lease we no longer own is left behind
+    assert await lost.redis.keys("chat:node-id:[0-9]*") == [lost._key(old_id).encode()]
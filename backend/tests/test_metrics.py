@@ -0,0 +1,66 @@
+import re
+
+from app.core.metrics import CallbackMetric, Counter, Gauge, Histogram, registry, render
+
+SAMPLE_SUFFIXES = {
+    "counter": ("",),
+    "gauge": ("",),
+    "histogram": ("_bucket", "_sum", "_count"),
+}
+
+
+def unregistered(*metrics):
+    for metric in metrics:
+        registry.remove(metric)
+    return metrics
+
+
+def test_counter_family_carries_total():
+    counter, callback = unregistered(
+        Counter("test_events", "Events", ("kind",)),
+        CallbackMetric("test_hits", "Hits", "counter", lambda: {(): 3}),
+    )
+    counter.labels("a").inc(2)
+    assert render([counter, callback]).splitlines() == [
+        "# HELP test_events_total Events",
+        "# TYPE test_events_total counter",
+        'test_events_total{kind="a"} 2',
+        "# HELP test_hits_total Hits",
+        "# TYPE test_hits_total counter",
+        "test_hits_total 3",
+    ]
+
+
+def test_gauge_and_histogram_names():
+    gauge, histogram = unregistered(
+        Gauge("test_queue", "Queue"),
+        Histogram("test_latency", "Latency", buckets=(0.1,)),
+    )
+    gauge.set(4)
+    histogram.observe(0.05)
+    assert render([gauge, histogram]).splitlines() == [
+        "# HELP test_queue Queue",
+        "# TYPE test_queue gauge",
+        "test_queue 4",
+        "# HELP test_latency Latency",
+        "# TYPE test_latency histogram",
+        'test_latency_bucket{le="0.1"} 1',
+        'test_latency_bucket{le="+Inf"} 1',
+        "test_latency_sum 0.05",
+        "test_latency_count 1",
+    ]
+
+
+def test_metrics_endpoint_samples_match_their_family(client, register):
+    register("alice@example.com")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+
+    family, kind = None, None
+    for line in response.text.splitlines():
+        match = re.match(r"# TYPE (\S+) (\S+)$", line)
+        if match:
+            family, kind = match.groups()
+        elif line and not line.startswith("#"):
+            name = re.match(r"[a-zA-Z_:][a-zA-Z0-9_:]*", line).group()
+            assert name in {family + suffix for suffix in SAMPLE_SUFFIXES[kind]}, line
@@ -0,0 +1,57 @@
+import fakeredis
+import pytest
+
+from app.core import ratelimit
+from app.core.ratelimit import InMemoryRateLimiter, RateLimit, RedisRateLimiter
+
+pytestmark = pytest.mark.anyio
+
+USER = RateLimit(rate=0.001, burst=5)
+ROOM = RateLimit(rate=0.001, burst=1)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request):
+    if request.param == "redis":
+        return RedisRateLimiter(fakeredis.FakeAsyncRedis())
+    return InMemoryRateLimiter()
+
+
+async def test_rejection_takes_no_tokens(limiter):
+    buckets = [("user:42", USER), ("room:1", ROOM)]
+    assert await limiter.acquire_all(buckets) == 0
+    # The room is empty now; retrying must not spend the user's tokens
+    for _ in range(20):
+        assert await limiter.acquire_all(buckets) > 0
+    for room_id in range(2, 6):
+        assert await limiter.acquire_all([("user:42", USER), (f"room:{room_id}", ROOM)]) == 0
+    assert await limiter.acquire("user:42", USER) > 0
+
+
+async def test_wait_is_the_longest_of_the_empty_buckets(limiter):
+    slow = RateLimit(rate=0.5, burst=1)
+    fast = RateLimit(rate=10, burst=1)
+    await limiter.acquire_all([("a", slow), ("b", fast)])
+    wait = await limiter.acquire_all([("a", slow), ("b", fast)])
+    assert 1.5 < wait <= 2
+
+
+async def test_room_limited_user_can_post_elsewhere(monkeypatch):
+    monkeypatch.setattr(ratelimit, "rate_limiter", InMemoryRateLimiter())
+    monkeypatch.setattr(ratelimit, "user_message_limit", USER)
+    monkeypatch.setattr(ratelimit, "room_message_limit", ROOM)
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT_ENABLED", True)
+
+    assert await ratelimit.message_rate_wait(42, 1) == 0
+    for _ in range(20):
+        assert await ratelimit.message_rate_wait(42, 1) > 0
+    assert await ratelimit.message_rate_wait(42, 2) == 0
+
+
+async def test_cost_takes_several_tokens_or_none(limiter):
+    limit = RateLimit(rate=0.001, burst=10)
+    assert await limiter.acquire("batch:42", limit, 6) == 0
+    # Four tokens left, not enough for another six
+    assert await limiter.acquire("batch:42", limit, 6) > 0
+    assert await limiter.acquire("batch:42", limit, 4) == 0
+    assert await limiter.acquire("batch:42", limit) > 0
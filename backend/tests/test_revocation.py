@@ -0,0 +1,82 @@
+import random
+from unittest import mock
+
+import pytest
+
+from app.core.revocation import InMemoryRevocationStore
+
+pytestmark = pytest.mark.anyio
+
+HOUR = 3600
+NOW = 1_700_000_000.0
+TOKENS = 1_000_000
+
+
+class Clock:
+    """Stands in for time.time() inside the revocation store"""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    clock = Clock(NOW)
+    with mock.patch("app.core.revocation.time.time", clock):
+        yield clock
+
+
+async def test_million_tokens_purge_in_expiry_order(clock):
+    rng = random.Random(1)
+    store = InMemoryRevocationStore()
+    expiry = [NOW + rng.uniform(60, 24 * HOUR) for _ in range(TOKENS)]
+    for i, expires_at in enumerate(expiry):
+        await store.revoke(f"jti-{i}", expires_at)
+    assert len(store) == TOKENS
+
+    sample = rng.sample(range(TOKENS), 1000)
+    for hours in (1, 6, 12, 25):
+        clock.now = NOW + hours * HOUR
+        # Any lookup purges what expired since the last one
+        await store.is_revoked("missing")
+        assert len(store) == sum(1 for e in expiry if e > clock.now)
+        for i in sample:
+            assert await store.is_revoked(f"jti-{i}") == (expiry[i] > clock.now)
+    assert len(store) == 0
+
+
+async def test_rerevoking_extends_but_never_shortens(clock):
+    store = InMemoryRevocationStore()
+    await store.revoke("token", NOW + 10)
+    await store.revoke("token", NOW + 100)
+    await store.revoke("token", NOW + 50)
+
+    # Purging the first heap entry must not drop the extended revocation
+    clock.now = NOW + 60
+    assert await store.is_revoked("token")
+    assert len(store) == 1
+    clock.now = NOW + 100
+    assert not await store.is_revoked("token")
+    assert len(store) == 0
+
+
+async def test_lookup_after_purge(clock):
+    store = InMemoryRevocationStore()
+    await store.revoke("short", NOW + 10)
+    await store.revoke("long", NOW + HOUR)
+
+    clock.now = NOW + 20
+    assert not await store.is_revoked("short")
+    assert await store.is_revoked("long")
+    assert len(store) == 1
+
+    # A purged token can be revoked again while it is still valid...
+    await store.revoke("short", NOW + 2 * HOUR)
+    assert await store.is_revoked("short")
+    # ...but revoking one that has already expired is a no-op
+    await store.revoke("expired", NOW + 5)
+    assert not await store.is_revoked("expired")
+    assert len(store) == 2
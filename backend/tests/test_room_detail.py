@@ -0,0 +1,75 @@
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, insert
+
+from app.core.db import async_engine, engine
+from app.models import ChatRooms, Messages, RoomUsers
+from tests.conftest import API
+
+BIG_ROOM = 100_000
+
+
+def seed_messages(room_id, count, sender_id):
+    start = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Messages), [
+            {
+                "id": room_id * 1_000_000 + i,
+                "text": f"message {i}",
+                "sender_id": sender_id,
+                "room_id": room_id,
+                "created_at": start + timedelta(seconds=i),
+            }
+            for i in range(count)
+        ])
+
+
+def make_room(room_id, members):
+    with engine.begin() as conn:
+        conn.execute(insert(ChatRooms), [{"id": room_id, "name": f"room {room_id}"}])
+        conn.execute(insert(RoomUsers), [
+            {"room_id": room_id, "user_id": user_id} for user_id in members
+        ])
+
+
+def get_room(client, headers, room_id):
+    """The room detail response and the SQL statements it ran"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        response = client.get(f"{API}/chat/rooms/{room_id}", headers=headers)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert response.status_code == 200, response.text
+    return response, statements
+
+
+def test_room_detail_cost_does_not_grow_with_history(client, register):
+    headers = register("alice@example.com")
+    make_room(1, [1])
+    make_room(2, [1])
+    seed_messages(1, 10, 1)
+    seed_messages(2, BIG_ROOM, 1)
+    # Resolve and cache the user first so both requests start alike
+    client.get(f"{API}/chat/rooms", headers=headers)
+
+    _, small = get_room(client, headers, 1)
+    tracemalloc.start()
+    try:
+        response, big = get_room(client, headers, 2)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Room, members and one bounded page of messages, however long the
+    # history
+    assert len(big) == len(small) == 3
+    assert len(response.json()["messages"]) == 50
+    assert response.json()["messages"][0]["text"] == f"message {BIG_ROOM - 1}"
+    # Loading every message would take well over 50MB, a page is ~200KB
+    assert peak < 2 * 2**20, peak
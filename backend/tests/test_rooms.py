@@ -0,0 +1,71 @@
+from app.core.rooms import etag_matches
+from tests.conftest import API
+
+URL = f"{API}/chat/rooms"
+
+
+def create_rooms(client, headers, *names):
+    for name in names:
+        response = client.post(URL, json={"name": name}, headers=headers)
+        assert response.status_code == 200, response.text
+
+
+def test_listing_pages_by_name(client, register):
+    alice = register("alice@example.com")
+    create_rooms(client, alice, "delta", "alpha", "echo", "charlie", "bravo")
+
+    names = []
+    params = {"limit": 2}
+    while True:
+        response = client.get(URL, params=params, headers=alice)
+        assert response.status_code == 200
+        names.extend(room["name"] for room in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["after"] = cursor
+    assert names == ["alpha", "bravo", "charlie", "delta", "echo"]
+
+
+def test_listing_filters_by_literal_prefix(client, register):
+    alice = register("alice@example.com")
+    create_rooms(client, alice, "dev", "dev_ops", "devices", "design")
+
+    response = client.get(URL, params={"prefix": "dev"}, headers=alice)
+    assert [room["name"] for room in response.json()] == ["dev", "dev_ops", "devices"]
+    # _ is not a wildcard
+    response = client.get(URL, params={"prefix": "dev_"}, headers=alice)
+    assert [room["name"] for room in response.json()] == ["dev_ops"]
+
+
+def test_listing_answers_304_until_a_room_is_created(client, register):
+    alice = register("alice@example.com")
+    create_rooms(client, alice, "general")
+
+    response = client.get(URL, headers=alice)
+    etag = response.headers["ETag"]
+    response = client.get(URL, headers={**alice, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    create_rooms(client, alice, "random")
+    response = client.get(URL, headers={**alice, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [room["name"] for room in response.json()] == ["general", "random"]
+
+
+def test_listing_rejects_bad_cursor(client, register):
+    alice = register("alice@example.com")
+    response = client.get(URL, params={"after": "garbage"}, headers=alice)
+    assert response.status_code == 400
+
+
+def test_etag_matching_is_weak():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"xyz", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"xyz"', '"abc"')
+    assert not etag_matches(None, '"abc"')
@@ -0,0 +1,44 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+
+SCRIPTS = Path(__file__).resolve().parent.parent / "scripts"
+
+TINY_ARGS = {
+    "bench_archive.py": ["--messages", "200", "--rooms", "4", "--months", "3", "--keep", "1", "--repeat", "1"],
+    "bench_auth_cache.py": ["--seconds", "0.2", "--concurrency", "2"],
+    "bench_broadcast.py": ["--members", "20", "--rounds", "2"],
+    "bench_connection_registry.py": ["--sizes", "50"],
+    "bench_event_loop_lag.py": ["--requests", "5", "--rows", "50"],
+    "bench_export.py": ["--rows", "100"],
+    "bench_history_pagination.py": ["--rows", "200", "--repeat", "1"],
+    "bench_login_storm.py": ["--logins", "2", "--seconds", "0.2"],
+    "bench_message_batch.py": ["--messages", "20", "--sequential", "5"],
+    "bench_metrics_overhead.py": ["--iterations", "200"],
+    "bench_ratelimit.py": ["--checks", "200", "--keys", "20"],
+    "bench_revocation.py": ["--tokens", "200"],
+    "bench_room_listing.py": ["--rooms", "200", "--repeat", "1"],
+    "bench_search.py": ["--messages", "500", "--rooms", "10", "--member-of", "3", "--repeat", "1"],
+    "bench_serialization.py": ["--repeat", "1"],
+    "bench_wire_protocol.py": ["--frames", "50", "--repeat", "1"],
+    "bench_ws_multiplex.py": ["--users", "20", "--rooms-per-user", "3"],
+}
+
+
+def test_every_benchmark_has_tiny_arguments():
+    assert sorted(path.name for path in SCRIPTS.glob("bench_*.py")) == sorted(TINY_ARGS)
+
+
+@pytest.mark.parametrize("script", sorted(TINY_ARGS))
+def test_benchmark_runs(script, tmp_path):
+    result = subprocess.run(
+        [sys.executable, str(SCRIPTS / script), *TINY_ARGS[script]],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,180 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert
+
+from app.core.archive import archive_messages, message_archive
+from app.core.db import engine
+from app.core.search import InMemorySearch, Postings, query_terms, search_backend, tokenize
+from app.models import Messages
+from tests.conftest import API
+
+
+def build_index(*messages, filler=10):
+    """An index of (room_id, text) messages with IDs from 1, plus filler
+    messages in room 0 so the terms under test are rare"""
+    index = InMemorySearch()
+    for message_id, (room_id, text) in enumerate(messages, start=1):
+        index.add(message_id, room_id, text)
+    for offset in range(filler):
+        index.add(1000 + offset, 0, "lunch plans")
+    return index
+
+
+def test_tokenize_drops_stopwords_and_short_words():
+    assert tokenize("The cat is on a MAT, ok?") == ["cat", "mat"]
+    assert query_terms("cat mat Cat") == ["cat", "mat"]
+    assert query_terms("is it ok") == []
+
+
+def test_postings_accept_out_of_order_ids():
+    postings = Postings()
+    for message_id, count in ((5, 1), (1, 2), (3, 300), (9, 1), (7, 4)):
+        postings.add(message_id, 1, count)
+    assert list(postings.ids) == [1, 3, 5, 7, 9]
+    assert [postings.count(i) for i in (1, 3, 5, 7, 9)] == [2, 255, 1, 4, 1]
+    assert postings.count(4) == 0
+    assert postings.count(10) == 0
+
+
+@pytest.mark.anyio
+async def test_more_occurrences_rank_higher():
+    index = build_index((1, "deploy"), (1, "deploy deploy deploy"), (1, "deploy again"))
+    hits = await index.search(None, ["deploy"], [1], 10)
+    assert [hit.id for hit in hits] == [2, 3, 1]
+    assert hits[0].score > hits[1].score
+
+
+@pytest.mark.anyio
+async def test_rarer_terms_weigh_more():
+    index = build_index(
+        (1, "rollback rollback server"),
+        (1, "rollback server server"),
+        (1, "server"),
+        (1, "server"),
+        (1, "server"),
+    )
+    hits = await index.search(None, ["rollback", "server"], [1], 10)
+    assert [hit.id for hit in hits] == [1, 2]
+
+
+@pytest.mark.anyio
+async def test_every_term_must_match_in_the_given_rooms():
+    index = build_index(
+        (1, "release notes"),
+        (1, "release"),
+        (2, "release notes"),
+        (1, "notes"),
+    )
+    hits = await index.search(None, ["release", "notes"], [1], 10)
+    assert [hit.id for hit in hits] == [1]
+    hits = await index.search(None, ["release", "notes"], [1, 2], 10)
+    assert sorted(hit.id for hit in hits) == [1, 3]
+    assert await index.search(None, ["release", "missing"], [1, 2], 10) == []
+    assert await index.search(None, [], [1, 2], 10) == []
+
+
+@pytest.mark.anyio
+async def test_pages_continue_after_the_cursor_without_duplicates():
+    # Ties on score are broken by ID, newest first
+    index = build_index(*[(1, "standup" + " standup" * (i % 3)) for i in range(11)])
+    seen = []
+    after = None
+    while True:
+        hits = await index.search(None, ["standup"], [1], 4, after)
+        seen.extend(hits)
+        if len(hits) < 4:
+            break
+        after = hits[-1].key
+    assert sorted(hit.id for hit in seen) == list(range(1, 12))
+    assert [hit.key for hit in seen] == sorted((hit.key for hit in seen), reverse=True)
+
+
+def create_room(client, headers, name):
+    return client.post(f"{API}/chat/rooms", json={"name": name}, headers=headers).json()["id"]
+
+
+def post(client, headers, room_id, text):
+    response = client.post(
+        f"{API}/chat/rooms/{room_id}/messages", json={"text": text}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def search(client, headers, **params):
+    response = client.get(f"{API}/chat/search", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_search_only_covers_the_users_rooms(client, register):
+    alice = register("alice@example.com")
+    bob = register("bob@example.com")
+    shared = create_room(client, alice, "shared")
+    client.post(f"{API}/chat/rooms/{shared}/join", headers=bob)
+    private = create_room(client, bob, "private")
+    in_shared = post(client, alice, shared, "quarterly budget")
+    post(client, bob, private, "quarterly budget secrets")
+
+    results = search(client, alice, q="quarterly budget").json()
+    assert [result["id"] for result in results] == [in_shared]
+    assert results[0]["sender_name"] == "Test User"
+    assert len(search(client, bob, q="budget").json()) == 2
+    # Stopwords and short words are ignored, not required
+    assert len(search(client, alice, q="the budget is").json()) == 1
+    assert search(client, alice, q="is it").json() == []
+
+
+def test_search_room_filter_checks_access(client, register):
+    alice = register("alice@example.com")
+    bob = register("bob@example.com")
+    room_id = create_room(client, alice, "general")
+    post(client, alice, room_id, "welcome aboard")
+
+    response = client.get(
+        f"{API}/chat/search", params={"q": "welcome", "room_id": room_id}, headers=bob
+    )
+    assert response.status_code == 403
+    response = client.get(
+        f"{API}/chat/search", params={"q": "welcome", "room_id": 999}, headers=alice
+    )
+    assert response.status_code == 404
+    assert len(search(client, alice, q="welcome", room_id=room_id).json()) == 1
+
+
+def test_search_pages_with_the_next_cursor(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice, "general")
+    sent = {post(client, alice, room_id, f"incident {i}") for i in range(5)}
+
+    seen = []
+    params = {"q": "incident", "limit": 2}
+    while True:
+        response = search(client, alice, **params)
+        seen.extend(result["id"] for result in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["after"] = cursor
+    assert sorted(seen) == sorted(sent)
+    assert len(seen) == len(sent)
+
+
+def test_search_hides_archived_messages(client, register, tmp_path, monkeypatch):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice, "general")
+    with engine.begin() as conn:
+        conn.execute(insert(Messages), [
+            {"id": 1, "text": "migration started", "sender_id": 1, "room_id": room_id,
+             "created_at": datetime(2025, 1, 15)},
+            {"id": 2, "text": "migration finished", "sender_id": 1, "room_id": room_id,
+             "created_at": datetime(2025, 4, 15)},
+        ])
+    client.portal.call(search_backend.start)
+    assert len(search(client, alice, q="migration").json()) == 2
+
+    monkeypatch.setattr(message_archive, "root", str(tmp_path))
+    assert client.portal.call(archive_messages, datetime(2025, 3, 1)) == 1
+    results = search(client, alice, q="migration").json()
+    assert [result["text"] for result in results] == ["migration finished"]
@@ -0,0 +1,136 @@
+from datetime import datetime, timezone
+
+from app.api.routes import websocket
+from app.utils import decode_msgpack, encode_msgpack
+from tests.conftest import API
+
+
+def token(headers):
+    return headers["Authorization"].split()[1]
+
+
+def create_room(client, headers, name="general"):
+    return client.post(f"{API}/chat/rooms", json={"name": name}, headers=headers).json()["id"]
+
+
+def test_replay_sends_missed_messages(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+    url = f"{API}/chat/rooms/{room_id}/messages"
+    sent = [
+        client.post(url, json={"text": f"m{i}"}, headers=alice).json()["id"] for i in range(3)
+    ]
+
+    with client.websocket_connect(
+        f"/ws/{room_id}?token={token(alice)}&last_seen_id={sent[0]}"
+    ) as ws:
+        replay = ws.receive_json()
+        assert replay["type"] == "replay"
+        assert [message["id"] for message in replay["messages"]] == sent[1:]
+        assert replay["truncated"] is False
+        assert ws.receive_json()["type"] == "user_joined"
+
+
+def test_bad_last_seen_id_is_reported_not_treated_as_missing_token(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    with client.websocket_connect(f"/ws/{room_id}?token={token(alice)}&last_seen_id=abc") as ws:
+        error = ws.receive_json()
+        assert error["type"] == "error"
+        assert error["code"] == "bad_request"
+        assert ws.receive_json()["type"] == "user_joined"
+
+
+def test_failed_replay_tells_the_client_to_resync(client, register, monkeypatch):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    async def broken(*args, **kwargs):
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr(websocket, "load_missed", broken)
+    with client.websocket_connect(f"/ws/{room_id}?token={token(alice)}&last_seen_id=1") as ws:
+        replay = ws.receive_json()
+        assert replay["type"] == "replay"
+        assert replay["messages"] == []
+        assert replay["truncated"] is True
+        assert ws.receive_json()["type"] == "user_joined"
+
+
+def test_multiplexed_connection_validates_frames(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    with client.websocket_connect(f"/ws?token={token(alice)}") as ws:
+        assert ws.receive_json()["type"] == "connected"
+
+        ws.send_json([1, 2])
+        assert ws.receive_json()["code"] == "bad_request"
+        ws.send_json({"room_id": room_id})
+        assert ws.receive_json()["error"] == "Unknown frame type: None"
+        ws.send_json({"type": "shout"})
+        assert ws.receive_json()["error"] == "Unknown frame type: shout"
+        ws.send_json({"type": "subscribe", "room_id": "general"})
+        assert ws.receive_json()["error"] == "room_id must be an integer"
+        ws.send_json({"type": "message", "room_id": room_id, "text": "hi"})
+        assert ws.receive_json()["code"] == "not_subscribed"
+
+        # Still connected after all of that
+        ws.send_json({"type": "subscribe", "room_id": room_id})
+        assert ws.receive_json() == {"type": "subscribed", "room_id": room_id}
+        assert ws.receive_json()["type"] == "user_joined"
+        ws.send_json({"type": "message", "room_id": room_id, "text": "hi"})
+        message = ws.receive_json()
+        assert (message["type"], message["room_id"], message["text"]) == ("message", room_id, "hi")
+
+
+def receive_msgpack(ws):
+    return decode_msgpack(ws.receive_bytes())
+
+
+def test_msgpack_is_negotiated_with_a_subprotocol(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    with client.websocket_connect(
+        f"/ws/{room_id}?token={token(alice)}", subprotocols=["chat.msgpack", "chat.json"]
+    ) as ws:
+        assert ws.accepted_subprotocol == "chat.msgpack"
+        assert receive_msgpack(ws)["type"] == "user_joined"
+        ws.send_bytes(encode_msgpack({"text": "packed"}))
+        event = receive_msgpack(ws)
+
+    assert event["text"] == "packed"
+    stored = client.get(f"{API}/chat/rooms/{room_id}/messages", headers=alice).json()[0]
+    created_at = datetime.fromisoformat(stored["created_at"]).replace(tzinfo=timezone.utc)
+    assert event["created_at"] == int(created_at.timestamp() * 1000)
+
+
+def test_msgpack_can_be_requested_in_the_query_string(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    with client.websocket_connect(f"/ws?token={token(alice)}&format=msgpack") as ws:
+        assert ws.accepted_subprotocol is None
+        assert receive_msgpack(ws)["type"] == "connected"
+        ws.send_bytes(encode_msgpack({"type": "subscribe", "room_id": room_id}))
+        assert receive_msgpack(ws) == {"type": "subscribed", "room_id": room_id}
+        assert receive_msgpack(ws)["type"] == "user_joined"
+        ws.send_bytes(encode_msgpack({"type": "message", "room_id": room_id, "text": "hi"}))
+        event = receive_msgpack(ws)
+    assert event["text"] == "hi"
+    assert isinstance(event["created_at"], int)
+
+
+def test_json_stays_the_default(client, register):
+    alice = register("alice@example.com")
+    room_id = create_room(client, alice)
+
+    with client.websocket_connect(
+        f"/ws/{room_id}?token={token(alice)}", subprotocols=["chat.json"]
+    ) as ws:
+        assert ws.accepted_subprotocol == "chat.json"
+        assert ws.receive_json()["type"] == "user_joined"
+        ws.send_json({"text": "plain"})
+        assert isinstance(ws.receive_json()["created_at"], str)